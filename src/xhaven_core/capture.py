@@ -0,0 +1,258 @@
+"""
+Continuous microphone capture with pre-roll.
+
+speech_recognition opens the microphone for every phrase and only starts
+keeping audio once the energy is above the threshold, so the first word is
+often clipped. ContinuousCapture keeps the microphone open and writes all
+audio into a preallocated NumPy ring buffer. When speech starts, the phrase
+begins pre_roll seconds before the first loud chunk.
+
+Phrases are handed out as Segments with a copy of their samples, so a phrase
+stays intact when recognition falls behind and the ring buffer wraps around.
+The samples are copied once per segment, when it is queued. Resampling and
+normalization for the recognizer are done once per segment with vectorized
+NumPy operations.
+
+Requires numpy and PyAudio, install with pip install .[speech]
+"""
+
+import logging
+import queue
+import threading
+from typing import NamedTuple
+
+import numpy
+
+# Sample rate the recognizers expect
+TARGET_RATE = 16000
+
+
+def normalize(samples, sample_rate: int, target_rate: int = TARGET_RATE):
+    """Return 16-bit samples as float32 in [-1, 1] resampled to target_rate."""
+    audio = numpy.frombuffer(samples, dtype=numpy.int16)
+    audio = audio.astype(numpy.float32) * (1.0 / 32768.0)
+    if sample_rate != target_rate:
+        count = int(len(audio) * target_rate / sample_rate)
+        positions = numpy.linspace(0, len(audio) - 1, count, dtype=numpy.float32)
+        audio = numpy.interp(positions, numpy.arange(len(audio)), audio).astype(
+            numpy.float32
+        )
+    return audio
+
+
+class RingBuffer:
+    """Preallocated ring buffer of 16-bit samples.
+
+    Positions are absolute sample counts since the start of the capture, so
+    a position stays valid until the buffer has wrapped around past it.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.samples = numpy.zeros(capacity, dtype=numpy.int16)
+        self.total = 0
+
+    def write(self, data) -> None:
+        samples = numpy.frombuffer(data, dtype=numpy.int16)
+        if len(samples) > self.capacity:
+            # Only the newest samples fit, the positions still count them all
+            self.total += len(samples) - self.capacity
+            samples = samples[-self.capacity :]
+        start = self.total % self.capacity
+        end = start + len(samples)
+        if end <= self.capacity:
+            self.samples[start:end] = samples
+        else:
+            split = self.capacity - start
+            self.samples[start:] = samples[:split]
+            self.samples[: end - self.capacity] = samples[split:]
+        self.total += len(samples)
+
+    def oldest(self) -> int:
+        """Return the position of the oldest sample still in the buffer."""
+        return max(0, self.total - self.capacity)
+
+    def view(self, start: int, end: int):
+        """Return the samples from start to end.
+
+        The result is a view of the buffer unless the range wraps around the
+        end of the buffer, then the two parts are joined into a new array.
+        """
+        start = max(start, self.oldest())
+        if end - start <= 0:
+            return self.samples[:0]
+        first = start % self.capacity
+        last = first + (end - start)
+        if last <= self.capacity:
+            return self.samples[first:last]
+        return numpy.concatenate(
+            (self.samples[first:], self.samples[: last - self.capacity])
+        )
+
+    def read(self, start: int, end: int):
+        """Return a copy of the samples from start to end, see view."""
+        samples = self.view(start, end)
+        if samples.base is self.samples:
+            return samples.copy()
+        return samples
+
+
+class Segment(NamedTuple):
+    """A phrase from the ring buffer, samples is a copy that stays valid.
+
+    final is False for the part of a phrase that is still being spoken.
+    """
+
+    start: int
+    end: int
+    sample_rate: int
+    samples: numpy.ndarray
+    final: bool = True
+
+    @property
+    def frame_data(self) -> memoryview:
+        return memoryview(numpy.ascontiguousarray(self.samples)).cast("B")
+
+    @property
+    def sample_width(self) -> int:
+        return 2
+
+    def normalized(self, target_rate: int = TARGET_RATE):
+        return normalize(self.samples, self.sample_rate, target_rate)
+
+
+class ContinuousCapture:
+    """Capture a microphone continuously and split the audio into phrases.
+
+    A phrase starts when a chunk is louder than the energy threshold and ends
+    after pause seconds of quiet chunks. The threshold follows the noise level
+    like speech_recognition's dynamic energy threshold.
+
+    With partial_interval the phrase so far is also handed out every
+    partial_interval seconds while it is spoken, as a Segment with final
+    False, see speculation.py.
+    """
+
+    def __init__(
+        self,
+        device_index=None,
+        sample_rate: int = 16000,
+        chunk_size: int = 1024,
+        pre_roll: float = 0.5,
+        pause: float = 0.8,
+        max_phrase: float = 15.0,
+        buffer_seconds: float = 30.0,
+        energy_threshold: float = 300.0,
+        partial_interval: float = None,
+    ) -> None:
+        self.logger = logging.getLogger("xhaven_core.capture")
+        self.device_index = device_index
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.pre_roll = int(pre_roll * sample_rate)
+        self.pause = int(pause * sample_rate)
+        self.max_phrase = int(max_phrase * sample_rate)
+        self.energy_threshold = energy_threshold
+        self.partial_interval = (
+            int(partial_interval * sample_rate) if partial_interval else None
+        )
+        self.ring = RingBuffer(int(buffer_seconds * sample_rate))
+        self.segments = queue.Queue()
+
+        # Phrase detection state, only used by the capture thread
+        self.phrase_start = None
+        self.last_loud = 0
+        self.last_partial = 0
+
+        self.is_running = False
+        self.thread = None
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+        self.is_running = True
+        self.thread = threading.Thread(target=self._capture, daemon=True)
+        self.thread.start()
+
+    def _capture(self) -> None:
+        import speech_recognition as sr
+
+        pyaudio = sr.Microphone.get_pyaudio()
+        audio = pyaudio.PyAudio()
+        try:
+            stream = audio.open(
+                input_device_index=self.device_index,
+                channels=1,
+                format=pyaudio.paInt16,
+                rate=self.sample_rate,
+                frames_per_buffer=self.chunk_size,
+                input=True,
+            )
+            try:
+                while self.is_running:
+                    self.feed(stream.read(self.chunk_size, exception_on_overflow=False))
+            finally:
+                stream.close()
+        except OSError as error:
+            self.logger.error(
+                "Could not capture device %s: %s", self.device_index, error
+            )
+        finally:
+            audio.terminate()
+            self.is_running = False
+            self.segments.put(None)
+
+    def feed(self, data) -> None:
+        """Add a chunk of audio and detect the start and end of phrases."""
+        chunk = numpy.frombuffer(data, dtype=numpy.int16)
+        self.ring.write(chunk)
+        energy = float(numpy.sqrt(numpy.mean(chunk.astype(numpy.float32) ** 2)))
+        end = self.ring.total
+
+        if energy > self.energy_threshold:
+            self.last_loud = end
+            if self.phrase_start is None:
+                self.phrase_start = max(end - len(chunk) - self.pre_roll, 0)
+                self.last_partial = end
+        elif self.phrase_start is None:
+            # Follow the noise level while nobody is speaking
+            self.energy_threshold = max(
+                self.energy_threshold * 0.95 + energy * 1.5 * 0.05, 50.0
+            )
+
+        if self.phrase_start is not None and (
+            end - self.last_loud >= self.pause
+            or end - self.phrase_start >= self.max_phrase
+        ):
+            self.segments.put(
+                Segment(
+                    self.phrase_start,
+                    end,
+                    self.sample_rate,
+                    self.ring.read(self.phrase_start, end),
+                )
+            )
+            self.phrase_start = None
+        elif (
+            self.phrase_start is not None
+            and self.partial_interval
+            and end - self.last_partial >= self.partial_interval
+        ):
+            self.segments.put(
+                Segment(
+                    self.phrase_start,
+                    end,
+                    self.sample_rate,
+                    self.ring.read(self.phrase_start, end),
+                    False,
+                )
+            )
+            self.last_partial = end
+
+    def next_segment(self, timeout: float = None):
+        """Return the next phrase, or None when the capture has stopped."""
+        return self.segments.get(timeout=timeout)
+
+    def close(self) -> None:
+        self.is_running = False
+        self.segments.put(None)
@@ -1,7 +1,29 @@
 import logging
-import logging.handlers
+import queue
 import socket
 import threading
+import time
+
+from .heartbeat import Heartbeat
+from .recorder import INBOUND, OUTBOUND, SessionRecorder
+from .validation import FrameError, Quarantine, shorten
+
+# End of every frame
+EOM = b"[EOM]"
+INDEX_PREFIX = b"S3nD:Index:"
+
+
+def frame_index(data):
+    """Return the index of a GameState frame, or None for other frames."""
+    if not data.startswith(INDEX_PREFIX):
+        return None
+    end = data.find(b"Description:", len(INDEX_PREFIX))
+    if end == -1:
+        return None
+    try:
+        return int(data[len(INDEX_PREFIX) : end])
+    except ValueError:
+        return None
 
 
 class ClientNetwork:
@@ -28,6 +50,25 @@ class ClientNetwork:
         self.is_running = False
         self.lock = threading.Lock()
 
+        # Optional session recorder, see start_recording
+        self.recorder = None
+
+        # Optional file for rejected frames, see start_quarantine
+        self.quarantine = None
+
+        # Counters for monitoring
+        self.frames_received = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frames_accepted = 0
+        # Counted by both the reader and the decoder thread
+        self.frames_rejected = 0
+        self.counter_lock = threading.Lock()
+        self.gamestates = queue.Queue()
+
+        # Ping, pong and echo latencies and the stall alarm, see heartbeat.py
+        self.heartbeat = Heartbeat()
+
         # Provide a reference to the gamestate class
         self.gamestate_class = GameState
 
@@ -37,45 +78,120 @@ class ClientNetwork:
         self.is_running = True
         self.logger.info("Connected to server at %s:%s", self.host, self.port)
 
+        # The reader thread only splits frames and answers pings, gamestates
+        # are decoded by the decoder thread so a big gamestate does not delay
+        # reading the socket
+        self.gamestates = queue.Queue()
+        threading.Thread(target=self.decode_gamestates, daemon=True).start()
+
+        self.heartbeat.reset()
+        self.heartbeat.start()
+
         # Start a new thread to handle receiving data
         threading.Thread(target=self.receive_data).start()
 
     def receive_data(self):
-        while self.is_running:
-            if self.socket:
-                # Receive gamestate updates from the server
-                # Initialize an empty data buffer
-                data = b""
-                while True:
-                    # Receive chunks of data from the server
-                    chunk = self.socket.recv(4096)
-                    self.logger.debug(
-                        "Received chunk from server len: %s",
-                        len(chunk),
-                        extra={"chunk": chunk},
-                    )
-                    if not chunk:
-                        # No more data to receive
-                        break
-                    data += chunk
-                    if b"[EOM]" in chunk:
-                        # All data has been received
-                        break
-
-                # Process the received data
-                if data == b"S3nD:ping[EOM]":
-                    #                    self.logger.debug("Received ping from server")
-                    self.send_data(b"S3nD:pong[EOM]")
-                elif b"GameState:" in data:
-                    # When a new gamestate is recieved, update the gamestate class
-                    # and log data received to log file
-                    self.logger.debug(
-                        "Received gamestate from server", extra={"data": data.decode()}
-                    )
-                    self.gamestate_class.set_gamestate(data)
-                else:
-                    # This should not happen, so log it to the log file as error
-                    self.logger.error("Received unknown data from server: %s", data)
+        gamestates = self.gamestates
+        buffer = b""
+        while self.is_running and self.socket:
+            # Receive chunks of data from the server
+            try:
+                chunk = self.socket.recv(65536)
+            except OSError:
+                # The socket was closed by disconnect or the connection was lost
+                chunk = b""
+            self.logger.debug(
+                "Received chunk from server len: %s",
+                len(chunk),
+                extra={"chunk": chunk},
+            )
+            if not chunk:
+                # The connection is closed, stop the thread
+                if self.is_running:
+                    self.logger.error("Connection to server lost")
+                    self.is_running = False
+                break
+
+            # Only search the new data, and the end of the old data in case
+            # [EOM] is split over two chunks
+            start = max(len(buffer) - len(EOM) + 1, 0)
+            buffer += chunk
+            end = buffer.find(EOM, start)
+            while end != -1:
+                frame = buffer[: end + len(EOM)]
+                buffer = buffer[end + len(EOM) :]
+                self.handle_frame(frame)
+                end = buffer.find(EOM)
+
+        # Stop the decoder thread of this connection
+        gamestates.put(None)
+
+    def handle_frame(self, data):
+        """Handle one frame from the server, called by the reader thread."""
+        self.frames_received += 1
+        if self.recorder:
+            self.recorder.record(INBOUND, data)
+
+        # Process the received data
+        if data == b"S3nD:ping[EOM]":
+            #                    self.logger.debug("Received ping from server")
+            received = time.monotonic()
+            self.heartbeat.ping_received(received)
+            self.send_data(b"S3nD:pong[EOM]")
+            self.heartbeat.pong_sent(received)
+        elif b"GameState:" in data:
+            # When a new gamestate is recieved, hand it to the decoder thread
+            self.logger.debug("Received gamestate from server len: %s", len(data))
+            index = frame_index(data)
+            if index is not None:
+                self.heartbeat.gamestate_received(index)
+            self.gamestates.put(data)
+        else:
+            # This should not happen, so log it to the log file as error
+            self.reject(data, "Unknown frame")
+
+    def reject(self, data, reason):
+        """Count a frame that can not be used and put it in quarantine."""
+        with self.counter_lock:
+            self.frames_rejected += 1
+        self.logger.error("Rejected frame from server: %s: %s", reason, shorten(data))
+        if self.quarantine:
+            self.quarantine.add(data, reason)
+
+    def decode_gamestates(self):
+        """Update the gamestate class with the frames from the reader thread.
+
+        Every gamestate is the complete state, so when several are waiting only
+        the newest is decoded and the older ones are dropped.
+        """
+        gamestates = self.gamestates
+        while True:
+            data = gamestates.get()
+            while data is not None:
+                try:
+                    newer = gamestates.get_nowait()
+                except queue.Empty:
+                    break
+                if newer is None:
+                    gamestates.put(None)
+                    break
+                self.frames_dropped += 1
+                self.logger.debug("Dropped a stale gamestate")
+                data = newer
+            if data is None:
+                return
+            # An invalid gamestate is rejected before anything is changed, the
+            # last good gamestate is kept
+            try:
+                self.gamestate_class.set_gamestate(data)
+            except FrameError as error:
+                self.reject(data, str(error))
+            except Exception:
+                with self.counter_lock:
+                    self.frames_rejected += 1
+                self.logger.exception("Could not decode gamestate")
+            else:
+                self.frames_accepted += 1
 
     def send_data(self, data):
         """Send data to the server"""
@@ -83,15 +199,46 @@ class ClientNetwork:
         with self.lock:
             if self.socket:
                 self.logger.debug("Sending data to server: %s", data)
+                # Start timing the echo before sending, the echo can arrive
+                # before sendall returns
+                index = frame_index(data)
+                if index is not None and index >= 0:
+                    self.heartbeat.gamestate_sent(index)
                 self.socket.sendall(data)
+                self.frames_sent += 1
+                if self.recorder:
+                    self.recorder.record(OUTBOUND, data)
 
     def disconnect(self):
         """Disconnect from the server"""
+        self.heartbeat.stop()
         with self.lock:
             self.is_running = False
             if self.socket:
                 self.logger.info("Disconnecting from server")
+                # close alone does not wake up the reader thread blocked in recv
+                try:
+                    self.socket.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
                 self.socket.close()
+        self.stop_recording()
+
+    def start_recording(self, path):
+        """Record all frames sent and received to a file, see recorder.py"""
+        self.stop_recording()
+        self.recorder = SessionRecorder(path)
+
+    def stop_recording(self):
+        """Stop recording frames"""
+        recorder = self.recorder
+        self.recorder = None
+        if recorder:
+            recorder.close()
+
+    def start_quarantine(self, path, max_bytes=4 * 1024 * 1024):
+        """Write rejected frames to a file, see validation.py"""
+        self.quarantine = Quarantine(path, max_bytes)
 
     def send_init_msg(self):
         """Send the init message to the server"""
@@ -0,0 +1,378 @@
+"""
+JSON codec and schema for the X-Haven GameState.
+
+The schemas below are the single description of the GameState JSON that is
+exchanged with the X-Haven app. Each schema is a tuple of fields in the order
+the app sends them, where a field is either the JSON key or a tuple of
+(JSON key, attribute name) when the attribute on the entity has another name.
+
+Entities (GameState, Characters, Monsters, ...) inherit from Entity, set their
+schema, and decode and encode their fields through it instead of copying every
+key by hand.
+
+Sections of the GameState that this project never reads or changes (decks,
+unlocked classes, special rules and elements) are kept as RawJSON, the text
+span from the incoming frame. They are only parsed when something reads them,
+and are spliced back verbatim when the GameState is sent.
+
+The JSON backend is pluggable. orjson or msgspec is used when installed,
+otherwise the standard library json module. The backend is imported on first
+use. All backends write compact JSON, and the GameState, which holds no
+floats and only small integers, encodes to the same bytes with each of them.
+Other values may not: floats can be formatted differently, and orjson rejects
+integers that do not fit in 64 bits.
+"""
+
+import json
+import re
+
+from .conditions import ConditionSet
+
+# ----------------------------------------------
+# Schemas
+# ----------------------------------------------
+
+GAMESTATE_SCHEMA = (
+    "level",
+    "solo",
+    "roundState",
+    "round",
+    "scenario",
+    "toastMessage",
+    "scenarioSpecialRules",
+    "scenarioSectionsAdded",
+    "currentCampaign",
+    "currentList",
+    "currentAbilityDecks",
+    "modifierDeck",
+    "modifierDeckAllies",
+    "lootDeck",
+    "unlockedClasses",
+    "showAllyDeck",
+    "elementState",
+)
+
+CHARACTER_SCHEMA = (
+    "id",
+    "turnState",
+    "characterState",
+    "characterClass",
+)
+
+CHARACTER_STATE_SCHEMA = (
+    "initiative",
+    "health",
+    "maxHealth",
+    "level",
+    "xp",
+    "chill",
+    "display",
+    "summonList",
+    "conditions",
+    "conditionsAddedThisTurn",
+    "conditionsAddedPreviousTurn",
+)
+
+MONSTER_SCHEMA = (
+    "id",
+    "turnState",
+    "isActive",
+    "type",
+    ("monsterInstances", "monster_instances"),
+    "isAlly",
+    "level",
+)
+
+MONSTER_INSTANCE_SCHEMA = (
+    "health",
+    "maxHealth",
+    "level",
+    "standeeNr",
+    "move",
+    "attack",
+    "range",
+    "name",
+    "gfx",
+    "roundSummoned",
+    "type",
+    "chill",
+    "conditions",
+    "conditionsAddedThisTurn",
+    "conditionsAddedPreviousTurn",
+)
+
+
+# Sections of the GameState that are passed through without being parsed
+LAZY_SECTIONS = (
+    "currentAbilityDecks",
+    "modifierDeck",
+    "modifierDeckAllies",
+    "lootDeck",
+    "unlockedClasses",
+    "scenarioSpecialRules",
+    "elementState",
+)
+
+
+def _fields(schema: tuple, lazy: tuple = ()) -> tuple:
+    # Normalize a schema to a tuple of (key, attribute) pairs
+    # Lazy sections are stored in a private attribute, see LazySection
+    fields = []
+    for field in schema:
+        key, attribute = (field, field) if isinstance(field, str) else field
+        if key in lazy:
+            attribute = "_" + attribute
+        fields.append((key, attribute))
+    return tuple(fields)
+
+
+class Entity:
+    """Base class for objects that are decoded from and encoded to the GameState JSON."""
+
+    # Normalized schema, set by subclasses with Entity.schema(...)
+    _fields: tuple = ()
+
+    @staticmethod
+    def schema(schema: tuple, lazy: tuple = ()) -> tuple:
+        """Return the normalized form of a schema, to be assigned to _fields.
+
+        Keys listed in lazy are stored in a private attribute and must be exposed
+        with a LazySection on the entity.
+        """
+        return _fields(schema, lazy)
+
+    def decode(self, data: dict) -> None:
+        """Set the attributes of the entity from a decoded JSON object.
+
+        The object is decoded to dicts first on purpose: only the stdlib json
+        backend is always installed and it can not decode into typed structs,
+        and unknown or missing keys from other app versions stay tolerated.
+        """
+        for key, attribute in self._fields:
+            setattr(self, attribute, data.get(key))
+
+    def encode(self) -> dict:
+        """Return the entity as a JSON object, nested entities are encoded too."""
+        data = {}
+        for key, attribute in self._fields:
+            value = getattr(self, attribute)
+            if isinstance(value, (Entity, ConditionSet)):
+                value = value.encode()
+            elif type(value) is list and value and isinstance(value[0], Entity):
+                value = [item.encode() for item in value]
+            data[key] = value
+        return data
+
+
+class RawJSON:
+    """A JSON value kept as the text it was received as.
+
+    If the app sends a key that is not in the schema, its text can end up after
+    the value of the section before it. It is then sent back verbatim, and only
+    the first value is used when the section is read.
+    """
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+    def value(self):
+        """Parse and return the value."""
+        try:
+            return loads(self.text)
+        except Exception:
+            return _decoder.raw_decode(self.text)[0]
+
+
+class LazySection:
+    """Attribute that holds a RawJSON until it is read for the first time.
+
+    On first read the text is parsed and the value replaces the RawJSON, from
+    then on the section is encoded from the value, as it may have been changed.
+    """
+
+    def __set_name__(self, owner, name) -> None:
+        self.attribute = "_" + name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = obj.__dict__.get(self.attribute)
+        if type(value) is RawJSON:
+            value = value.value()
+            obj.__dict__[self.attribute] = value
+        return value
+
+    def __set__(self, obj, value) -> None:
+        obj.__dict__[self.attribute] = value
+
+
+# Strings and brackets, used to find the end of a section without parsing it
+_SKIP_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]')
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+def _skip_value(text: str, index: int) -> int:
+    # Return the index just after the JSON value that starts at index
+    if text[index] not in "[{":
+        return _decoder.raw_decode(text, index)[1]
+    depth = 0
+    for match in _SKIP_TOKEN.finditer(text, index):
+        char = text[match.start()]
+        if char == '"':
+            continue
+        if char in "[{":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    raise ValueError("Unterminated JSON value at %s" % index)
+
+
+def loads_sections(text: str, lazy: tuple = LAZY_SECTIONS) -> dict:
+    """Decode a JSON object, keeping the values of the lazy keys as RawJSON.
+
+    The end of each value is found with a scan that skips over strings, so
+    brackets and key names inside strings are never mistaken for structure.
+    If the scan fails the object is decoded in full, without lazy sections.
+    """
+    if not lazy:
+        return loads(text)
+
+    try:
+        return _loads_sections(text, lazy)
+    except ValueError:
+        return loads(text)
+
+
+def _loads_sections(text: str, lazy: tuple) -> dict:
+    sections = {}
+    end = len(text)
+    index = _WHITESPACE.match(text, 0).end()
+    if text[index : index + 1] != "{":
+        raise ValueError("Expected a JSON object")
+    index = _WHITESPACE.match(text, index + 1).end()
+    if text[index : index + 1] == "}":
+        return sections
+
+    while index < end:
+        key, index = json.decoder.scanstring(text, index + 1)
+        index = _WHITESPACE.match(text, index).end()
+        if text[index : index + 1] != ":":
+            raise ValueError("Expected ':' at %s" % index)
+        index = _WHITESPACE.match(text, index + 1).end()
+
+        if key in lazy:
+            value_end = _skip_value(text, index)
+            sections[key] = RawJSON(text[index:value_end])
+        elif text[index : index + 1] in ("[", "{"):
+            # Containers are parsed once, by the backend
+            value_end = _skip_value(text, index)
+            sections[key] = loads(text[index:value_end])
+        else:
+            sections[key], value_end = _decoder.raw_decode(text, index)
+
+        index = _WHITESPACE.match(text, value_end).end()
+        char = text[index : index + 1]
+        if char == "}":
+            return sections
+        if char != ",":
+            raise ValueError("Expected ',' or '}' at %s" % index)
+        index = _WHITESPACE.match(text, index + 1).end()
+    raise ValueError("Unterminated JSON object")
+
+
+def dumps_sections(sections: dict) -> str:
+    """Encode a JSON object, RawJSON values are spliced in verbatim."""
+    parts = []
+    for key, value in sections.items():
+        if type(value) is RawJSON:
+            parts.append(dumps(key) + ":" + value.text)
+        else:
+            parts.append(dumps(key) + ":" + dumps(value))
+    return "{" + ",".join(parts) + "}"
+
+
+# ----------------------------------------------
+# Backends
+# ----------------------------------------------
+
+
+def _stdlib_backend():
+    encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+    return (json.loads, encoder.encode)
+
+
+def _orjson_backend():
+    import orjson
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+    return (orjson.loads, dumps)
+
+
+def _msgspec_backend():
+    import msgspec
+
+    decoder = msgspec.json.Decoder()
+    encoder = msgspec.json.Encoder()
+
+    def dumps(obj) -> str:
+        return encoder.encode(obj).decode("utf-8")
+
+    return (decoder.decode, dumps)
+
+
+BACKENDS = {
+    "orjson": _orjson_backend,
+    "msgspec": _msgspec_backend,
+    "json": _stdlib_backend,
+}
+
+backend = ""
+_loads = None
+_dumps = None
+
+
+def use_backend(name: str = "") -> str:
+    """Select the JSON backend by name, or the fastest installed one if no name is given.
+
+    Returns the name of the backend in use. Raises ValueError for an unknown
+    name and ImportError when the named backend is not installed.
+    """
+    global backend, _loads, _dumps
+
+    if name and name not in BACKENDS:
+        raise ValueError(
+            "Unknown JSON backend %r, the backends are: %s"
+            % (name, ", ".join(BACKENDS))
+        )
+    names = [name] if name else list(BACKENDS)
+    for candidate in names:
+        try:
+            _loads, _dumps = BACKENDS[candidate]()
+        except ImportError:
+            if name:
+                raise
+            continue
+        backend = candidate
+        return backend
+    raise ValueError("No JSON backend available")
+
+
+def loads(data):
+    """Decode a JSON document given as str or bytes."""
+    if _loads is None:
+        use_backend()
+    return _loads(data)
+
+
+def dumps(obj) -> str:
+    """Encode an object as compact JSON."""
+    if _dumps is None:
+        use_backend()
+    return _dumps(obj)
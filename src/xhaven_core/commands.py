@@ -0,0 +1,338 @@
+"""
+Typed commands and the command stream.
+
+The commands are the ones of the command line in xhaven_speech.py:
+
+    q               quit
+    i               print character and monster information
+    h               help
+    u, y            undo and redo
+    e               end of round effects
+    profile         start CPU profiling, again to stop it, see profiling.py
+    memory          take a memory snapshot, memory stop stops tracing
+    /1 20           set the initiative of character 1 to 20
+    -12 4 3         reduce standee 4 of monster 12 with 3 health, + increases
+    -1 all 2        several standees at once, see targets.py
+    p12 4           poison standee 4 of monster 12, also s, i, d, w, m and b
+
+The short forms without spaces (/172, -143, p14) still work, they use one
+digit for every number except the last.
+
+run_stream applies commands from a file, stdin or a socket without waiting
+for input between them. Commands that are ready at the same time are applied
+in one GameState.batch, so a burst of commands is sent to the app as one
+gamestate:
+
+    commands.run_stream(game_state, open("commands.txt"))
+"""
+
+import contextlib
+import logging
+import queue
+import socket
+import threading
+from typing import NamedTuple
+
+from .targets import parse_targets
+
+logger = logging.getLogger("xhaven_core.commands")
+
+KEYWORDS = {
+    "q": "quit",
+    "i": "info",
+    "h": "help",
+    "u": "undo",
+    "y": "redo",
+    "e": "end_round",
+}
+# Commands of more than one letter, for the command line
+TOOL_COMMANDS = {
+    "profile": "profile",
+    "memory": "memory",
+    "memory stop": "memory_stop",
+}
+HEALTH_OPERATORS = "-+"
+CONDITION_LETTERS = "sidwmpb"
+
+# Actions that change the GameState, the others are for the command line
+UPDATE_ACTIONS = ("initiative", "health", "condition", "end_round")
+
+
+class CommandError(ValueError):
+    """A command that can not be parsed."""
+
+
+class Command(NamedTuple):
+    action: str
+    index: int = 0
+    standee_nrs: tuple = None
+    standee_type: int = None
+    value: int = 0
+    condition: str = ""
+
+
+def tokenize(text: str) -> list:
+    """Split a command into words, the operator is split from the first number.
+
+    "-12 1-3 2" becomes ["-", "12", "1-3", "2"] and "p14" becomes ["p", "14"].
+    """
+    words = text.split()
+    if not words:
+        return []
+    first = words[0]
+    if len(first) > 1 and (
+        first[0] in HEALTH_OPERATORS + "/"
+        or (first[0] in CONDITION_LETTERS and first[1:].isdigit())
+    ):
+        return [first[0], first[1:]] + words[1:]
+    return words
+
+
+def _number(word: str, what: str) -> int:
+    if not word.isdigit():
+        raise CommandError("%s must be a number, not %r" % (what, word))
+    return int(word)
+
+
+def parse_command(text: str):
+    """Parse one command, returns None for an empty command.
+
+    Raises CommandError when the command is not valid.
+    """
+    text = text.strip()
+    words = tokenize(text)
+    if not words:
+        return None
+    operator, arguments = words[0], words[1:]
+
+    tool = TOOL_COMMANDS.get(" ".join(words).lower())
+    if tool:
+        return Command(tool)
+
+    if operator in KEYWORDS and not arguments:
+        return Command(KEYWORDS[operator])
+
+    if operator == "/":
+        if len(arguments) == 1 and len(arguments[0]) >= 2:
+            # Short form /172, character 1 initiative 72
+            word = arguments[0]
+            _number(word, "Initiative")
+            return Command("initiative", int(word[0]), value=int(word[1:]))
+        if len(arguments) != 2:
+            raise CommandError("Use / <character> <initiative>, for example /1 20")
+        return Command(
+            "initiative",
+            _number(arguments[0], "Character"),
+            value=_number(arguments[1], "Initiative"),
+        )
+
+    if operator in HEALTH_OPERATORS or operator in CONDITION_LETTERS:
+        health_command = operator in HEALTH_OPERATORS
+        if len(arguments) == 1:
+            # Short form -143 or p14, one digit for the monster and standee
+            word = arguments[0]
+            _number(word, "Command")
+            if len(word) < (3 if health_command else 2) or (
+                not health_command and len(word) > 2
+            ):
+                raise CommandError("Use spaces between numbers, for example -12 4 3")
+            index, standee_nr, rest = int(word[0]), int(word[1]), word[2:]
+            selection = (standee_nr,)
+            standee_type = None
+            health = int(rest) if health_command else 0
+        elif arguments:
+            index = _number(arguments[0], "Monster")
+            targets, used = parse_targets(arguments[1:])
+            if targets is None:
+                raise CommandError("Unknown standees in %r" % text)
+            selection = targets.standee_nrs
+            standee_type = targets.standee_type
+            rest = arguments[1 + used :]
+            if health_command:
+                if len(rest) != 1:
+                    raise CommandError("Give the health after the standees")
+                health = _number(rest[0], "Health")
+            elif rest:
+                raise CommandError("Unexpected %r" % " ".join(rest))
+            else:
+                health = 0
+        else:
+            raise CommandError("Missing monster and standee in %r" % text)
+
+        if health_command:
+            return Command(
+                "health",
+                index,
+                selection,
+                standee_type,
+                -health if operator == "-" else health,
+            )
+        return Command("condition", index, selection, standee_type, condition=operator)
+
+    raise CommandError("Unknown command %r" % text)
+
+
+def parse_commands(text: str) -> list:
+    """Parse the commands in a line, commands can be separated by ;"""
+    commands = []
+    for part in text.split(";"):
+        command = parse_command(part)
+        if command is not None:
+            commands.append(command)
+    return commands
+
+
+def execute(game_state, command: Command) -> bool:
+    """Apply an update command to the GameState, returns False if nothing changed."""
+    if command.action == "initiative":
+        return game_state.update_initiative(
+            index=command.index, initiative=command.value
+        )
+    if command.action in ("health", "condition"):
+        return game_state.update_monsters(
+            index=command.index,
+            standee_nrs=command.standee_nrs,
+            standee_type=command.standee_type,
+            health=command.value,
+            relative=True,
+            condition=command.condition,
+        )
+    if command.action == "end_round":
+        return game_state.end_round()
+    if command.action == "undo":
+        return game_state.undo()
+    if command.action == "redo":
+        return game_state.redo()
+    raise CommandError("%s can not be executed on the gamestate" % command.action)
+
+
+class StreamResult(NamedTuple):
+    applied: int
+    failed: int
+    batches: int
+
+
+def run_stream(game_state, lines, batch_size: int = 1000) -> StreamResult:
+    """Apply the commands in lines, an iterable of text lines such as a file.
+
+    Lines are read on a separate thread. The commands that are waiting when the
+    previous batch is done, up to batch_size, are applied in one batch. Undo
+    and redo are applied on their own, and q or the end of lines stops.
+    A line with an invalid command is logged and skipped.
+    """
+    commands = queue.Queue()
+
+    def read():
+        try:
+            for number, line in enumerate(lines, 1):
+                try:
+                    parsed = parse_commands(line)
+                except CommandError as error:
+                    logger.error("Line %s: %s", number, error)
+                    commands.put(error)
+                    continue
+                for command in parsed:
+                    commands.put(command)
+                    if command.action == "quit":
+                        return
+        finally:
+            commands.put(None)
+
+    threading.Thread(target=read, daemon=True).start()
+
+    applied = failed = batches = 0
+    waiting = None
+    done = False
+    while not done:
+        batch = [waiting if waiting is not None else commands.get()]
+        waiting = None
+        # Take what is already waiting, but apply undo and redo on their own
+        if isinstance(batch[0], Command) and batch[0].action in UPDATE_ACTIONS:
+            while len(batch) < batch_size:
+                try:
+                    command = commands.get_nowait()
+                except queue.Empty:
+                    break
+                if (
+                    isinstance(command, Command)
+                    and command.action not in UPDATE_ACTIONS
+                ):
+                    waiting = command
+                    break
+                batch.append(command)
+
+        updates = []
+        for command in batch:
+            if command is None or getattr(command, "action", "") == "quit":
+                done = True
+                break
+            if isinstance(command, CommandError):
+                failed += 1
+            elif command.action not in UPDATE_ACTIONS + ("undo", "redo"):
+                logger.debug("Ignoring %s in a command stream", command.action)
+            else:
+                updates.append(command)
+        if not updates:
+            continue
+
+        if updates[0].action in ("undo", "redo"):
+            # Alone in its batch, sent with its own Undo: or Redo: description
+            context = contextlib.nullcontext()
+        else:
+            context = game_state.batch("%s commands" % len(updates))
+        with context:
+            for command in updates:
+                try:
+                    changed = execute(game_state, command)
+                except Exception:
+                    logger.exception("Could not execute %s", command)
+                    changed = False
+                if changed:
+                    applied += 1
+                else:
+                    failed += 1
+        batches += 1
+
+    logger.info(
+        "Command stream done: %s applied, %s failed, %s batches",
+        applied,
+        failed,
+        batches,
+    )
+    return StreamResult(applied, failed, batches)
+
+
+def serve_commands(
+    game_state, host: str = "127.0.0.1", port: int = 0, batch_size: int = 1000
+):
+    """Accept command streams on a local TCP port, one connection at a time.
+
+    Every connection is a stream of command lines, see run_stream. When the
+    stream ends a line with the number of applied and failed commands is sent
+    back. Returns the listening socket, close it to stop.
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen()
+    logger.info("Accepting commands on %s:%s", *server.getsockname()[:2])
+
+    def accept():
+        while True:
+            try:
+                client, address = server.accept()
+            except OSError:
+                return
+            with client:
+                logger.info("Command stream from %s:%s", *address[:2])
+                with client.makefile("r", encoding="utf-8") as lines:
+                    result = run_stream(game_state, lines, batch_size)
+                try:
+                    client.sendall(
+                        b"applied %d failed %d\n" % (result.applied, result.failed)
+                    )
+                except OSError:
+                    pass
+
+    threading.Thread(target=accept, daemon=True).start()
+    return server
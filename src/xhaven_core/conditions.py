@@ -0,0 +1,148 @@
+"""
+Conditions of characters and monster standees.
+
+The app sends conditions as a list of condition ids. They are kept as a
+ConditionSet, an int bitmask where bit n is set when condition n is active,
+and encoded back to a list of ids when the gamestate is sent. The ids keep
+the order of the app's list, so an unchanged list is sent back as it came.
+Ids the app adds in later versions are kept as they are.
+"""
+
+import enum
+
+
+class Condition(enum.IntEnum):
+    """Condition ids used by the X-Haven app."""
+
+    STUN = 0
+    IMMOBILIZE = 1
+    DISARM = 2
+    WOUND = 3
+    WOUND2 = 4
+    MUDDLE = 5
+    POISON = 6
+    POISON2 = 7
+    POISON3 = 8
+    POISON4 = 9
+    BANE = 10
+    BRITTLE = 11
+    CHILL = 12
+    INFECT = 13
+    IMPAIR = 14
+    RUPTURE = 15
+    STRENGTHEN = 16
+    INVISIBLE = 17
+    REGENERATE = 18
+    WARD = 19
+
+
+# Single letter shortcuts used on the command line, for example p14
+SHORTCUTS = {
+    "s": Condition.STUN,
+    "i": Condition.IMMOBILIZE,
+    "d": Condition.DISARM,
+    "w": Condition.WOUND,
+    "m": Condition.MUDDLE,
+    "p": Condition.POISON,
+    "b": Condition.BRITTLE,
+}
+
+
+def parse(condition):
+    """Return the Condition for an id, shortcut or name, or None if unknown."""
+    if isinstance(condition, int):
+        try:
+            return Condition(condition)
+        except ValueError:
+            return None
+    condition = condition.strip().lower()
+    if condition in SHORTCUTS:
+        return SHORTCUTS[condition]
+    return Condition.__members__.get(condition.upper())
+
+
+class ConditionSet:
+    """Immutable set of condition ids stored as a bitmask, in insertion order.
+
+    with_condition and without_condition return a new set, or the same set
+    when nothing changes, so adding a condition twice or removing one that is
+    not there does nothing. An added condition goes last.
+    """
+
+    __slots__ = ("bits", "order")
+
+    def __init__(self, bits: int = 0, order: tuple = None) -> None:
+        self.bits = bits
+        # The ids in the order they were added, None for ascending order
+        self.order = order
+
+    @classmethod
+    def from_list(cls, conditions) -> "ConditionSet":
+        """Create a set from the list of ids in the gamestate, None is empty."""
+        bits = 0
+        order = []
+        for condition in conditions or ():
+            if not bits >> condition & 1:
+                bits |= 1 << condition
+                order.append(condition)
+        return cls(bits, tuple(order))
+
+    def to_list(self) -> list:
+        """Return the ids in the order they were added, ascending for a bitmask."""
+        if self.order is not None:
+            return list(self.order)
+        result = []
+        bits = self.bits
+        condition = 0
+        while bits:
+            if bits & 1:
+                result.append(condition)
+            bits >>= 1
+            condition += 1
+        return result
+
+    def encode(self) -> list:
+        return self.to_list()
+
+    def with_condition(self, condition: int) -> "ConditionSet":
+        if condition in self:
+            return self
+        return ConditionSet(
+            self.bits | (1 << condition), tuple(self) + (int(condition),)
+        )
+
+    def without_condition(self, condition: int) -> "ConditionSet":
+        return self.masked(~(1 << condition))
+
+    def masked(self, mask: int) -> "ConditionSet":
+        """Return the set with only the ids whose bit is set in mask."""
+        bits = self.bits & mask
+        if bits == self.bits:
+            return self
+        return ConditionSet(bits, tuple(c for c in self if mask >> c & 1))
+
+    def __contains__(self, condition) -> bool:
+        return bool(self.bits >> condition & 1)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __len__(self) -> int:
+        return bin(self.bits).count("1")
+
+    def __bool__(self) -> bool:
+        return self.bits != 0
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ConditionSet):
+            return self.bits == other.bits
+        if isinstance(other, (list, tuple)):
+            return self.bits == ConditionSet.from_list(other).bits
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.bits)
+
+    def __repr__(self) -> str:
+        names = [getattr(parse(condition), "name", str(condition)) for condition in self]
+        return "ConditionSet(%s)" % ", ".join(names)
@@ -0,0 +1,244 @@
+"""
+Configuration file and the spoken name tables.
+
+initial_parameters.json is validated by load_parameters. The character and
+monster names in it are compiled into a NameTables object, which is shared by
+the GameState and all its Characters and Monsters instead of being copied
+into every entity. ConfigWatcher reloads the file when it changes, and the
+new names replace the old ones in one step while the connection stays up.
+
+Example:
+
+    parameters = config.load_parameters("initial_parameters.json")
+    game_state = GameState(parameters["character_names"], parameters["monster_names"])
+    watcher = config.ConfigWatcher(
+        "initial_parameters.json",
+        lambda parameters: game_state.names.update(
+            parameters["character_names"], parameters["monster_names"]
+        ),
+    )
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import NamedTuple
+
+# Parameters of initial_parameters.json, None in the file means the default
+DEFAULT_PARAMETERS = {
+    "host": "localhost",
+    "port": 4567,
+    "character_names": {},
+    "monster_names": {},
+    "microphones": [],
+    "pre_roll": None,
+    "recording_file": None,
+    "quarantine_file": None,
+    "timeline_file": None,
+    "readback_voice": None,
+    "speculate": False,
+    "warm_start_file": None,
+    "snapshot_port": None,
+    "recognition_workers": 0,
+    "auto_end_of_round": False,
+}
+
+PARAMETER_TYPES = {
+    "host": str,
+    "port": int,
+    "character_names": dict,
+    "monster_names": dict,
+    "microphones": list,
+    "pre_roll": (int, float),
+    "recording_file": str,
+    "quarantine_file": str,
+    "timeline_file": str,
+    "readback_voice": str,
+    "speculate": bool,
+    "warm_start_file": str,
+    "snapshot_port": int,
+    "recognition_workers": int,
+    "auto_end_of_round": bool,
+    # Only for the tables of a hub, see hub.py
+    "microphone": int,
+    "startup_delay": (int, float),
+}
+
+
+def validate_parameters(parameters: dict, defaults: dict = DEFAULT_PARAMETERS) -> dict:
+    """Check the keys and types of parameters, returns them with the defaults added.
+
+    Raises ValueError for unknown keys and values of the wrong type.
+    """
+    if not isinstance(parameters, dict):
+        raise ValueError("Parameters must be a JSON object")
+    unknown = set(parameters) - set(defaults)
+    if unknown:
+        raise ValueError("Unknown parameters: %s" % ", ".join(sorted(unknown)))
+
+    result = {}
+    for key, default in defaults.items():
+        value = parameters.get(key)
+        if value is None:
+            result[key] = default
+            continue
+        expected = PARAMETER_TYPES.get(key)
+        # bool is an int, but an int is not a valid bool and the other way around
+        if expected and (
+            not isinstance(value, expected)
+            or (isinstance(value, bool) and expected is not bool)
+        ):
+            raise ValueError("Parameter %s has the wrong type: %r" % (key, value))
+        result[key] = value
+
+    for key in ("character_names", "monster_names"):
+        for entity_id, name in result[key].items():
+            if not isinstance(name, str):
+                raise ValueError("Name of %s in %s must be a string" % (entity_id, key))
+
+    # Partial results only come from the continuous capture, see capture.py
+    if result["speculate"]:
+        if result["pre_roll"] is None:
+            raise ValueError("speculate needs pre_roll, the continuous capture")
+        if any(
+            isinstance(entry, dict) and entry.get("channel") is not None
+            for entry in result["microphones"]
+        ):
+            raise ValueError("speculate does not work with microphone channels")
+    return result
+
+
+def load_parameters(path: str) -> dict:
+    """Read and validate initial_parameters.json."""
+    with open(path, "r") as file:
+        try:
+            parameters = json.load(file)
+        except json.JSONDecodeError as error:
+            raise ValueError("%s is not valid JSON: %s" % (path, error)) from None
+    return validate_parameters(parameters)
+
+
+class _Tables(NamedTuple):
+    character_names: dict
+    monster_names: dict
+    # Lower case spoken name or id -> character id
+    characters: dict
+    # Lower case spoken name or type -> monster id
+    monsters: dict
+    # All words the players can say as a name, for recognizer grammars
+    phrases: tuple
+
+
+class NameTables:
+    """Spoken names of characters and monsters, shared by a GameState and its entities.
+
+    update builds new tables and replaces the old ones with one assignment, so
+    readers in other threads see either the old or the new tables, never a mix.
+    """
+
+    def __init__(self, character_names: dict = None, monster_names: dict = None) -> None:
+        self.update(character_names or {}, monster_names or {})
+
+    def update(self, character_names: dict, monster_names: dict) -> None:
+        characters = {}
+        monsters = {}
+        for character_id, name in character_names.items():
+            characters[character_id.lower()] = character_id
+            if name:
+                characters[name.lower()] = character_id
+        for monster_id, name in monster_names.items():
+            monsters[monster_id.lower()] = monster_id
+            if name:
+                monsters[name.lower()] = monster_id
+        phrases = tuple(
+            sorted(
+                name.lower()
+                for name in list(character_names.values()) + list(monster_names.values())
+                if name
+            )
+        )
+        self._tables = _Tables(
+            dict(character_names), dict(monster_names), characters, monsters, phrases
+        )
+
+    @property
+    def character_names(self) -> dict:
+        return self._tables.character_names
+
+    @property
+    def monster_names(self) -> dict:
+        return self._tables.monster_names
+
+    @property
+    def phrases(self) -> tuple:
+        return self._tables.phrases
+
+    def character_name(self, character_id: str) -> str:
+        """Return the spoken name of a character, or "" if it has none."""
+        return self._tables.character_names.get(character_id, "")
+
+    def monster_name(self, monster_id: str) -> str:
+        """Return the spoken name of a monster, or "" if it has none."""
+        return self._tables.monster_names.get(monster_id, "")
+
+    def find_character(self, spoken: str):
+        """Return the character id for a spoken name or id, or None."""
+        return self._tables.characters.get(spoken.lower())
+
+    def find_monster(self, spoken: str):
+        """Return the monster id for a spoken name or id, or None."""
+        return self._tables.monsters.get(spoken.lower())
+
+
+class ConfigWatcher:
+    """Reload a configuration file when it changes.
+
+    The file is checked every interval seconds. When it has changed and is
+    valid, on_change is called with the new parameters. An invalid file is
+    logged and the old configuration is kept.
+    """
+
+    def __init__(self, path: str, on_change, interval: float = 1.0, load=None) -> None:
+        self.logger = logging.getLogger("xhaven_core.config")
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.load = load or load_parameters
+        self.version = self._version()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+        self.thread.start()
+
+    def _version(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _watch(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def check(self) -> bool:
+        """Reload the file if it has changed, returns True if it was applied."""
+        version = self._version()
+        if version is None or version == self.version:
+            return False
+        self.version = version
+        try:
+            parameters = self.load(self.path)
+        except (OSError, ValueError) as error:
+            self.logger.error("Keeping the old configuration: %s", error)
+            return False
+        self.logger.info("Configuration %s reloaded", self.path)
+        try:
+            self.on_change(parameters)
+        except Exception:
+            self.logger.exception("Could not apply the new configuration")
+            return False
+        return True
+
+    def stop(self) -> None:
+        self.stopped.set()
@@ -0,0 +1,154 @@
+"""
+End of round processing of wound, regenerate, bane and condition expiry.
+
+All characters and standees are collected into columns (health, maximum
+health, condition bits and the bits of the conditions added this turn), the
+new health and conditions are computed for all of them in one pass, and only
+the rows that changed are written back. The GameState sends the result as
+one change, see GameState.end_round.
+
+The rules, applied in this order:
+    regenerate  heal 1, which removes wound. A poisoned figure is not healed,
+                the poison is removed instead
+    wound       suffer 1 damage, 2 for wound2
+    expiry      stun, immobilize, disarm, muddle, impair, strengthen and
+                invisible are removed, unless they were added this turn
+    bane        suffer 10 damage and bane is removed, unless added this turn
+Damage removes regenerate. Standees with no health left are removed.
+
+The computation is written with operators that work on both ints and NumPy
+arrays. With numpy installed and many rows it runs vectorized over arrays,
+otherwise row by row.
+"""
+
+from .conditions import Condition, ConditionSet
+
+# Rows from which the NumPy version is used, below it the loop is faster
+NUMPY_MIN_ROWS = 64
+
+# Conditions this module knows, other bits are never touched
+KNOWN = (1 << 20) - 1
+
+POISONS = (
+    1 << Condition.POISON
+    | 1 << Condition.POISON2
+    | 1 << Condition.POISON3
+    | 1 << Condition.POISON4
+)
+WOUNDS = 1 << Condition.WOUND | 1 << Condition.WOUND2
+EXPIRING = (
+    1 << Condition.STUN
+    | 1 << Condition.IMMOBILIZE
+    | 1 << Condition.DISARM
+    | 1 << Condition.MUDDLE
+    | 1 << Condition.IMPAIR
+    | 1 << Condition.STRENGTHEN
+    | 1 << Condition.INVISIBLE
+)
+BANE = 1 << Condition.BANE
+REGENERATE = 1 << Condition.REGENERATE
+
+
+class Columns:
+    """Struct of arrays view of the characters and standees of a GameState."""
+
+    __slots__ = ("rows", "health", "max_health", "conditions", "added")
+
+    def __init__(self) -> None:
+        # (address, object, monster) per row, monster is None for characters
+        self.rows = []
+        self.health = []
+        self.max_health = []
+        self.conditions = []
+        self.added = []
+
+    def append(self, address, target, monster) -> None:
+        self.rows.append((address, target, monster))
+        self.health.append(target.health or 0)
+        self.max_health.append(target.maxHealth or 0)
+        self.conditions.append(target.conditions.bits & KNOWN)
+        self.added.append(
+            ConditionSet.from_list(target.conditionsAddedThisTurn).bits & KNOWN
+        )
+
+
+def columns(game_state) -> Columns:
+    """Collect the characters and standees of a GameState into columns."""
+    result = Columns()
+    for item in game_state.currentList:
+        if item.__class__.__name__ == "Characters":
+            result.append(("character", item.id), item.characterState, None)
+        else:
+            for monster_instance in item.monster_instances:
+                result.append(
+                    ("standee", item.id, monster_instance.standeeNr),
+                    monster_instance,
+                    item,
+                )
+    return result
+
+
+def compute(health, max_health, conditions, added, minimum=min):
+    """Return (new health, removed condition bits) for one row or for arrays."""
+    regenerate = (conditions >> Condition.REGENERATE) & 1
+    poisoned = ((conditions & POISONS) != 0) * 1
+    heal = regenerate * (1 - poisoned)
+    removed = regenerate * poisoned * POISONS | heal * WOUNDS
+
+    remaining = conditions & ~removed
+    damage = ((remaining >> Condition.WOUND) & 1) + 2 * (
+        (remaining >> Condition.WOUND2) & 1
+    )
+    expiring = conditions & ~added & (EXPIRING | BANE)
+    damage = damage + 10 * ((expiring >> Condition.BANE) & 1)
+
+    removed = removed | expiring | (damage > 0) * REGENERATE
+    return minimum(health + heal, max_health) - damage, removed & conditions
+
+
+def process(game_state, use_numpy=None) -> list:
+    """Compute the end of round changes of a GameState.
+
+    Returns (address, object, monster, health, conditions) for every row that
+    changed, monster is None for characters.
+    """
+    data = columns(game_state)
+    if not data.rows:
+        return []
+
+    if use_numpy is None:
+        use_numpy = len(data.rows) >= NUMPY_MIN_ROWS
+    numpy = None
+    if use_numpy:
+        try:
+            import numpy
+        except ImportError:
+            pass
+
+    if numpy is not None:
+        new_health, removed = compute(
+            numpy.array(data.health, dtype=numpy.int64),
+            numpy.array(data.max_health, dtype=numpy.int64),
+            numpy.array(data.conditions, dtype=numpy.int64),
+            numpy.array(data.added, dtype=numpy.int64),
+            minimum=numpy.minimum,
+        )
+        new_health = new_health.tolist()
+        removed = removed.tolist()
+    else:
+        new_health = []
+        removed = []
+        for row in zip(data.health, data.max_health, data.conditions, data.added):
+            row_health, row_removed = compute(*row)
+            new_health.append(row_health)
+            removed.append(row_removed)
+
+    changes = []
+    for (address, target, monster), health, old_health, bits in zip(
+        data.rows, new_health, data.health, removed
+    ):
+        if health == old_health and not bits:
+            continue
+        conditions = target.conditions.masked(~bits)
+        changes.append((address, target, monster, int(health), conditions))
+    return changes
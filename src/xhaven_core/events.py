@@ -0,0 +1,268 @@
+"""
+Change events emitted by GameState.
+
+GameState keeps a compact summary of the state it last published. After every
+set_gamestate and every local update it compares the new summary with the old
+one and publishes the differences as typed events to all subscribers. Nothing
+is computed while there are no subscribers.
+
+Example:
+
+    subscription = game_state.subscribe()
+    for event in subscription:
+        if isinstance(event, events.InitiativeChanged):
+            print(event.character_id, event.new)
+"""
+
+import logging
+import queue
+import threading
+from typing import NamedTuple
+
+
+class RoundChanged(NamedTuple):
+    index: int
+    round: int
+    roundState: int
+
+
+class RosterChanged(NamedTuple):
+    """Characters or monster groups were added to or removed from currentList."""
+
+    index: int
+    added: tuple
+    removed: tuple
+
+
+class InitiativeChanged(NamedTuple):
+    index: int
+    character_id: str
+    old: int
+    new: int
+
+
+class CharacterHealthChanged(NamedTuple):
+    index: int
+    character_id: str
+    old: int
+    new: int
+
+
+class MonsterHealthChanged(NamedTuple):
+    """The health of a standee changed, damage is positive when it was damaged."""
+
+    index: int
+    monster_id: str
+    standee_nr: int
+    old: int
+    new: int
+
+    @property
+    def damage(self) -> int:
+        return self.old - self.new
+
+
+class MonsterAdded(NamedTuple):
+    index: int
+    monster_id: str
+    standee_nr: int
+
+
+class MonsterKilled(NamedTuple):
+    index: int
+    monster_id: str
+    standee_nr: int
+
+
+class ConditionAdded(NamedTuple):
+    """A condition was added, standee_nr is 0 for characters."""
+
+    index: int
+    entity_id: str
+    standee_nr: int
+    condition: int
+
+
+class ConditionRemoved(NamedTuple):
+    """A condition was removed, standee_nr is 0 for characters."""
+
+    index: int
+    entity_id: str
+    standee_nr: int
+    condition: int
+
+
+def snapshot(game_state) -> tuple:
+    """Return the compact summary of a GameState that events are computed from.
+
+    The summary is (round, roster, characters, monsters) where characters maps
+    id -> (initiative, health, conditions) and monsters maps
+    (id, standeeNr) -> (health, conditions).
+    """
+    roster = []
+    characters = {}
+    monsters = {}
+    for item in game_state.currentList:
+        roster.append(item.id)
+        if item.__class__.__name__ == "Characters":
+            state = item.characterState
+            characters[item.id] = (
+                state.initiative,
+                state.health,
+                tuple(state.conditions or ()),
+            )
+        else:
+            for monster_instance in item.monster_instances:
+                monsters[(item.id, monster_instance.standeeNr)] = (
+                    monster_instance.health,
+                    tuple(monster_instance.conditions or ()),
+                )
+    return (
+        (game_state.round, game_state.roundState),
+        tuple(roster),
+        characters,
+        monsters,
+    )
+
+
+def _condition_events(index, entity_id, standee_nr, old, new) -> list:
+    events = []
+    for condition in new:
+        if condition not in old:
+            events.append(ConditionAdded(index, entity_id, standee_nr, condition))
+    for condition in old:
+        if condition not in new:
+            events.append(ConditionRemoved(index, entity_id, standee_nr, condition))
+    return events
+
+
+def diff(index: int, old: tuple, new: tuple) -> list:
+    """Return the events that turn the summary old into new."""
+    events = []
+    old_round, old_roster, old_characters, old_monsters = old
+    new_round, new_roster, new_characters, new_monsters = new
+
+    if old_round != new_round:
+        events.append(RoundChanged(index, new_round[0], new_round[1]))
+
+    if old_roster != new_roster:
+        added = tuple(item for item in new_roster if item not in old_roster)
+        removed = tuple(item for item in old_roster if item not in new_roster)
+        if added or removed:
+            events.append(RosterChanged(index, added, removed))
+
+    for character_id, (initiative, health, conditions) in new_characters.items():
+        previous = old_characters.get(character_id)
+        if previous is None or previous == (initiative, health, conditions):
+            continue
+        if previous[0] != initiative:
+            events.append(
+                InitiativeChanged(index, character_id, previous[0], initiative)
+            )
+        if previous[1] != health:
+            events.append(
+                CharacterHealthChanged(index, character_id, previous[1], health)
+            )
+        if previous[2] != conditions:
+            events.extend(
+                _condition_events(index, character_id, 0, previous[2], conditions)
+            )
+
+    for (monster_id, standee_nr), (health, conditions) in new_monsters.items():
+        previous = old_monsters.get((monster_id, standee_nr))
+        if previous is None:
+            events.append(MonsterAdded(index, monster_id, standee_nr))
+            continue
+        if previous[0] != health:
+            events.append(
+                MonsterHealthChanged(index, monster_id, standee_nr, previous[0], health)
+            )
+        if previous[1] != conditions:
+            events.extend(
+                _condition_events(
+                    index, monster_id, standee_nr, previous[1], conditions
+                )
+            )
+
+    for monster_id, standee_nr in old_monsters:
+        if (monster_id, standee_nr) not in new_monsters:
+            events.append(MonsterKilled(index, monster_id, standee_nr))
+
+    return events
+
+
+class Subscription:
+    """Queue of events for one subscriber.
+
+    Iterate over it to block for events, or use async for in a coroutine.
+    When the subscriber falls behind by more than maxsize events, the oldest
+    events are dropped so the GameState is never blocked.
+    """
+
+    def __init__(self, bus, maxsize: int) -> None:
+        self.bus = bus
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, event) -> None:
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float = None):
+        """Return the next event, raises queue.Empty on timeout."""
+        return self.queue.get(timeout=timeout)
+
+    def close(self) -> None:
+        """Stop receiving events."""
+        self.bus.unsubscribe(self)
+
+    def __iter__(self):
+        while True:
+            yield self.queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        import asyncio
+
+        return await asyncio.get_running_loop().run_in_executor(None, self.queue.get)
+
+
+class EventBus:
+    """Deliver events to all subscriptions."""
+
+    def __init__(self) -> None:
+        self.logger = logging.getLogger("xhaven_core.events")
+        self.lock = threading.Lock()
+        self.subscriptions = ()
+
+    @property
+    def active(self) -> bool:
+        return bool(self.subscriptions)
+
+    def subscribe(self, maxsize: int = 1000) -> Subscription:
+        subscription = Subscription(self, maxsize)
+        with self.lock:
+            self.subscriptions = self.subscriptions + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.lock:
+            self.subscriptions = tuple(
+                item for item in self.subscriptions if item is not subscription
+            )
+
+    def publish(self, events: list) -> None:
+        for event in events:
+            self.logger.debug("Event %s", event)
+            for subscription in self.subscriptions:
+                subscription.put(event)
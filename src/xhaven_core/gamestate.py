@@ -1,9 +1,11 @@
+import contextlib
 import logging
-import logging.handlers
-import json
 import threading
 
-from numpy import character
+from . import codec, conditions, endofround, events, history, validation
+from .codec import Entity, LazySection
+from .conditions import ConditionSet
+from .config import NameTables
 
 # Create a gamestate class that will hold all the information about the current gamestate.
 # - Method to update gamestate with a new gamestate from Frosthaven Application
@@ -11,25 +13,22 @@ from numpy import character
 # - Update monster information (health, conditions, and status)
 # - Send toastmessage to Frosthaven Application
 
-CONDITION = {
-    "s": 0, #Stun
-    "i": 1, #Immobilize
-    "d": 2, #Disarm
-    "w": 3, #Wound
-    "m": 5, #Muddle
-    "p": 6, #Poison
-    #"b": 10, #bane
-    "b": 11, #brittle
-    #"s": 16, #strengthen
-    #"i": 17, #invisible
-    #"r": 18, #regenerate
-    #"w": 19, #ward
-}
-    
-
-class GameState:
+
+class GameState(Entity):
     """Class to hold the gamestate information."""
 
+    _fields = Entity.schema(codec.GAMESTATE_SCHEMA, lazy=codec.LAZY_SECTIONS)
+
+    # Sections that are never changed here, they are kept as raw JSON from the
+    # last gamestate and only parsed when read, see codec.LAZY_SECTIONS
+    scenarioSpecialRules = LazySection()
+    currentAbilityDecks = LazySection()
+    modifierDeck = LazySection()
+    modifierDeckAllies = LazySection()
+    lootDeck = LazySection()
+    unlockedClasses = LazySection()
+    elementState = LazySection()
+
     def __init__(self, character_names: dict, monster_names: dict) -> None:
         self.logger = logging.getLogger("xhaven_core.gamestate.gamestate")
         self.logger.setLevel(logging.DEBUG)
@@ -43,11 +42,18 @@ class GameState:
         self.logger.info("Starting gamestate...")
 
         self.index: int = -1
+        # Index of the last gamestate accepted from the app, the indexes after
+        # it up to index are local updates the app has not echoed yet
+        self.received_index: int = -1
+        # Echoes of older local updates that were ignored, see _is_stale_echo
+        self.echoes_ignored = 0
         self.description = ""
-        self.lock = threading.Lock()
+        # Reentrant, so a batch can hold it while the update methods take it
+        self.lock = threading.RLock()
 
-        self.character_names = character_names
-        self.monster_names = monster_names
+        # Spoken names, shared with all characters and monsters and replaced
+        # in place when the configuration is reloaded, see config.py
+        self.names = NameTables(character_names, monster_names)
 
         # Initialize all the gamestate variables
         self.characters = []
@@ -72,7 +78,45 @@ class GameState:
 
         # Client Network is set to None by default
         # It is set to the client network class when the client network is initialized
-        self.client_network: None
+        self.client_network = None
+
+        # Change events, see subscribe. The summary of the last published state
+        # is only kept while there are subscribers
+        self.events = events.EventBus()
+        self._event_snapshot = None
+
+        # Undo and redo of local changes, see history.py
+        # The change being recorded by the current update method
+        self.history = history.History()
+        self._change = None
+
+        # Updates made inside batch() are collected in _batch_change and sent
+        # once when the outermost batch ends
+        self._batch_depth = 0
+        self._batch_change = None
+        self._batch_pending = False
+
+        # Immutable snapshot for readers that must not take the lock, it is only
+        # built when snapshots are served, see serve_snapshots
+        self.snapshot = None
+        self._snapshot_builder = None
+        self._snapshot_version = 0
+
+        # Apply wound, regenerate and condition expiry when the app starts a
+        # new round, see endofround.py. Off by default, end_round does it on
+        # command
+        self.auto_end_of_round = False
+
+        # Optional columnar record of every change for analytics after the
+        # session, see record_timeline
+        self.timeline = None
+
+        # Optional local snapshot for a warm start after a restart. While a
+        # restored gamestate is not confirmed by the app, warm_index is its
+        # index and local updates are held back, see warmstart.py
+        self.warm_start = None
+        self.warm_index = None
+        self._warm_updates = False
 
         self.logger.info("Init of GameState done")
 
@@ -87,29 +131,15 @@ class GameState:
         # The incoming message is in the following format:
         # S3nD:Index:0Description::Testing DescriptionGameState:{}[EOM]
         # Where {} is the gamestate in JSON format
-        # The message is split into three parts:
-        # 1. Index:
-        # 2. Description:
-        # 3. GameState:
-        # The incoming message is in bytes, so it needs to be decoded to strings
+        # The envelope is checked by validation.split_frame, which raises
+        # FrameError for a malformed or truncated message
         self.logger.debug(
             "Received new gamestate message to decode",
             extra={"raw_gamestate_message": raw_gamestate_message},
         )
-        if not b"GameState:" in raw_gamestate_message:
-            raise ValueError("Invalid gamestate message, does not contain GameState:")
-
-        gamestate_index = int(
-            raw_gamestate_message.split(b"Index:")[1].split(b"Description:")[0]
-        )
-        gamestate_description = bytes(
-            raw_gamestate_message.split(b"Description:")[1].split(b"GameState:")[0]
+        gamestate_index, gamestate_description, gamestate_data = (
+            validation.split_frame(bytes(raw_gamestate_message))
         )
-        gamestate_description = gamestate_description.decode("utf-8")
-        gamestate_data = bytes(
-            raw_gamestate_message.split(b"GameState:")[1].split(b"[EOM]")[0]
-        )
-        gamestate_data = gamestate_data.decode("utf-8")
 
         # Log the decoded gamestate message
         self.logger.debug("Decoded gamestate message. Index: %s", gamestate_index)
@@ -142,77 +172,99 @@ class GameState:
         return encodexd_gamestate_message
 
     def set_gamestate(self, raw_gamestate_message: bytes) -> None:
-        """Method to set the gamestate from Frosthaven Application."""
+        """Method to set the gamestate from Frosthaven Application.
+
+        The message is decoded and validated before anything is changed, an
+        invalid message raises validation.FrameError and the current gamestate
+        is kept.
+        """
         # Method to set the gamestate from Frosthaven Application
         # This method is called from the network class when a new gamestate is received
         # If the index is equal to the index of the current gamestate, the update from the
         # speech recognition system is invalid and should be ignored (race condition)
+        self.logger.info(
+            "Received new gamestate message",
+            extra={"gamestate": raw_gamestate_message},
+        )
+        [new_index, new_description, new_gamestate] = self._decode_gamestate(
+            raw_gamestate_message
+        )
+        try:
+            sections = codec.loads_sections(new_gamestate)
+        except ValueError as error:
+            raise validation.FrameError(
+                "GameState is not valid JSON: %s" % error
+            ) from None
+        validation.check_gamestate(sections)
+
+        # Create objects for all characters and monsters in currentList
+        current_list = []
+        monster_nr = 1
+        character_nr = 1
+        try:
+            for item in sections["currentList"]:
+                if "characterState" in item:
+                    current_list.append(
+                        Characters(item, names=self.names, character_nr=character_nr)
+                    )
+                    character_nr += 1
+                    self.logger.debug("Character %s created, nr %s", item.get("characterClass"), character_nr)
+                elif "monsterInstances" in item:
+                    current_list.append(
+                        Monsters(item, names=self.names, monster_nr=monster_nr)
+                    )
+                    monster_nr += 1
+                    self.logger.debug("Monster %s created, nr %s", item.get("type") , monster_nr)
+                else:
+                    self.logger.error("Unknown item in currentList")
+        except (TypeError, ValueError) as error:
+            raise validation.FrameError(
+                "currentList is not valid: %s" % error
+            ) from None
 
         with self.lock:  # Acquire the lock before modifying the gamestate
-            # Decode the gamestate message
-            self.logger.info(
-                "Received new gamestate message",
-                extra={"gamestate": raw_gamestate_message},
-            )
-            [new_index, new_description, new_gamestate] = self._decode_gamestate(
-                raw_gamestate_message
-            )
+            reconciled = self.warm_index is not None
+            if reconciled and not self._reconcile(new_index):
+                return
+
+            if self._is_stale_echo(new_index):
+                self.echoes_ignored += 1
+                self.logger.info(
+                    "Ignoring echo of gamestate %s, %s is newer", new_index, self.index
+                )
+                return
 
             # If index is equal to the index of the current gamestate, the update from the
             # speech recognition is wrong and an error should be logged (race condition)
-            if self.index == new_index:
+            # The app confirming a restored gamestate has its index too
+            if self.index == new_index and not reconciled:
                 self.logger.error("Gamestate update is invalid, index not updated")
 
+            previous_round = self.round if self.index != -1 else None
+            previous_index = self.index
             self.index = new_index
+            self.received_index = new_index
             self.logger.info("Index updated to %s", new_index)
             self.description = new_description
 
-            # Update all the gamestate variables
-            gamestate_dict = json.loads(new_gamestate)
-
-            self.level = gamestate_dict.get("level")
-            self.solo = gamestate_dict.get("solo")
-            self.roundState = gamestate_dict.get("roundState")
-            self.round = gamestate_dict.get("round")
-            self.scenario = gamestate_dict.get("scenario")
-            self.toastMessage = gamestate_dict.get("toastMessage")
-            self.scenarioSpecialRules = gamestate_dict.get("scenarioSpecialRules")
-            self.scenarioSectionsAdded = gamestate_dict.get("scenarioSectionsAdded")
-            self.currentCampaign = gamestate_dict.get("currentCampaign")
-            #self.currentList = gamestate_dict.get("currentList")
-            self.currentAbilityDecks = gamestate_dict.get("currentAbilityDecks")
-            self.modifierDeck = gamestate_dict.get("modifierDeck")
-            self.modifierDeckAllies = gamestate_dict.get("modifierDeckAllies")
-            self.lootDeck = gamestate_dict.get("lootDeck")
-            self.unlockedClasses = gamestate_dict.get("unlockedClasses")
-            self.showAllyDeck = gamestate_dict.get("showAllyDeck")
-            self.elementState = gamestate_dict.get("elementState")
-
-            # Create lists for characters and monsters
-            self.currentList = []
-
-            # Loop through all characters and monsters in currentList and create objects for them
-            monster_nr = 1
-            character_nr = 1
-            for item in gamestate_dict.get("currentList"):
-                if "characterState" in item:
-                    self.currentList.append(
-                        Characters(item, character_names=self.character_names, character_nr=character_nr)
-                    )
-                    character_nr += 1
-                    self.logger.debug("Character %s created, nr %s", item.get("characterClass"), character_nr)
-                elif "monsterInstances" in item:
-                    self.currentList.append(
-                        Monsters(
-                            item,
-                            monster_names=self.monster_names,
-                            monster_nr=monster_nr,
-                        )
-                    )
-                    monster_nr += 1
-                    self.logger.debug("Monster %s created, nr %s", item.get("type") , monster_nr)
-                else:
-                    self.logger.error("Unknown item in currentList")
+            # Update all the gamestate variables, see codec.GAMESTATE_SCHEMA
+            self.decode(sections)
+            self.currentList = current_list
+
+            self._publish_events()
+            self._publish_snapshot()
+            # The echo of a gamestate sent from here was recorded when it was sent
+            if self.index != previous_index:
+                self._record_timeline()
+            self._save_warm_start()
+
+            if (
+                self.auto_end_of_round
+                and previous_round is not None
+                and self.round > previous_round
+            ):
+                self.logger.info("Round %s started", self.round)
+                self._end_round()
 
             # Compare tmp with output from get_gamestate and assert critical error if they are not equal
             # DOES NOT WORK
@@ -223,38 +275,14 @@ class GameState:
         """Method to get the gamestate in binary format to be sent to the Frosthaven Application."""
         # Method get the gamestate in binary format
         # to be sent to the Frosthaven Application
-        new_currentList = []
-        for item in self.currentList:
-            if item.__class__.__name__ == "Characters":
-                new_currentList.append(item.get_character())
-            else:
-                new_currentList.append(item.get_monster())
-
-        gamestate_dict = {
-            "level": self.level,
-            "solo": self.solo,
-            "roundState": self.roundState,
-            "round": self.round,
-            "scenario": self.scenario,
-            "toastMessage": self.toastMessage,
-            "scenarioSpecialRules": self.scenarioSpecialRules,
-            "scenarioSectionsAdded": self.scenarioSectionsAdded,
-            "currentCampaign": self.currentCampaign,
-            "currentList": new_currentList,
-            "currentAbilityDecks": self.currentAbilityDecks,
-            "modifierDeck": self.modifierDeck,
-            "modifierDeckAllies": self.modifierDeckAllies,
-            "lootDeck": self.lootDeck,
-            "unlockedClasses": self.unlockedClasses,
-            "showAllyDeck": self.showAllyDeck,
-            "elementState": self.elementState,
-        }
+        # Characters and monsters in currentList are encoded through their schema
+        gamestate_dict = self.encode()
 
         # Encode the gamestate message before returning it
         self.logger.debug(
             "Returning gamestate message", extra={"gamestate": gamestate_dict}
         )
-        return json.dumps(gamestate_dict)
+        return codec.dumps_sections(gamestate_dict)
 
     # ----------------------------------------------
     # Update methods
@@ -272,6 +300,9 @@ class GameState:
                 "Trying to update initiative for %s%s to %s", index, name, initiative
             )
             found_character_id = None
+            # Exact spoken name or id from the name tables
+            alias_id = self.names.find_character(name) if name else None
+            self._change = history.Change()
 
             for item in self.currentList:
                 if item.__class__.__name__ == "Characters":
@@ -282,14 +313,24 @@ class GameState:
                     if index != 0:
                         if item.character_nr == index:
                             found_character_id = item.id
-                            item.characterState.initiative = initiative
-                    elif (
+                            self._record(
+                                ("character", item.id),
+                                item.characterState,
+                                "initiative",
+                                initiative,
+                            )
+                    elif item.id == alias_id or (
                         name.lower() in item.id.lower()
                         or name.lower() in item.characterState.display.lower()
                         or name.lower() in item.name.lower()
                     ):
-                        found_character_id = character.id
-                        item.characterState.initiative = initiative
+                        found_character_id = item.id
+                        self._record(
+                            ("character", item.id),
+                            item.characterState,
+                            "initiative",
+                            initiative,
+                        )
 
             # If the character is not found, log an error
             if found_character_id:
@@ -386,95 +427,135 @@ class GameState:
         self, index: int, standee_nr: int, health: int, relative: bool, condition: str = ""
     ) -> bool:
         """Method to update the health for a monster."""
-        # Loop through all monsters and check if the name matches the monster type
-        # then check if the instance matches the monster instance
-        # then change the health of the monster with the health_change
+        return self.update_monsters(
+            index=index,
+            standee_nrs=(standee_nr,),
+            health=health,
+            relative=relative,
+            condition=condition,
+        )
 
+    def update_monsters(
+        self,
+        index: int = 0,
+        name: str = "",
+        standee_nrs=None,
+        standee_type=None,
+        health: int = 0,
+        relative: bool = True,
+        condition: str = "",
+        all_groups: bool = False,
+    ) -> bool:
+        """Update the health and conditions of several standees as one change.
+
+        The monster group is given by index or by a spoken name or id from the
+        name tables, every group is only used with all_groups. standee_nrs
+        limits the standees to those numbers and standee_type to normal (0),
+        elite (1) or boss (2) standees, None means all. All standees are
+        updated in one pass and sent in one gamestate.
+        """
         # If the health becomes 0 or less, remove the monster instance
         # If the health becomes more than the maximum health, set the health to the maximum health
-        self.toastMessage = ""
+        found_condition = None
+        if condition != "":
+            found_condition = conditions.parse(condition)
+            if found_condition is None:
+                self.logger.error("Condition %s not found", condition)
         with self.lock:
+            monster_id = self.find_monster(name) if name else None
+            self.toastMessage = ""
             self.logger.debug(
-                "Trying to update monster index %s, standee %s, health %s",
+                "Trying to update monster %s%s, standees %s type %s, health %s",
                 index,
-                standee_nr,
+                name,
+                standee_nrs,
+                standee_type,
                 health,
             )
-            found_monster_type = None
-            found_standee_nr = 0
-            new_monster_health = 0
+            updated = []
+            self._change = history.Change()
             for item in self.currentList:
-                if item.__class__.__name__ == "Monsters":
-                    if index != 0:
-                        if item.monster_nr == index:
-                            found_monster_type = item.type
-                            for monster_instance in item.monster_instances:
-                                if monster_instance.standeeNr == standee_nr:
-                                    found_standee_nr = standee_nr
-                                    # First change condition if not empty
-                                    if condition != "":
-                                        if condition in CONDITION:
-                                            monster_instance.conditions.append(CONDITION[condition])
-                                        else:
-                                            self.logger.error("Condition %s not found", condition)
-                                    if relative:
-                                        monster_instance.health += health
-                                    else:
-                                        monster_instance.health = health
-                                        
-                                    if monster_instance.health <= 0:
-                                        item.monster_instances.remove(
-                                            monster_instance
-                                        )
-                                        self.logger.info(
-                                            "Monster %s nr %s killed",
-                                            item.type,
-                                            standee_nr,
-                                        )
-                                    elif (
-                                        monster_instance.health
-                                        > monster_instance.maxHealth
-                                    ):
-                                        monster_instance.health = (
-                                            monster_instance.maxHealth
-                                        )
-                                        self.logger.info(
-                                            "Monster %s nr %s health set to maximum",
-                                            item.type,
-                                            standee_nr,
-                                        )
-                                    else:
-                                        self.logger.info(
-                                            "Monster %s nr %s health changed to %s",
-                                            item.type,
-                                            standee_nr,
-                                            monster_instance.health,
-                                        )
-                                    new_monster_health = monster_instance.health
-                                    break
+                if item.__class__.__name__ != "Monsters":
+                    continue
+                if index != 0:
+                    if item.monster_nr != index:
+                        continue
+                elif not all_groups and item.id != monster_id:
+                    continue
+                # Killed standees are removed from the list while looping
+                for monster_instance in list(item.monster_instances):
+                    standee_nr = monster_instance.standeeNr
+                    if standee_nrs is not None and standee_nr not in standee_nrs:
+                        continue
+                    if standee_type is not None and monster_instance.type != standee_type:
+                        continue
+                    address = ("standee", item.id, standee_nr)
+                    # First change condition if given
+                    if found_condition is not None:
+                        self._record(
+                            address,
+                            monster_instance,
+                            "conditions",
+                            monster_instance.conditions.with_condition(found_condition),
+                        )
+                    if relative:
+                        monster_health = monster_instance.health + health
+                    else:
+                        monster_health = health
+                    at_maximum = monster_health > monster_instance.maxHealth
+                    if at_maximum:
+                        monster_health = monster_instance.maxHealth
+                    self._record(address, monster_instance, "health", monster_health)
+
+                    if monster_instance.health <= 0:
+                        self._remove_standee(item, monster_instance)
+                        self.logger.info("Monster %s nr %s killed", item.type, standee_nr)
+                    elif at_maximum:
+                        self.logger.info(
+                            "Monster %s nr %s health set to maximum",
+                            item.type,
+                            standee_nr,
+                        )
+                    else:
+                        self.logger.info(
+                            "Monster %s nr %s health changed to %s",
+                            item.type,
+                            standee_nr,
+                            monster_instance.health,
+                        )
+                    updated.append((item.type, standee_nr, monster_instance.health))
 
+            # If no standee is found, log an error
+            if not updated:
+                self.logger.error(
+                    "Monster %s%s with standees %s not found", index, name, standee_nrs
+                )
+                return False
 
-            # If the monster is not found, log an error
-            if found_monster_type and found_standee_nr != 0:
-                # If the monster is found, update the gamestate and send it to the Frosthaven Application
-                self.description = "Monster %s nr %s health changed to %s" % (
-                    found_monster_type,
-                    found_standee_nr,
-                    new_monster_health,
+            # Update the gamestate and send it to the Frosthaven Application once
+            if len(updated) == 1:
+                self.description = "Monster %s nr %s health changed to %s" % updated[0]
+            else:
+                self.description = "Monsters changed: %s" % ", ".join(
+                    "%s nr %s health %s" % standee for standee in updated
                 )
-                self._update_client_network()
-                return True
-            self.logger.error("Monster %s with instance %s not found", type, standee_nr)
-            return False
+            self._update_client_network()
+            return True
 
     def update_monster_condition(
-        self, monster_type: str, standee_nr: int, condition: str, add: bool
+        self, monster_type: str, standee_nr: int, condition, add: bool
     ) -> bool:
-        # Loop through all monsters and check if the name matches the monster type
+        # Loop through all monsters and check if the monster has the id found for
+        # the name, see find_monster
         # then check if the instance matches the monster instance
         # then change the condition of the monster with the condition_change
         # If add is True, add the condition to the monster
         # If add is False, remove the condition from the monster
+        # condition is a condition id, name or shortcut, see conditions.py
+        found_condition = conditions.parse(condition)
+        if found_condition is None:
+            self.logger.error("Condition %s not found", condition)
+            return False
 
         with self.lock:
             self.logger.debug(
@@ -485,20 +566,31 @@ class GameState:
             )
             found_monster_type = None
             found_standee_nr = 0
-            for monster in self.monsters:
-                if (
-                    monster_type in monster.type
-                    or monster_type in monster.short_name
-                    or monster_type in monster.name
-                ):
+            self._change = history.Change()
+            monster_id = self.find_monster(monster_type)
+            for monster in self.currentList:
+                if monster.__class__.__name__ != "Monsters":
+                    continue
+                if monster.id == monster_id:
                     found_monster_type = monster.type
                     for monster_instance in monster.monster_instances:
                         if monster_instance.standeeNr == standee_nr:
                             found_standee_nr = standee_nr
+                            # Adding a condition twice or removing a missing
+                            # condition leaves the set unchanged
+                            current = monster_instance.conditions
                             if add:
-                                monster_instance.conditions.append(condition)
+                                new_conditions = current.with_condition(found_condition)
                             else:
-                                monster_instance.conditions.remove(condition)
+                                new_conditions = current.without_condition(
+                                    found_condition
+                                )
+                            self._record(
+                                ("standee", monster.id, standee_nr),
+                                monster_instance,
+                                "conditions",
+                                new_conditions,
+                            )
                             self.logger.info(
                                 "Monster %s nr %s conditions changed to %s",
                                 monster.type,
@@ -513,14 +605,14 @@ class GameState:
                 self.description = "Monster %s nr %s conditions changed to %s" % (
                     found_monster_type,
                     found_standee_nr,
-                    condition,
+                    found_condition.name.lower(),
                 )
                 self._update_client_network()
                 return True
             else:
                 self.logger.error(
                     "Monster %s with instance %s not found",
-                    type,
+                    monster_type,
                     standee_nr,
                 )
                 return False
@@ -537,7 +629,24 @@ class GameState:
         # Method to update the client network with the new gamestate
         # This method is called when a variable in the gamestate class is updated
         # The client network will then send the new gamestate to the Frosthaven Application
-        if self.client_network:
+        if self._batch_depth:
+            # Sent by batch when it ends
+            if self._change:
+                self._batch_change.extend(self._change)
+            self._change = None
+            self._batch_pending = True
+            return
+
+        if self._change:
+            # Keep the deltas of the update for undo
+            self._change.description = self.description
+            self.history.record(self._change)
+        self._change = None
+
+        if self.warm_index is not None:
+            # Sent when the app confirms the restored gamestate, see _reconcile
+            self._warm_updates = True
+        elif self.client_network:
             self.index += 1
             new_gamestate = self._encode_gamestate(
                 self.index,
@@ -545,6 +654,303 @@ class GameState:
                 self.get_gamestate(),
             )
             self.client_network.send_data(new_gamestate)
+        self._publish_events()
+        self._publish_snapshot()
+        self._record_timeline()
+        self._save_warm_start()
+
+    @contextlib.contextmanager
+    def batch(self, description: str = ""):
+        """Send all updates made in the with block as one gamestate and one undo step.
+
+        The lock is held for the whole block, a gamestate from the app or an
+        update from another thread waits until the batch is sent. Batches can
+        be nested, only the outermost one sends.
+
+            with game_state.batch("Commands"):
+                game_state.update_monster(1, 2, -3, True)
+                game_state.update_initiative(index=1, initiative=20)
+        """
+        with self.lock:
+            self._batch_depth += 1
+            if self._batch_depth == 1:
+                self._batch_change = history.Change()
+                self._batch_pending = False
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    pending = self._batch_pending
+                    self._change = self._batch_change
+                    self._batch_change = None
+                    self._batch_pending = False
+                    if pending:
+                        if description:
+                            self.description = description
+                        self._update_client_network()
+                    else:
+                        self._change = None
+
+    def end_round(self) -> bool:
+        """Apply the end of round effects to all characters and standees at once."""
+        with self.lock:
+            return self._end_round()
+
+    def _end_round(self) -> bool:
+        # Must be called with the lock held
+        self._change = history.Change()
+        changes = endofround.process(self)
+        if not changes:
+            self.logger.info("No end of round effects")
+            self._change = None
+            return False
+
+        killed = 0
+        for address, target, monster, health, new_conditions in changes:
+            self._record(address, target, "conditions", new_conditions)
+            if monster is None:
+                self._record(address, target, "health", max(health, 0))
+            else:
+                self._record(address, target, "health", health)
+                if health <= 0:
+                    self._remove_standee(monster, target)
+                    killed += 1
+        self.description = "End of round effects on %s figures, %s killed" % (
+            len(changes),
+            killed,
+        )
+        self.logger.info(self.description)
+        self._update_client_network()
+        return True
+
+    # ----------------------------------------------
+    # Undo and redo
+    # ----------------------------------------------
+    def undo(self) -> bool:
+        """Undo the last local change and send the result."""
+        with self.lock:
+            change = self.history.undo()
+            if change is None:
+                self.logger.info("Nothing to undo")
+                return False
+            self._apply_change(change, undo=True)
+            self.description = "Undo: %s" % change.description
+            self._change = None
+            self._update_client_network()
+            return True
+
+    def redo(self) -> bool:
+        """Redo the last undone change and send the result."""
+        with self.lock:
+            change = self.history.redo()
+            if change is None:
+                self.logger.info("Nothing to redo")
+                return False
+            self._apply_change(change, undo=False)
+            self.description = "Redo: %s" % change.description
+            self._change = None
+            self._update_client_network()
+            return True
+
+    def last_change(self):
+        """Return the change undo would undo, or None."""
+        with self.lock:
+            return self.history.undo_stack[-1] if self.history.undo_stack else None
+
+    def retract(self, change) -> bool:
+        """Undo change and forget it, only if it is still the last change.
+
+        Used for speculative updates, see speculation.py. Unlike undo the
+        change can not be redone.
+        """
+        with self.lock:
+            undo_stack = self.history.undo_stack
+            if not undo_stack or undo_stack[-1] is not change:
+                return False
+            self.history.undo()
+            self.history.drop_redo()
+            self._apply_change(change, undo=True)
+            self.description = "Retract: %s" % change.description
+            self._change = None
+            self._update_client_network()
+            return True
+
+    def _record(self, address: tuple, target, attribute: str, value) -> None:
+        # Set a field of a character state or monster instance and record the
+        # delta in the current change
+        old = getattr(target, attribute)
+        if old == value:
+            return
+        if self._change is not None:
+            self._change.set_field(address, attribute, old, value)
+        setattr(target, attribute, value)
+
+    def _remove_standee(self, monster, monster_instance) -> None:
+        # Remove a killed standee and record it in the current change
+        position = monster.monster_instances.index(monster_instance)
+        if self._change is not None:
+            self._change.remove_standee(
+                ("monster", monster.id), position, monster_instance.encode()
+            )
+        del monster.monster_instances[position]
+
+    def _resolve(self, address: tuple):
+        # Find the object for an address in the current gamestate, see history.py
+        kind = address[0]
+        for item in self.currentList:
+            if item.id != address[1]:
+                continue
+            if kind == "character" and item.__class__.__name__ == "Characters":
+                return item.characterState
+            if kind == "monster" and item.__class__.__name__ == "Monsters":
+                return item
+            if kind == "standee" and item.__class__.__name__ == "Monsters":
+                for monster_instance in item.monster_instances:
+                    if monster_instance.standeeNr == address[2]:
+                        return monster_instance
+        return None
+
+    def _apply_change(self, change, undo: bool) -> None:
+        # Apply the deltas of a change backwards (undo) or forwards (redo)
+        deltas = reversed(change.deltas) if undo else change.deltas
+        for delta in deltas:
+            target = self._resolve(delta[1])
+            if target is None:
+                self.logger.warning("Can not apply %s, %s is gone", delta[0], delta[1])
+                continue
+            if delta[0] == "field":
+                _, _, attribute, old, new = delta
+                value = old if undo else new
+                if type(value) is list:
+                    value = list(value)
+                setattr(target, attribute, value)
+            elif undo:
+                _, _, position, standee = delta
+                target.monster_instances.insert(
+                    position, Monsters.MonsterInstances(standee)
+                )
+            else:
+                standee_nr = delta[3]["standeeNr"]
+                target.monster_instances = [
+                    monster_instance
+                    for monster_instance in target.monster_instances
+                    if monster_instance.standeeNr != standee_nr
+                ]
+
+    # ----------------------------------------------
+    # Change events
+    # ----------------------------------------------
+    def subscribe(self, maxsize: int = 1000) -> events.Subscription:
+        """Subscribe to change events, see events.py."""
+        with self.lock:
+            if self._event_snapshot is None:
+                self._event_snapshot = events.snapshot(self)
+            return self.events.subscribe(maxsize)
+
+    def serve_snapshots(self, host: str = "127.0.0.1", port: int = 8765):
+        """Start a local HTTP server for snapshots and events, see snapshotserver.py."""
+        from . import snapshotserver
+
+        with self.lock:
+            self._snapshot_builder = snapshotserver.build_snapshot
+            self._publish_snapshot()
+        return snapshotserver.SnapshotServer(self, host, port)
+
+    def _publish_snapshot(self):
+        # Replace the snapshot read by the snapshot server, readers get either the
+        # old or the new snapshot and never see a half updated state
+        # Must be called with the lock held
+        if self._snapshot_builder is not None:
+            self._snapshot_version += 1
+            self.snapshot = self._snapshot_builder(self, self._snapshot_version)
+
+    def record_timeline(self, path: str, flush_rows: int = 100000):
+        """Record the figures after every change to path.<n>.npz, see timeline.py."""
+        from . import timeline
+
+        with self.lock:
+            if self.timeline is not None:
+                self.timeline.close()
+            self.timeline = timeline.TimelineRecorder(path, flush_rows)
+            self._record_timeline()
+        return self.timeline
+
+    def stop_timeline(self) -> None:
+        """Stop recording the timeline and write the remaining rows."""
+        with self.lock:
+            recorder = self.timeline
+            self.timeline = None
+            if recorder is not None:
+                recorder.close()
+
+    def _record_timeline(self):
+        # Must be called with the lock held
+        if self.timeline is not None:
+            self.timeline.record(self)
+
+    def restore(self, index: int, description: str, gamestate: str) -> None:
+        """Load a saved gamestate until the app sends its own, see warmstart.py.
+
+        Raises validation.FrameError if the gamestate is not valid.
+        """
+        self.set_gamestate(self._encode_gamestate(index, description, gamestate))
+        with self.lock:
+            self.warm_index = self.index
+            self._warm_updates = False
+
+    def _is_stale_echo(self, new_index: int) -> bool:
+        # The app echoes every gamestate it gets. Indexes after the last
+        # gamestate accepted from the app up to the current index are local
+        # updates, the echo of an older one would undo the updates made after
+        # it. Gamestates from the app above the current index are accepted.
+        # Must be called with the lock held
+        return self.received_index < new_index < self.index
+
+    def _reconcile(self, new_index: int) -> bool:
+        # First gamestate from the app after restore, returns False if the
+        # local state is kept instead of the gamestate from the app
+        # Must be called with the lock held
+        warm_index, self.warm_index = self.warm_index, None
+        updates, self._warm_updates = self._warm_updates, False
+        if new_index == warm_index:
+            self.logger.info("The app is at the restored gamestate %s", new_index)
+            if updates:
+                # Send the updates that were made on the restored gamestate
+                self.received_index = new_index
+                self._update_client_network()
+                return False
+        elif updates:
+            self.logger.warning(
+                "The app is at gamestate %s instead of %s, the updates made on "
+                "the restored gamestate are discarded",
+                new_index,
+                warm_index,
+            )
+            self.history.clear()
+        else:
+            self.logger.info(
+                "The app is at gamestate %s instead of %s", new_index, warm_index
+            )
+        return True
+
+    def _save_warm_start(self):
+        # Must be called with the lock held
+        if self.warm_start is not None and self.warm_index is None:
+            self.warm_start.changed()
+
+    def _publish_events(self):
+        # Compute the events for the last change once and publish them to all subscribers
+        # Must be called with the lock held
+        if not self.events.active:
+            self._event_snapshot = None
+            return
+        new_snapshot = events.snapshot(self)
+        if self._event_snapshot is not None:
+            self.events.publish(
+                events.diff(self.index, self._event_snapshot, new_snapshot)
+            )
+        self._event_snapshot = new_snapshot
 
     # ----------------------------------------------
     # Get data methods
@@ -605,6 +1011,22 @@ class GameState:
                     )
         return monster_list
 
+    def find_monster(self, name: str):
+        """Return the monster id for a spoken name or id, or None.
+
+        The name tables are tried first, then the ids of the monsters in
+        currentList, so monsters that are not in the configuration can still
+        be targeted. Both are exact matches that ignore case.
+        """
+        monster_id = self.names.find_monster(name)
+        if monster_id is not None:
+            return monster_id
+        name = name.lower()
+        for item in self.currentList:
+            if item.__class__.__name__ == "Monsters" and item.id.lower() == name:
+                return item.id
+        return None
+
     def get_monster_index(self) -> dict:
         """Method to get the monster names from the gamestate."""
         monster_list = {}
@@ -615,166 +1037,83 @@ class GameState:
         return monster_list
 
 
-class Characters:
+class Characters(Entity):
     """Class to hold the character information."""
 
-    def __init__(self, character_dict, character_names: dict, character_nr: int) -> None:
-        # Method to set the character information for each character
-        self.logger = logging.getLogger("xhaven_core.gamestate.characters")
-        self.logger.setLevel(logging.INFO)
+    _fields = Entity.schema(codec.CHARACTER_SCHEMA)
 
-        file_handler = logging.FileHandler("xhaven_speech.log")
-        file_handler.setLevel(logging.DEBUG)  # Set the level of this handler
+    # Loggers are shared by all characters, they are created for every gamestate update
+    logger = logging.getLogger("xhaven_core.gamestate.characters")
+    logger.setLevel(logging.INFO)
 
-        self.id = character_dict.get("id")
-        self.turnState = character_dict.get("turnState")
-        self.characterState = self._CharacterState(character_dict.get("characterState"))
-        self.characterClass = character_dict.get("characterClass")
-        self.name = ""
+    def __init__(self, character_dict, names: NameTables, character_nr: int) -> None:
+        # Method to set the character information for each character
+        self.decode(character_dict)
+        self.characterState = self._CharacterState(self.characterState)
 
         self.logger.debug("Character %s created", self.characterClass)
 
         # Additional name for character, used for speech recognition and read from parameters file
         self.character_nr = character_nr
-        
-        if self.id in character_names:
-            self.logger.debug(
-                "Character %s has name %s", self.id, character_names[self.id]
-            )
-            self.name = character_names[self.id]
-        else:
-            self.name = ""
+        self.names = names
+
+    @property
+    def name(self) -> str:
+        """Spoken name of the character from the shared name tables."""
+        return self.names.character_name(self.id)
 
     def get_character(self):
         """Method to get the character information from the gamestate."""
-        character_dict = {
-            "id": self.id,
-            "turnState": self.turnState,
-            "characterState": self.characterState.get_characterstate(),
-            "characterClass": self.characterClass,
-        }
-        return character_dict
-
-    class _CharacterState:
+        return self.encode()
+
+    class _CharacterState(Entity):
+        _fields = Entity.schema(codec.CHARACTER_STATE_SCHEMA)
+
         def __init__(self, character_state_dict):
-            self.initiative = character_state_dict.get("initiative")
-            self.health = character_state_dict.get("health")
-            self.maxHealth = character_state_dict.get("maxHealth")
-            self.level = character_state_dict.get("level")
-            self.xp = character_state_dict.get("xp")
-            self.chill = character_state_dict.get("chill")
-            self.display = character_state_dict.get("display")
-            self.summonList = character_state_dict.get("summonList")
-            self.conditions = character_state_dict.get("conditions")
-            self.conditionsAddedThisTurn = character_state_dict.get(
-                "conditionsAddedThisTurn"
-            )
-            self.conditionsAddedPreviousTurn = character_state_dict.get(
-                "conditionsAddedPreviousTurn"
-            )
+            self.decode(character_state_dict)
+            self.conditions = ConditionSet.from_list(self.conditions)
 
         def get_characterstate(self):
             """Method to get the character state from the gamestate."""
-            character_state_dict = {
-                "initiative": self.initiative,
-                "health": self.health,
-                "maxHealth": self.maxHealth,
-                "level": self.level,
-                "xp": self.xp,
-                "chill": self.chill,
-                "display": self.display,
-                "summonList": self.summonList,
-                "conditions": self.conditions,
-                "conditionsAddedThisTurn": self.conditionsAddedThisTurn,
-                "conditionsAddedPreviousTurn": self.conditionsAddedPreviousTurn,
-            }
-            return character_state_dict
-
-
-class Monsters:
-    def __init__(self, monster_dict, monster_names, monster_nr) -> None:
-        self.logger = logging.getLogger("xhaven_core.gamestate.monsters")
-        self.logger.setLevel(logging.INFO)
+            return self.encode()
 
-        file_handler = logging.FileHandler("xhaven_speech.log")
-        file_handler.setLevel(logging.DEBUG)  # Set the level of this handler
-
-        self.monster_instances = []
-        self.id = monster_dict.get("id")
-        self.turnState = monster_dict.get("turnState")
-        self.isActive = monster_dict.get("isActive")
-        self.type = monster_dict.get("type")
-        for monster in monster_dict.get("monsterInstances"):
-            self.monster_instances.append(self.MonsterInstances(monster))
-        self.isAlly = monster_dict.get("isAlly")
-        self.level = monster_dict.get("level")
+
+class Monsters(Entity):
+    _fields = Entity.schema(codec.MONSTER_SCHEMA)
+
+    # Loggers are shared by all monsters, they are created for every gamestate update
+    logger = logging.getLogger("xhaven_core.gamestate.monsters")
+    logger.setLevel(logging.INFO)
+
+    def __init__(self, monster_dict, names: NameTables, monster_nr) -> None:
+        self.decode(monster_dict)
+        self.monster_instances = [
+            self.MonsterInstances(monster) for monster in self.monster_instances or []
+        ]
 
         # These parameters have been added to make it easier for speech recognition
         self.monster_nr = monster_nr
-        try:
-            self.name = monster_names[self.id]
-            self.logger.debug("Monster %s has name %s", self.id, self.name)
-        except KeyError:
-            pass
+        self.names = names
 
         self.logger.debug("Monster %s created", self.type)
 
+    @property
+    def name(self) -> str:
+        """Spoken name of the monster from the shared name tables."""
+        return self.names.monster_name(self.id)
+
     def get_monster(self):
-        _monster_instances = []
-        for monster in self.monster_instances:
-            _monster_instances.append(monster.get_monsterinstances())
-        monster_dict = {
-            "id": self.id,
-            "turnState": self.turnState,
-            "isActive": self.isActive,
-            "type": self.type,
-            "monsterInstances": _monster_instances,  # List of MonsterInstances
-            "isAlly": self.isAlly,
-            "level": self.level,
-        }
-        return monster_dict
-
-    class MonsterInstances:
+        return self.encode()
+
+    class MonsterInstances(Entity):
         """Class to hold the monster instance information."""
 
+        _fields = Entity.schema(codec.MONSTER_INSTANCE_SCHEMA)
+
         def __init__(self, monster_instances_dict):
-            self.health = monster_instances_dict.get("health")
-            self.maxHealth = monster_instances_dict.get("maxHealth")
-            self.level = monster_instances_dict.get("level")
-            self.standeeNr = monster_instances_dict.get("standeeNr")
-            self.move = monster_instances_dict.get("move")
-            self.attack = monster_instances_dict.get("attack")
-            self.range = monster_instances_dict.get("range")
-            self.name = monster_instances_dict.get("name")
-            self.gfx = monster_instances_dict.get("gfx")
-            self.roundSummoned = monster_instances_dict.get("roundSummoned")
-            self.type = monster_instances_dict.get("type")
-            self.chill = monster_instances_dict.get("chill")
-            self.conditions = monster_instances_dict.get("conditions")
-            self.conditionsAddedThisTurn = monster_instances_dict.get(
-                "conditionsAddedThisTurn"
-            )
-            self.conditionsAddedPreviousTurn = monster_instances_dict.get(
-                "conditionsAddedPreviousTurn"
-            )
+            self.decode(monster_instances_dict)
+            self.conditions = ConditionSet.from_list(self.conditions)
 
         def get_monsterinstances(self):
             """Method to get the monster instance information from the gamestate."""
-            monster_instances_dict = {
-                "health": self.health,
-                "maxHealth": self.maxHealth,
-                "level": self.level,
-                "standeeNr": self.standeeNr,
-                "move": self.move,
-                "attack": self.attack,
-                "range": self.range,
-                "name": self.name,
-                "gfx": self.gfx,
-                "roundSummoned": self.roundSummoned,
-                "type": self.type,
-                "chill": self.chill,
-                "conditions": self.conditions,
-                "conditionsAddedThisTurn": self.conditionsAddedThisTurn,
-                "conditionsAddedPreviousTurn": self.conditionsAddedPreviousTurn,
-            }
-            return monster_instances_dict
+            return self.encode()
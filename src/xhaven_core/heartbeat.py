@@ -0,0 +1,206 @@
+"""
+Heartbeat latency statistics and stall detection.
+
+The X-Haven app sends S3nD:ping[EOM] regularly and echoes every gamestate it
+receives back to all clients. The client network reports these moments to a
+Heartbeat, which keeps rolling statistics of
+
+    ping_interval   time between two pings from the app
+    turnaround      time from receiving a ping to sending the pong
+    echo            time from sending a gamestate until the app sends a
+                    gamestate with that index or a newer one
+
+and checks them once a second. A table is stalled when no ping arrived for
+ping_timeout seconds, when a sent gamestate was not echoed within
+echo_timeout seconds, or when a pong took longer than turnaround_limit. A
+stall is logged and passed to on_stall once when it starts, and logged again
+when the table recovers. xhaven_speech.py and the hub play STALL_SOUND from
+on_stall.
+
+Missing pings and a slow echo together point to a hung app or a broken
+network. A slow echo with regular pings points to the app being busy.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+STALL_SOUND = "stall.wav"
+
+
+class LatencyStats:
+    """Rolling statistics over the last window samples, in seconds."""
+
+    def __init__(self, window: int = 100) -> None:
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.count += 1
+
+    @property
+    def last(self):
+        return self.samples[-1] if self.samples else None
+
+    def summary(self) -> dict:
+        """Return the count and the last, mean, median, 95th percentile and max."""
+        if not self.samples:
+            return {"count": self.count}
+        ordered = sorted(self.samples)
+        return {
+            "count": self.count,
+            "last": self.samples[-1],
+            "mean": sum(ordered) / len(ordered),
+            "p50": ordered[len(ordered) // 2],
+            "p95": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+            "max": ordered[-1],
+        }
+
+
+class Heartbeat:
+    """Time the pings, pongs and gamestate echoes of one connection."""
+
+    def __init__(
+        self,
+        ping_timeout: float = 15.0,
+        echo_timeout: float = 5.0,
+        turnaround_limit: float = 0.5,
+        on_stall=None,
+        check_interval: float = 1.0,
+        logger=None,
+    ) -> None:
+        self.logger = logger or logging.getLogger("xhaven_core.heartbeat")
+        self.ping_timeout = ping_timeout
+        self.echo_timeout = echo_timeout
+        self.turnaround_limit = turnaround_limit
+        # Called with the message when a stall starts
+        self.on_stall = on_stall
+        self.check_interval = check_interval
+
+        self.lock = threading.Lock()
+        self.ping_interval = LatencyStats()
+        self.turnaround = LatencyStats()
+        self.echo = LatencyStats()
+        self.reset()
+
+        self.stalls = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def reset(self) -> None:
+        """Forget the current connection, called when connecting."""
+        with self.lock:
+            self.started = time.monotonic()
+            self.last_ping = None
+            self.slow_pong = None
+            # Index -> time it was sent, waiting for the echo
+            self.pending = {}
+            self.stalled = set()
+
+    def ping_received(self, now: float = None) -> None:
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.last_ping is not None:
+                self.ping_interval.add(now - self.last_ping)
+            self.last_ping = now
+
+    def pong_sent(self, received: float, now: float = None) -> None:
+        """Record the pong for the ping that was received at received."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.turnaround.add(now - received)
+            if now - received > self.turnaround_limit:
+                self.slow_pong = now - received
+
+    def gamestate_sent(self, index: int, now: float = None) -> None:
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.pending[index] = now
+
+    def gamestate_received(self, index: int, now: float = None) -> None:
+        """A gamestate with index echoes every sent gamestate up to that index."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            echoed = [sent for sent in self.pending if sent <= index]
+            for sent in echoed:
+                self.echo.add(now - self.pending.pop(sent))
+
+    def check(self, now: float = None) -> set:
+        """Check the thresholds, returns the reasons the connection is stalled.
+
+        A reason is reported once when it starts.
+        """
+        now = time.monotonic() if now is None else now
+        reasons = {}
+        with self.lock:
+            since_ping = now - (
+                self.last_ping if self.last_ping is not None else self.started
+            )
+            if since_ping > self.ping_timeout:
+                reasons["ping"] = "No ping from the app for %.1f s" % since_ping
+            if self.pending:
+                waiting = now - min(self.pending.values())
+                if waiting > self.echo_timeout:
+                    reasons["echo"] = "Gamestate not echoed by the app for %.1f s" % (
+                        waiting
+                    )
+            if self.slow_pong is not None:
+                reasons["turnaround"] = "Pong sent %.2f s after the ping" % (
+                    self.slow_pong
+                )
+                self.slow_pong = None
+
+            new = set(reasons) - self.stalled
+            recovered = self.stalled - set(reasons)
+            # A slow pong is a single event, it does not keep the stall going
+            self.stalled = set(reasons) - {"turnaround"}
+            self.stalls += len(new)
+
+        for reason in recovered:
+            if reason != "turnaround":
+                self.logger.info("Connection recovered from %s stall", reason)
+        for reason in sorted(new):
+            self.alarm(reasons[reason])
+        return set(reasons)
+
+    def alarm(self, message: str) -> None:
+        self.logger.warning("Stall: %s", message)
+        if self.on_stall:
+            try:
+                self.on_stall(message)
+            except Exception:
+                self.logger.exception("Stall callback failed")
+
+    def start(self) -> None:
+        """Check the thresholds every check_interval seconds on a thread."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+        self.thread.start()
+
+    def _watch(self) -> None:
+        while not self.stopped.wait(self.check_interval):
+            self.check()
+
+    def stop(self) -> None:
+        """Stop checking, waits for the thread so a restart never runs two."""
+        self.stopped.set()
+        thread, self.thread = self.thread, None
+        # on_stall may disconnect, which stops the heartbeat from its own thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def summary(self) -> dict:
+        """Return the latency statistics and the stall state, for the metrics."""
+        with self.lock:
+            return {
+                "ping_interval": self.ping_interval.summary(),
+                "turnaround": self.turnaround.summary(),
+                "echo": self.echo.summary(),
+                "waiting_for_echo": len(self.pending),
+                "stalled": sorted(self.stalled),
+                "stalls": self.stalls,
+            }
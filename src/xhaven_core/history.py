@@ -0,0 +1,104 @@
+"""
+Undo and redo for the local changes made to the GameState.
+
+Every update_* method records the fields it changes as deltas in a Change,
+instead of copying the state. Entities are addressed by id and standee number
+rather than by object, so a change can still be undone after the app has sent
+a new gamestate and all entities have been recreated.
+
+Addresses:
+    ("character", id)               Characters._CharacterState of a character
+    ("standee", monster id, nr)     Monsters.MonsterInstances of a standee
+    ("monster", monster id)         Monsters, used when a standee is removed
+"""
+
+import logging
+from collections import deque
+
+# Rough size in bytes of a recorded delta, used for the memory budget
+FIELD_DELTA_SIZE = 120
+REMOVE_DELTA_SIZE = 1000
+
+
+class Change:
+    """The deltas of one update, in the order they were made."""
+
+    __slots__ = ("description", "deltas", "size")
+
+    def __init__(self) -> None:
+        self.description = ""
+        self.deltas = []
+        self.size = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.deltas)
+
+    def set_field(self, address: tuple, attribute: str, old, new) -> None:
+        """Record that a field changed from old to new."""
+        self.deltas.append(("field", address, attribute, old, new))
+        self.size += FIELD_DELTA_SIZE
+
+    def remove_standee(self, address: tuple, position: int, standee: dict) -> None:
+        """Record that a standee was removed from a monster at position."""
+        self.deltas.append(("remove", address, position, standee))
+        self.size += REMOVE_DELTA_SIZE
+
+    def extend(self, other: "Change") -> None:
+        """Append the deltas of a later change, used to merge a batch."""
+        self.deltas.extend(other.deltas)
+        self.size += other.size
+
+
+class History:
+    """Bounded undo and redo stacks of changes.
+
+    The oldest changes are forgotten when there are more than max_changes or
+    the recorded deltas use more than about max_bytes.
+    """
+
+    def __init__(self, max_changes: int = 100, max_bytes: int = 256 * 1024) -> None:
+        self.logger = logging.getLogger("xhaven_core.history")
+        self.max_changes = max_changes
+        self.max_bytes = max_bytes
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.size = 0
+
+    def record(self, change: Change) -> None:
+        """Add a new change, this clears the redo stack."""
+        self.undo_stack.append(change)
+        self.size += change.size
+        for old_change in self.redo_stack:
+            self.size -= old_change.size
+        self.redo_stack = []
+
+        while self.undo_stack and (
+            len(self.undo_stack) > self.max_changes or self.size > self.max_bytes
+        ):
+            self.size -= self.undo_stack.popleft().size
+
+    def undo(self):
+        """Return the change to undo, or None if there is nothing to undo."""
+        if not self.undo_stack:
+            return None
+        change = self.undo_stack.pop()
+        self.redo_stack.append(change)
+        return change
+
+    def redo(self):
+        """Return the change to redo, or None if there is nothing to redo."""
+        if not self.redo_stack:
+            return None
+        change = self.redo_stack.pop()
+        self.undo_stack.append(change)
+        return change
+
+    def drop_redo(self) -> None:
+        """Forget the change that redo would redo."""
+        if self.redo_stack:
+            self.size -= self.redo_stack.pop().size
+
+    def clear(self) -> None:
+        self.undo_stack.clear()
+        self.redo_stack = []
+        self.size = 0
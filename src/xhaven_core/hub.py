@@ -0,0 +1,356 @@
+"""
+Hub that runs several X-Haven tables in one process.
+
+Every table is a Session with its own GameState and ClientNetwork. The hub
+reads all tables from one configuration file, shares the speech recognizer,
+logging and metrics between them, and routes microphones to tables.
+
+Example configuration (hub_parameters.json):
+
+{
+  "recognition_workers": 2,
+  "tables": {
+    "table1": {
+      "host": "192.168.1.57",
+      "port": 4567,
+      "character_names": {"Drifter": "Daniel"},
+      "monster_names": {"Lurker Clawcrusher": "Krabban"},
+      "microphone": 1
+    },
+    "table3": {
+      "host": "192.168.1.59",
+      "microphones": [
+        {"device": 2, "character": "Drifter"},
+        {"device": 3, "channel": 0, "character": "Geminate"}
+      ]
+    },
+    "table2": {"host": "192.168.1.58"}
+  }
+}
+
+A table either has one shared microphone, or one microphone per player in
+"microphones", see microphones.py. pre_roll is the seconds of audio kept from
+before a phrase starts, see capture.py. Tables take the keys of
+initial_parameters.json with the same defaults, except recognition_workers
+and snapshot_port. When recognition_workers is set, speech from all
+tables is recognized by one shared pool of worker processes, see
+recognitionpool.py.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import NamedTuple
+
+from . import config
+from .clientnetwork import ClientNetwork
+from .gamestate import GameState
+
+# Parameters that are set once for the whole hub, not per table
+HUB_PARAMETERS = ("recognition_workers", "snapshot_port")
+
+# The parameters of initial_parameters.json, plus the microphone shared by the
+# table and the seconds to wait between the steps of connecting
+DEFAULT_TABLE = {
+    **{
+        key: value
+        for key, value in config.DEFAULT_PARAMETERS.items()
+        if key not in HUB_PARAMETERS
+    },
+    "microphone": None,
+    "startup_delay": 5,
+}
+
+
+class Services(NamedTuple):
+    """Optional services of a table, started by start_services."""
+
+    readback: object
+    warm_start: object
+
+
+def start_services(game_state, client_network, parameters: dict) -> Services:
+    """Start the optional services that are set in the parameters of a table.
+
+    These are recording, quarantine, the timeline, readback and warm start.
+    Used for every Session and by xhaven_speech.py.
+    """
+    if parameters["recording_file"]:
+        client_network.start_recording(parameters["recording_file"])
+    if parameters["quarantine_file"]:
+        client_network.start_quarantine(parameters["quarantine_file"])
+    if parameters["timeline_file"]:
+        game_state.record_timeline(parameters["timeline_file"])
+
+    readback = None
+    if parameters["readback_voice"]:
+        from .readback import EspeakBackend, Readback
+
+        readback = Readback(EspeakBackend(parameters["readback_voice"]))
+        readback.follow(game_state)
+
+    warm_start = None
+    if parameters["warm_start_file"]:
+        from .warmstart import WarmStart
+
+        warm_start = WarmStart(parameters["warm_start_file"])
+        warm_start.restore(game_state)
+        warm_start.start(game_state)
+    return Services(readback, warm_start)
+
+
+def load_hub_parameters(path: str) -> dict:
+    """Read and validate the hub configuration file, returns the tables by name."""
+    with open(path, "r") as file:
+        parameters = json.load(file)
+
+    tables = parameters.get("tables")
+    if not isinstance(tables, dict) or not tables:
+        raise ValueError("%s must contain a non-empty 'tables' object" % path)
+
+    result = {}
+    for name, table in tables.items():
+        # None in the file means use the default, as in initial_parameters.json
+        try:
+            result[name] = config.validate_parameters(table, DEFAULT_TABLE)
+        except ValueError as error:
+            raise ValueError("Table %s: %s" % (name, error)) from None
+    return result
+
+
+class Session:
+    """One X-Haven table, a GameState and ClientNetwork pair that can be restarted."""
+
+    def __init__(self, name: str, parameters: dict) -> None:
+        self.name = name
+        self.parameters = parameters
+        self.logger = logging.getLogger("xhaven_core.hub").getChild(name)
+
+        self.game_state = None
+        self.client_network = None
+        self.speech = None
+        self.player_speech = []
+        self.pool = None
+        self.readback = None
+        self.warm_start = None
+        self.started = 0.0
+        self.restarts = 0
+
+    def start(self) -> None:
+        """Create the GameState and connect to the X-Haven app."""
+        self.logger.info("Starting session %s", self.name)
+        self.game_state = GameState(
+            self.parameters["character_names"], self.parameters["monster_names"]
+        )
+        self.client_network = ClientNetwork(
+            self.game_state, host=self.parameters["host"], port=self.parameters["port"]
+        )
+        # Log each table to its own child logger, so tables can be told apart
+        self.game_state.logger = self.game_state.logger.getChild(self.name)
+        self.client_network.logger = self.client_network.logger.getChild(self.name)
+        self.client_network.heartbeat.logger = self.client_network.logger
+        self.client_network.heartbeat.on_stall = self._stall_alarm
+        self.game_state.set_client_network(self.client_network)
+        self.game_state.auto_end_of_round = self.parameters["auto_end_of_round"]
+
+        self.readback, self.warm_start = start_services(
+            self.game_state, self.client_network, self.parameters
+        )
+
+        self.started = time.monotonic()
+        # Connecting waits for the app, do it in the background so one table
+        # that is down does not hold up the others
+        threading.Thread(target=self._connect, daemon=True).start()
+
+    def _stall_alarm(self, message: str) -> None:
+        # Sound the alarm at the table, see heartbeat.py
+        from .heartbeat import STALL_SOUND
+        from .speech import play_sound
+
+        play_sound(STALL_SOUND)
+
+    def _connect(self) -> None:
+        delay = self.parameters["startup_delay"]
+        try:
+            self.client_network.connect()
+            time.sleep(delay)
+            self.client_network.send_init_msg()
+            time.sleep(delay)
+            self.client_network.send_data(
+                b"S3nD:Index:-1Description::GetDataDescriptionGameState:{}[EOM]"
+            )
+        except OSError as error:
+            self.logger.error("Could not connect session %s: %s", self.name, error)
+
+    def start_speech(self, device_index=None, pool=None) -> None:
+        """Start speech recognition for this table on the given microphone."""
+        from . import speech
+
+        self.pool = pool
+        self.speech = speech.speech(
+            self.game_state,
+            device_index=device_index,
+            pool=pool,
+            pre_roll=self.parameters["pre_roll"],
+            readback=self.readback,
+            speculate=self.parameters["speculate"],
+        )
+
+    def start_player_speech(self, pool=None) -> None:
+        """Start speech recognition on the microphone of every player."""
+        from . import speech
+
+        self.pool = pool
+        self.player_speech = speech.start_microphones(
+            self.game_state,
+            self.parameters["microphones"],
+            pool=pool,
+            pre_roll=self.parameters["pre_roll"],
+            readback=self.readback,
+            speculate=self.parameters["speculate"],
+        )
+
+    def stop(self) -> None:
+        """Stop speech recognition and disconnect from the X-Haven app."""
+        self.logger.info("Stopping session %s", self.name)
+        if self.speech:
+            self.speech.stop()
+            self.speech = None
+        for player_speech in self.player_speech:
+            player_speech.stop()
+        self.player_speech = []
+        if self.client_network:
+            self.client_network.disconnect()
+        if self.game_state:
+            self.game_state.stop_timeline()
+        if self.warm_start:
+            self.warm_start.stop()
+            self.warm_start = None
+        if self.readback:
+            self.readback.stop()
+            self.readback = None
+
+    def restart(self) -> None:
+        """Stop the session and start it again with a fresh GameState."""
+        device_index = self.speech.device_index if self.speech else None
+        had_speech = self.speech is not None
+        had_player_speech = bool(self.player_speech)
+        self.stop()
+        self.restarts += 1
+        self.start()
+        if had_speech:
+            self.start_speech(device_index, self.pool)
+        if had_player_speech:
+            self.start_player_speech(self.pool)
+
+    def metrics(self) -> dict:
+        """Return counters for this session."""
+        client_network = self.client_network
+        return {
+            "connected": bool(client_network and client_network.is_running),
+            "index": self.game_state.index if self.game_state else -1,
+            "echoes_ignored": (
+                self.game_state.echoes_ignored if self.game_state else 0
+            ),
+            "frames_received": client_network.frames_received if client_network else 0,
+            "frames_sent": client_network.frames_sent if client_network else 0,
+            "frames_dropped": client_network.frames_dropped if client_network else 0,
+            "frames_accepted": client_network.frames_accepted if client_network else 0,
+            "frames_rejected": client_network.frames_rejected if client_network else 0,
+            "heartbeat": client_network.heartbeat.summary() if client_network else {},
+            "speculation": {
+                listener.character or "table": listener.speculator.summary()
+                for listener in [self.speech] + self.player_speech
+                if listener and listener.speculator
+            },
+            "uptime": time.monotonic() - self.started if self.started else 0.0,
+            "restarts": self.restarts,
+        }
+
+
+class Hub:
+    """Run the sessions for all tables in one process."""
+
+    def __init__(self, tables: dict, recognition_workers: int = 0) -> None:
+        self.logger = logging.getLogger("xhaven_core.hub")
+        self.recognition_workers = recognition_workers
+        self.pool = None
+        self.path = None
+        self.config_watcher = None
+        self.sessions = {name: Session(name, table) for name, table in tables.items()}
+        self.player_microphones = any(table["microphones"] for table in tables.values())
+        # Microphone device index -> session name
+        self.audio_routes = {}
+        for name, table in tables.items():
+            if table["microphone"] is not None:
+                self.route_audio(table["microphone"], name)
+
+    @classmethod
+    def from_file(cls, path: str) -> "Hub":
+        """Create a hub from a configuration file, see load_hub_parameters."""
+        with open(path, "r") as file:
+            recognition_workers = json.load(file).get("recognition_workers") or 0
+        hub = cls(load_hub_parameters(path), recognition_workers)
+        hub.path = path
+        return hub
+
+    def watch_config(self, interval: float = 1.0) -> None:
+        """Reload the names of all tables when the configuration file changes."""
+        self.config_watcher = config.ConfigWatcher(
+            self.path, self.apply_tables, interval, load=load_hub_parameters
+        )
+
+    def apply_tables(self, tables: dict) -> None:
+        """Swap in the names of reloaded tables, without reconnecting."""
+        for name, table in tables.items():
+            session = self.sessions.get(name)
+            if session is None:
+                self.logger.warning("Table %s is added after a restart", name)
+                continue
+            session.parameters["character_names"] = table["character_names"]
+            session.parameters["monster_names"] = table["monster_names"]
+            if session.game_state:
+                session.game_state.names.update(
+                    table["character_names"], table["monster_names"]
+                )
+
+    def route_audio(self, device_index: int, session_name: str) -> None:
+        """Send the speech from a microphone to a session."""
+        if session_name not in self.sessions:
+            raise KeyError("Unknown session %s" % session_name)
+        self.audio_routes[device_index] = session_name
+        self.logger.info("Microphone %s routed to %s", device_index, session_name)
+
+    def start(self, speech: bool = False) -> None:
+        """Start all sessions, and speech recognition for the routed microphones."""
+        for session in self.sessions.values():
+            session.start()
+        if speech:
+            if self.recognition_workers and self.pool is None:
+                from .recognitionpool import RecognitionPool
+
+                self.pool = RecognitionPool(self.recognition_workers)
+            for device_index, session_name in self.audio_routes.items():
+                self.sessions[session_name].start_speech(device_index, self.pool)
+            for session in self.sessions.values():
+                if session.parameters["microphones"]:
+                    session.start_player_speech(self.pool)
+
+    def stop(self) -> None:
+        """Stop all sessions and the recognition workers."""
+        if self.config_watcher:
+            self.config_watcher.stop()
+        for session in self.sessions.values():
+            session.stop()
+        if self.pool:
+            self.pool.close()
+            self.pool = None
+
+    def restart(self, session_name: str) -> None:
+        """Restart one session without touching the others."""
+        self.sessions[session_name].restart()
+
+    def metrics(self) -> dict:
+        """Return the counters of all sessions by name."""
+        return {name: session.metrics() for name, session in self.sessions.items()}
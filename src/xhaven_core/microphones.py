@@ -0,0 +1,229 @@
+"""
+Several microphones at one table, each bound to a player.
+
+Every player can have their own microphone, either a separate input device or
+one channel of a multichannel audio interface. Each microphone is listened to
+by its own speech object and thread, so players do not wait for each other.
+A command from a player's microphone that does not name a character, like
+"initiative 45", is for that player's character.
+
+Example "microphones" parameter (initial_parameters.json or a hub table):
+
+[
+  {"device": 1, "character": "Drifter"},
+  {"device": 4, "channel": 0, "character": "Geminate"},
+  {"device": 4, "channel": 1, "character": "Banner Spear"}
+]
+
+Entries with a channel share one MultichannelMicrophone for their device,
+it captures all channels in one stream and splits them per channel. Closing
+the source of one channel only ends that channel, the device is stopped when
+the last channel is closed.
+"""
+
+import array
+import logging
+import threading
+
+# Seconds of audio kept for a channel that is not being listened to
+MAX_BUFFERED_SECONDS = 30
+
+
+def split_channels(data: bytes, channels: int) -> list:
+    """Split interleaved 16-bit audio into one bytes object per channel."""
+    samples = array.array("h", data)
+    return [samples[channel::channels].tobytes() for channel in range(channels)]
+
+
+class ChannelStream:
+    """Audio of one channel, read like a PyAudio input stream."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.buffer = bytearray()
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def write(self, data: bytes) -> None:
+        with self.condition:
+            if self.closed:
+                return
+            self.buffer += data
+            # Drop the oldest audio when nobody is listening
+            if len(self.buffer) > self.max_bytes:
+                del self.buffer[: len(self.buffer) - self.max_bytes]
+            self.condition.notify_all()
+
+    def read(self, frames: int) -> bytes:
+        """Return frames samples, or b"" when the stream is closed."""
+        size = frames * 2
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.buffer) >= size or self.closed)
+            if self.closed:
+                return b""
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            return data
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class MultichannelMicrophone:
+    """Capture all channels of one input device in a single stream."""
+
+    def __init__(
+        self,
+        device_index,
+        channels: int,
+        sample_rate: int = 16000,
+        chunk_size: int = 1024,
+    ) -> None:
+        self.logger = logging.getLogger("xhaven_core.microphones")
+        self.device_index = device_index
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.streams = [
+            ChannelStream(MAX_BUFFERED_SECONDS * sample_rate * 2)
+            for _ in range(channels)
+        ]
+        self.is_running = False
+        self.thread = None
+        # Channels opened and not closed yet
+        self.lock = threading.Lock()
+        self.open_channels = set()
+
+    def channel(self, channel: int):
+        """Return an audio source for one channel, for Recognizer.listen."""
+        return _channel_source_class()(self, channel)
+
+    def open_channel(self, channel: int) -> ChannelStream:
+        """Return the stream of a channel and count it as in use."""
+        with self.lock:
+            self.open_channels.add(channel)
+        return self.streams[channel]
+
+    def close_channel(self, channel: int) -> None:
+        """End the stream of a channel, the last channel stops the device."""
+        with self.lock:
+            if channel not in self.open_channels:
+                return
+            self.open_channels.discard(channel)
+            last = not self.open_channels
+        self.streams[channel].close()
+        if last:
+            self.stop()
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+        self.is_running = True
+        self.thread = threading.Thread(target=self._capture, daemon=True)
+        self.thread.start()
+
+    def _capture(self) -> None:
+        import speech_recognition as sr
+
+        pyaudio = sr.Microphone.get_pyaudio()
+        audio = pyaudio.PyAudio()
+        try:
+            stream = audio.open(
+                input_device_index=self.device_index,
+                channels=self.channels,
+                format=pyaudio.paInt16,
+                rate=self.sample_rate,
+                frames_per_buffer=self.chunk_size,
+                input=True,
+            )
+            self.logger.info(
+                "Capturing %s channels from device %s", self.channels, self.device_index
+            )
+            try:
+                while self.is_running:
+                    data = stream.read(self.chunk_size, exception_on_overflow=False)
+                    for channel_stream, channel_data in zip(
+                        self.streams, split_channels(data, self.channels)
+                    ):
+                        channel_stream.write(channel_data)
+            finally:
+                stream.close()
+        except OSError as error:
+            self.logger.error(
+                "Could not capture device %s: %s", self.device_index, error
+            )
+        finally:
+            audio.terminate()
+            self.stop()
+
+    def stop(self) -> None:
+        self.is_running = False
+        for stream in self.streams:
+            stream.close()
+
+
+_ChannelSource = None
+
+
+def _channel_source_class():
+    # Recognizer.listen only accepts subclasses of speech_recognition.AudioSource,
+    # the class is created on first use so importing this module stays cheap
+    global _ChannelSource
+    if _ChannelSource is not None:
+        return _ChannelSource
+
+    import speech_recognition as sr
+
+    class ChannelSource(sr.AudioSource):
+        """One channel of a MultichannelMicrophone."""
+
+        def __init__(self, microphone, channel: int) -> None:
+            self.microphone = microphone
+            self.channel = channel
+            self.SAMPLE_RATE = microphone.sample_rate
+            self.SAMPLE_WIDTH = 2
+            self.CHUNK = microphone.chunk_size
+            self.stream = microphone.open_channel(channel)
+
+        def __enter__(self):
+            self.microphone.start()
+            return self
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            # The capture keeps running for the next phrase and the other channels
+            pass
+
+        def close(self) -> None:
+            # The other channels of the device keep capturing
+            self.microphone.close_channel(self.channel)
+
+    _ChannelSource = ChannelSource
+    return _ChannelSource
+
+
+def open_microphones(microphones: list) -> list:
+    """Return (device_index, source, character) for every microphone entry.
+
+    source is None for entries without a channel, they are opened as normal
+    speech_recognition microphones.
+    """
+    # One multichannel capture per device, with enough channels for all entries
+    devices = {}
+    for entry in microphones:
+        if entry.get("channel") is not None:
+            channels = max(devices.get(entry.get("device"), 0), entry["channel"] + 1)
+            devices[entry.get("device")] = channels
+    multichannel = {
+        device: MultichannelMicrophone(device, channels)
+        for device, channels in devices.items()
+    }
+
+    result = []
+    for entry in microphones:
+        source = None
+        if entry.get("channel") is not None:
+            source = multichannel[entry.get("device")].channel(entry["channel"])
+        result.append((entry.get("device"), source, entry.get("character")))
+    return result
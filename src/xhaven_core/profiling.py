@@ -0,0 +1,256 @@
+"""
+On-demand CPU profiling and memory snapshots of a running session.
+
+Nothing is installed until profiling is started, so there is no overhead
+while it is off. Start and stop it from the command line (profile, memory) or
+with signals on Unix:
+
+    SIGUSR1     start CPU profiling, the second signal stops it and writes
+                the report
+    SIGUSR2     take a memory snapshot, from the second one on the report
+                also shows what grew since the previous snapshot
+
+CPU profiling uses cProfile, which sees all threads (network, speech and the
+GameState updates they make) from Python 3.12 on. Older versions only let
+cProfile see the thread that started it, so there the threads are sampled
+with sys._current_frames instead.
+
+Reports are written to the profiles directory:
+
+    cpu-<time>.txt      the functions with the most cumulative time
+    cpu-<time>.prof     the cProfile data, for pstats or snakeviz
+    memory-<time>.txt   the largest allocations and the growth since the
+                        previous snapshot
+"""
+
+import io
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Number of lines in the reports
+REPORT_LINES = 40
+
+# Seconds between samples when cProfile can not see all threads
+SAMPLE_INTERVAL = 0.005
+
+
+class StackSampler:
+    """Sample the stacks of all threads, for Python versions before 3.12."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        self.interval = interval
+        self.samples = 0
+        # Samples with the function anywhere on the stack, and on top of it
+        self.cumulative = Counter()
+        self.own = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def _sample(self) -> None:
+        me = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                self.samples += 1
+                self.own[self._function(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    function = self._function(frame)
+                    if function not in seen:
+                        seen.add(function)
+                        self.cumulative[function] += 1
+                    frame = frame.f_back
+
+    @staticmethod
+    def _function(frame) -> tuple:
+        code = frame.f_code
+        return (code.co_filename, code.co_firstlineno, code.co_name)
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def report(self) -> str:
+        lines = [
+            "%s samples every %.0f ms of all threads"
+            % (self.samples, self.interval * 1000),
+            "",
+            "%8s %8s  function" % ("cumul %", "own %"),
+        ]
+        total = self.samples or 1
+        for function, count in self.cumulative.most_common(REPORT_LINES):
+            lines.append(
+                "%8.1f %8.1f  %s:%s(%s)"
+                % (
+                    100.0 * count / total,
+                    100.0 * self.own[function] / total,
+                    *function,
+                )
+            )
+        return "\n".join(lines) + "\n"
+
+
+class Profiler:
+    """Start and stop CPU profiling and take memory snapshots while running."""
+
+    def __init__(self, directory: str = "profiles") -> None:
+        self.logger = logging.getLogger("xhaven_core.profiling")
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.cpu = None
+        self.cpu_started = 0.0
+        self.memory_snapshot = None
+        self.started_tracemalloc = False
+
+    def _path(self, kind: str, extension: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = "%s-%s.%s" % (kind, time.strftime("%Y%m%d-%H%M%S"), extension)
+        return os.path.join(self.directory, name)
+
+    @property
+    def cpu_running(self) -> bool:
+        return self.cpu is not None
+
+    def start_cpu(self) -> bool:
+        """Start CPU profiling, returns False if it is already running."""
+        with self.lock:
+            if self.cpu is not None:
+                return False
+            if sys.version_info >= (3, 12):
+                import cProfile
+
+                self.cpu = cProfile.Profile()
+                self.cpu.enable()
+            else:
+                self.cpu = StackSampler()
+                self.cpu.start()
+            self.cpu_started = time.monotonic()
+        self.logger.info("CPU profiling started")
+        return True
+
+    def stop_cpu(self):
+        """Stop CPU profiling and write the report, returns its path or None."""
+        with self.lock:
+            cpu = self.cpu
+            self.cpu = None
+            if cpu is None:
+                return None
+            if isinstance(cpu, StackSampler):
+                cpu.stop()
+                report = cpu.report()
+            else:
+                cpu.disable()
+                report = self._pstats_report(cpu)
+            path = self._path("cpu", "txt")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(
+                    "CPU profile of %.1f s\n\n" % (time.monotonic() - self.cpu_started)
+                )
+                file.write(report)
+            if not isinstance(cpu, StackSampler):
+                cpu.dump_stats(path[: -len("txt")] + "prof")
+        self.logger.info("CPU profile written to %s", path)
+        return path
+
+    @staticmethod
+    def _pstats_report(profile) -> str:
+        import pstats
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profile, stream=stream)
+        stats.sort_stats("cumulative").print_stats(REPORT_LINES)
+        return stream.getvalue()
+
+    def toggle_cpu(self):
+        """Start CPU profiling, or stop it and return the path of the report."""
+        if self.cpu_running:
+            return self.stop_cpu()
+        self.start_cpu()
+        return None
+
+    def snapshot_memory(self, frames: int = 10) -> str:
+        """Write the largest allocations and the growth since the last snapshot.
+
+        The first snapshot starts tracemalloc, which slows down allocations
+        until stop_memory is called.
+        """
+        import tracemalloc
+
+        with self.lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self.started_tracemalloc = True
+                self.logger.info("Memory tracing started")
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),)
+            )
+            current, peak = tracemalloc.get_traced_memory()
+            lines = [
+                "Traced memory %.1f KiB, peak %.1f KiB" % (current / 1024, peak / 1024),
+                "",
+                "Largest allocations:",
+            ]
+            lines.extend(
+                str(statistic)
+                for statistic in snapshot.statistics("lineno")[:REPORT_LINES]
+            )
+            if self.memory_snapshot is not None:
+                lines.extend(["", "Growth since the previous snapshot:"])
+                lines.extend(
+                    str(statistic)
+                    for statistic in snapshot.compare_to(
+                        self.memory_snapshot, "lineno"
+                    )[:REPORT_LINES]
+                )
+            self.memory_snapshot = snapshot
+
+            path = self._path("memory", "txt")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write("\n".join(lines) + "\n")
+        self.logger.info("Memory snapshot written to %s", path)
+        return path
+
+    def stop_memory(self) -> None:
+        """Stop memory tracing if it was started by snapshot_memory."""
+        import tracemalloc
+
+        with self.lock:
+            self.memory_snapshot = None
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+                self.started_tracemalloc = False
+                self.logger.info("Memory tracing stopped")
+
+    def stop(self) -> None:
+        """Stop everything, a running CPU profile is written."""
+        self.stop_cpu()
+        self.stop_memory()
+
+    def install_signals(self) -> bool:
+        """Toggle CPU profiling on SIGUSR1 and take memory snapshots on SIGUSR2.
+
+        Returns False where these signals do not exist, as on Windows. Must be
+        called from the main thread.
+        """
+        import signal
+
+        if not hasattr(signal, "SIGUSR1"):
+            return False
+        # The work is done on a thread, a signal handler must return quickly
+        signal.signal(
+            signal.SIGUSR1,
+            lambda signum, frame: threading.Thread(target=self.toggle_cpu).start(),
+        )
+        signal.signal(
+            signal.SIGUSR2,
+            lambda signum, frame: threading.Thread(target=self.snapshot_memory).start(),
+        )
+        return True
@@ -0,0 +1,356 @@
+"""
+Spoken answers to status questions, synthesized offline.
+
+    status                  health and initiative of every character
+    status Daniel           one character, by spoken name or id
+    status monster 2        the standees of the second monster group
+    status Krabban 3        standee 3 of the monster called Krabban
+
+Synthesizing a sentence takes espeak-ng 50 to 200 ms, too long for an answer
+at the table. Every word of an answer is therefore synthesized once and
+cached as a Clip: the names of the roster, the numbers 0 to 99 for health,
+initiative and standees, higher ones up to the highest maximum health, and
+the fixed phrases. follow fills the cache on a thread when the roster
+changes, and an answer only joins cached clips. A word that is not cached
+yet is synthesized when it is needed and kept.
+
+The answer is played by a sink, DeviceSink plays it on the speakers and
+FileSink writes it to a WAV file, which is what the tests use.
+"""
+
+import array
+import io
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import wave
+from typing import NamedTuple
+
+from . import conditions, events
+
+
+def condition_word(condition) -> str:
+    """Return the spoken name of a condition, POISON3 is spoken as poison."""
+    return condition.name.rstrip("0123456789").lower()
+
+
+# Words of the answers, synthesized before they are needed
+FIXED_PHRASES = (
+    "standee",
+    "elite",
+    "boss",
+    "health",
+    "of",
+    "initiative",
+    "no standees",
+    "not found",
+) + tuple(sorted({condition_word(condition) for condition in conditions.Condition}))
+
+# Numbers below it are always cached, initiatives go up to 99. Higher ones are
+# cached up to the highest maximum health of the roster
+CACHED_NUMBERS = 100
+
+# Seconds of silence between two words
+WORD_GAP = 0.06
+
+
+class Clip(NamedTuple):
+    """Mono audio, frames are 16 bit little endian samples."""
+
+    sample_rate: int
+    frames: bytes
+
+    @property
+    def seconds(self) -> float:
+        return len(self.frames) / 2 / self.sample_rate
+
+    @classmethod
+    def from_wav(cls, data: bytes) -> "Clip":
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            if wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                raise ValueError("Only 16 bit mono audio is supported")
+            # espeak-ng writes a streaming header without the real length,
+            # readframes reads until the end of the data
+            return cls(wav.getframerate(), wav.readframes(sys.maxsize))
+
+    def to_wav(self) -> bytes:
+        output = io.BytesIO()
+        with wave.open(output, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(self.frames)
+        return output.getvalue()
+
+    def trimmed(self, threshold: int = 200, pad: float = 0.02) -> "Clip":
+        """Return the clip without the silence before and after the word."""
+        samples = array.array("h", self.frames)
+        if sys.byteorder == "big":
+            samples.byteswap()
+        loud = [i for i, sample in enumerate(samples) if abs(sample) > threshold]
+        if not loud:
+            return self._replace(frames=b"")
+        keep = int(pad * self.sample_rate)
+        start = max(loud[0] - keep, 0)
+        end = min(loud[-1] + keep + 1, len(samples))
+        return self._replace(frames=self.frames[2 * start : 2 * end])
+
+
+def join(clips: list, gap: float = WORD_GAP) -> Clip:
+    """Join clips of the same sample rate with a short silence between them."""
+    if not clips:
+        return Clip(22050, b"")
+    sample_rate = clips[0].sample_rate
+    if any(clip.sample_rate != sample_rate for clip in clips):
+        raise ValueError("Clips have different sample rates")
+    silence = b"\0\0" * int(gap * sample_rate)
+    return Clip(sample_rate, silence.join(clip.frames for clip in clips))
+
+
+class EspeakBackend:
+    """Synthesize text with the espeak-ng program, or espeak if it is missing."""
+
+    def __init__(self, voice: str = "en", speed: int = 175, executable=None) -> None:
+        self.voice = voice
+        self.speed = speed
+        self.executable = (
+            executable or shutil.which("espeak-ng") or shutil.which("espeak")
+        )
+
+    @property
+    def available(self) -> bool:
+        return self.executable is not None
+
+    def synthesize(self, text: str) -> Clip:
+        if not self.available:
+            raise OSError("espeak-ng is not installed")
+        result = subprocess.run(
+            [self.executable, "-v", self.voice, "-s", str(self.speed), "--stdout"],
+            input=text.encode("utf-8"),
+            capture_output=True,
+            check=True,
+            timeout=10,
+        )
+        return Clip.from_wav(result.stdout).trimmed()
+
+
+class FileSink:
+    """Write every answer to a numbered WAV file in directory."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.paths = []
+
+    def play(self, clip: Clip) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, "answer-%03d.wav" % len(self.paths))
+        with open(path, "wb") as file:
+            file.write(clip.to_wav())
+        self.paths.append(path)
+
+
+class DeviceSink:
+    """Play answers on the speakers with winsound, aplay or paplay."""
+
+    def __init__(self) -> None:
+        self.logger = logging.getLogger("xhaven_core.readback")
+        self.player = shutil.which("aplay") or shutil.which("paplay")
+
+    def play(self, clip: Clip) -> None:
+        # Do not block, the microphone is waiting for the next command
+        threading.Thread(target=self._play, args=(clip.to_wav(),), daemon=True).start()
+
+    def _play(self, data: bytes) -> None:
+        try:
+            import winsound
+        except ImportError:
+            winsound = None
+        try:
+            if winsound is not None:
+                winsound.PlaySound(data, winsound.SND_MEMORY)
+            elif self.player:
+                subprocess.run([self.player], input=data, capture_output=True)
+            else:
+                self.logger.warning("No program found to play answers")
+        except (OSError, RuntimeError):
+            self.logger.exception("Could not play answer")
+
+
+class Readback:
+    """Answer status questions by joining cached clips of words."""
+
+    def __init__(self, backend=None, sink=None, gap: float = WORD_GAP) -> None:
+        self.logger = logging.getLogger("xhaven_core.readback")
+        self.backend = backend or EspeakBackend()
+        self.sink = sink or DeviceSink()
+        self.gap = gap
+        self.lock = threading.Lock()
+        # Phrase -> Clip
+        self.cache = {}
+        self.synthesized = 0
+        self.stopped = threading.Event()
+
+    def clip(self, phrase: str) -> Clip:
+        """Return the clip of a phrase, synthesized and cached on first use."""
+        phrase = phrase.lower()
+        clip = self.cache.get(phrase)
+        if clip is None:
+            clip = self.backend.synthesize(phrase)
+            with self.lock:
+                self.cache[phrase] = clip
+                self.synthesized += 1
+        return clip
+
+    def say(self, phrases: list) -> Clip:
+        """Play the phrases as one answer, returns it."""
+        clip = join([self.clip(phrase) for phrase in phrases], self.gap)
+        self.sink.play(clip)
+        return clip
+
+    def phrases(self, game_state) -> set:
+        """Return the phrases an answer about the current roster can use."""
+        highest = CACHED_NUMBERS - 1
+        phrases = set(FIXED_PHRASES)
+        with game_state.lock:
+            for item in game_state.currentList:
+                phrases.add(spoken_name(item))
+                if item.__class__.__name__ == "Characters":
+                    states = [item.characterState]
+                else:
+                    states = item.monster_instances
+                for state in states:
+                    highest = max(highest, state.maxHealth or 0)
+        phrases.update(str(number) for number in range(highest + 1))
+        return {phrase.lower() for phrase in phrases}
+
+    def prepare(self, game_state) -> int:
+        """Synthesize the phrases of the roster that are not cached yet."""
+        missing = self.phrases(game_state) - set(self.cache)
+        for phrase in sorted(missing):
+            try:
+                self.clip(phrase)
+            except (OSError, subprocess.SubprocessError, ValueError):
+                self.logger.exception("Could not synthesize %s", phrase)
+                break
+        self.logger.info("Readback cache has %s phrases", len(self.cache))
+        return len(missing)
+
+    def follow(self, game_state) -> None:
+        """Prepare the cache now and whenever the roster changes, on a thread."""
+        subscription = game_state.subscribe()
+        self.stopped.clear()
+        threading.Thread(
+            target=self._follow, args=(game_state, subscription), daemon=True
+        ).start()
+
+    def _follow(self, game_state, subscription) -> None:
+        self.prepare(game_state)
+        while not self.stopped.is_set():
+            try:
+                event = subscription.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if isinstance(event, events.RosterChanged):
+                self.prepare(game_state)
+        subscription.close()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def status(self, game_state, words: list) -> bool:
+        """Answer "status [monster] [name or nr] [standee]", see the module help."""
+        phrases = answer(game_state, words)
+        try:
+            self.say(phrases)
+        except (OSError, subprocess.SubprocessError, ValueError):
+            self.logger.exception("Could not answer %s", " ".join(words))
+            return False
+        return True
+
+
+def spoken_name(item) -> str:
+    """Return the name a character or monster is called by at the table."""
+    return item.name or item.id
+
+
+def condition_phrases(condition_set) -> list:
+    """Return the spoken names of the known conditions, each once."""
+    phrases = []
+    for condition_id in condition_set:
+        condition = conditions.parse(condition_id)
+        if condition is not None and condition_word(condition) not in phrases:
+            phrases.append(condition_word(condition))
+    return phrases
+
+
+def answer(game_state, words: list) -> list:
+    """Return the phrases that answer a status question."""
+    words = [word.lower() for word in words]
+    if words[:1] == ["monster"]:
+        words = words[1:]
+    standee_nr = None
+    if len(words) >= 2 and words[-1].isdigit():
+        standee_nr = int(words[-1])
+        words = words[:-1]
+    name = " ".join(words)
+
+    with game_state.lock:
+        if not name:
+            items = [
+                item
+                for item in game_state.currentList
+                if item.__class__.__name__ == "Characters"
+            ]
+        elif name.isdigit():
+            items = [
+                item
+                for item in game_state.currentList
+                if getattr(item, "monster_nr", None) == int(name)
+            ]
+        else:
+            entity_id = game_state.names.find_character(
+                name
+            ) or game_state.names.find_monster(name)
+            items = [
+                item
+                for item in game_state.currentList
+                if item.id == entity_id or item.id.lower() == name
+            ]
+        if not items:
+            return ["not found"]
+
+        phrases = []
+        for item in items:
+            phrases.append(spoken_name(item))
+            if item.__class__.__name__ == "Characters":
+                state = item.characterState
+                phrases.extend(
+                    ["health", str(state.health), "of", str(state.maxHealth)]
+                )
+                if state.initiative:
+                    phrases.extend(["initiative", str(state.initiative)])
+                phrases.extend(condition_phrases(state.conditions))
+                continue
+
+            instances = [
+                instance
+                for instance in item.monster_instances
+                if standee_nr is None or instance.standeeNr == standee_nr
+            ]
+            if not instances:
+                phrases.append("no standees")
+            for instance in instances:
+                phrases.extend(["standee", str(instance.standeeNr)])
+                if instance.type == 1:
+                    phrases.append("elite")
+                elif instance.type == 2:
+                    phrases.append("boss")
+                phrases.extend(
+                    ["health", str(instance.health), "of", str(instance.maxHealth)]
+                )
+                phrases.extend(condition_phrases(instance.conditions))
+    return phrases
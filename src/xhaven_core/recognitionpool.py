@@ -0,0 +1,246 @@
+"""
+Speech recognition in a pool of worker processes.
+
+Local recognition engines are CPU heavy and would otherwise compete for the
+GIL with the network and GameState threads. Each worker process loads the
+engine (and its model) once when it starts. Audio is handed to the workers
+through shared memory slots instead of being pickled, only the slot name and
+the audio format cross the process boundary. Results are delivered to the
+callback in the order the audio was submitted. Every microphone submits to its
+own stream, and each stream has its own delivery thread, so neither a slow
+phrase nor a slow callback of one microphone holds up the others.
+
+Engines:
+    "google"    speech_recognition.Recognizer.recognize_google
+    "whisper"   openai-whisper, the model is loaded once per worker
+    "vosk"      vosk, model is the path to the model directory
+    "module:function"
+                A factory function, called once per worker with the model
+                argument. It returns recognize(frame, sample_rate, sample_width)
+                where frame is a memoryview of 16-bit mono PCM audio, and
+                recognize returns the text or None.
+"""
+
+import importlib
+import itertools
+import logging
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# Size of each shared memory slot, 60 seconds of 16 kHz 16-bit audio
+SLOT_SIZE = 60 * 16000 * 2
+
+# ----------------------------------------------
+# Engines, run in the worker processes
+# ----------------------------------------------
+
+
+def _google_engine(model):
+    import speech_recognition as sr
+
+    recognizer = sr.Recognizer()
+
+    def recognize(frame, sample_rate, sample_width):
+        audio_data = sr.AudioData(bytes(frame), sample_rate, sample_width)
+        try:
+            return recognizer.recognize_google(audio_data)
+        except sr.UnknownValueError:
+            return None
+
+    return recognize
+
+
+def _whisper_engine(model):
+    import whisper
+
+    from .capture import normalize
+
+    whisper_model = whisper.load_model(model or "base")
+
+    def recognize(frame, sample_rate, sample_width):
+        # Whisper wants float32 audio at 16 kHz
+        text = whisper_model.transcribe(normalize(frame, sample_rate))["text"].strip()
+        return text or None
+
+    return recognize
+
+
+def _vosk_engine(model):
+    import json
+
+    import vosk
+
+    vosk_model = vosk.Model(model) if model else vosk.Model(lang="en-us")
+
+    def recognize(frame, sample_rate, sample_width):
+        recognizer = vosk.KaldiRecognizer(vosk_model, sample_rate)
+        recognizer.AcceptWaveform(bytes(frame))
+        text = json.loads(recognizer.FinalResult()).get("text", "")
+        return text or None
+
+    return recognize
+
+
+ENGINES = {
+    "google": _google_engine,
+    "whisper": _whisper_engine,
+    "vosk": _vosk_engine,
+}
+
+_recognize = None
+
+
+def _load_engine(engine: str, model):
+    if ":" in engine:
+        module_name, function_name = engine.split(":")
+        factory = getattr(importlib.import_module(module_name), function_name)
+    else:
+        factory = ENGINES[engine]
+    return factory(model)
+
+
+def _init_worker(engine: str, model) -> None:
+    # Load the engine once when the worker process starts
+    global _recognize
+    _recognize = _load_engine(engine, model)
+
+
+def _recognize_slot(slot_name: str, size: int, sample_rate: int, sample_width: int):
+    # Recognize the audio in a shared memory slot, returns (text, error)
+    slot = shared_memory.SharedMemory(name=slot_name)
+    frame = slot.buf[:size]
+    try:
+        return (_recognize(frame, sample_rate, sample_width), None)
+    except Exception as error:
+        return (None, "%s: %s" % (type(error).__name__, error))
+    finally:
+        frame.release()
+        slot.close()
+
+
+# ----------------------------------------------
+# Pool, used in the main process
+# ----------------------------------------------
+
+
+class RecognitionPool:
+    """Pool of worker processes that recognize speech."""
+
+    def __init__(
+        self, workers: int = 2, engine: str = "google", model=None, slots: int = 0
+    ) -> None:
+        self.logger = logging.getLogger("xhaven_core.recognitionpool")
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(engine, model)
+        )
+
+        # Shared memory slots, two per worker so the next audio can be copied
+        # while a worker is busy. submit blocks when all slots are in use
+        self.slots = [
+            shared_memory.SharedMemory(create=True, size=SLOT_SIZE)
+            for _ in range(slots or workers * 2)
+        ]
+        self.free_slots = queue.Queue()
+        for slot in self.slots:
+            self.free_slots.put(slot)
+
+        # Results are put back in submission order per stream before they are
+        # delivered, on a delivery thread per stream
+        self.lock = threading.Lock()
+        self.sequences = {}
+        self.next_to_deliver = {}
+        self.finished = {}
+        self.deliveries = {}
+        self.delivery_threads = {}
+        self.logger.info("Started %s %s recognition workers", workers, engine)
+
+    def submit(self, audio_data, callback, stream=None) -> None:
+        """Recognize an AudioData (or anything with the same attributes) in a worker.
+
+        callback(text) is called with the text, or None if nothing was recognized,
+        in the same order as the audio was submitted to the same stream.
+        """
+        self._submit(
+            audio_data.frame_data,
+            audio_data.sample_rate,
+            audio_data.sample_width,
+            callback,
+            stream,
+        )
+
+    def submit_frame(self, frame, sample_rate: int, callback, stream=None) -> None:
+        """Recognize 16-bit mono PCM audio from a bytes-like object, see submit."""
+        self._submit(frame, sample_rate, 2, callback, stream)
+
+    def _submit(
+        self, frame, sample_rate: int, sample_width: int, callback, stream
+    ) -> None:
+        frame = memoryview(frame).cast("B")
+        size = len(frame)
+        if size > SLOT_SIZE:
+            self.logger.warning(
+                "Audio is too long, only the first %s bytes are used", SLOT_SIZE
+            )
+            frame = frame[:SLOT_SIZE]
+            size = SLOT_SIZE
+
+        slot = self.free_slots.get()
+        slot.buf[:size] = frame
+        with self.lock:
+            if stream not in self.sequences:
+                self.sequences[stream] = itertools.count()
+                self.next_to_deliver[stream] = 0
+                self.deliveries[stream] = queue.Queue()
+                self.delivery_threads[stream] = threading.Thread(
+                    target=self._deliver, args=(self.deliveries[stream],), daemon=True
+                )
+                self.delivery_threads[stream].start()
+            sequence = next(self.sequences[stream])
+        future = self.executor.submit(
+            _recognize_slot, slot.name, size, sample_rate, sample_width
+        )
+        future.add_done_callback(
+            lambda future: self._finished(stream, sequence, slot, callback, future)
+        )
+
+    def _finished(self, stream, sequence: int, slot, callback, future) -> None:
+        # Called by the executor when a worker is done, the slot can be reused
+        self.free_slots.put(slot)
+        try:
+            text, error = future.result()
+        except Exception as exception:
+            text, error = None, str(exception)
+        if error:
+            self.logger.error("Recognition failed: %s", error)
+
+        with self.lock:
+            self.finished[(stream, sequence)] = (callback, text)
+            while (stream, self.next_to_deliver[stream]) in self.finished:
+                self.deliveries[stream].put(
+                    self.finished.pop((stream, self.next_to_deliver[stream]))
+                )
+                self.next_to_deliver[stream] += 1
+
+    def _deliver(self, deliveries: queue.Queue) -> None:
+        while True:
+            item = deliveries.get()
+            if item is None:
+                return
+            callback, text = item
+            try:
+                callback(text)
+            except Exception:
+                self.logger.exception("Error while executing recognized text")
+
+    def close(self) -> None:
+        """Stop the workers and free the shared memory."""
+        self.executor.shutdown(wait=True)
+        for deliveries in self.deliveries.values():
+            deliveries.put(None)
+        for delivery_thread in self.delivery_threads.values():
+            delivery_thread.join()
+        for slot in self.slots:
+            slot.close()
+            slot.unlink()
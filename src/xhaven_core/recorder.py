@@ -0,0 +1,167 @@
+"""
+Recording and replay of the traffic between the client and the X-Haven app.
+
+A recording is an append-only file that starts with a short magic header,
+followed by one record per frame:
+
+    direction (1 byte, b"<" inbound / b">" outbound)
+    timestamp (float64, time.monotonic() when the frame was seen)
+    length    (uint32, length of the frame)
+    frame     (the raw frame bytes, including the S3nD: prefix and [EOM])
+
+All values are little endian. The layout makes it possible to memory-map a
+recording and walk it without parsing the frames.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b"XHREC1\n\x00"
+RECORD_HEADER = struct.Struct("<cdI")
+
+INBOUND = b"<"
+OUTBOUND = b">"
+
+
+class SessionRecorder:
+    """Append every frame sent or received by the client network to a file."""
+
+    def __init__(self, path: str) -> None:
+        self.logger = logging.getLogger("xhaven_core.recorder")
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+            self.file.flush()
+        self.logger.info("Recording session to %s", path)
+
+    def record(self, direction: bytes, frame: bytes) -> None:
+        """Append a single frame to the recording."""
+        header = RECORD_HEADER.pack(direction, time.monotonic(), len(frame))
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(header)
+            self.file.write(frame)
+            # Flush after every frame so the recording survives a crash
+            self.file.flush()
+
+    def close(self) -> None:
+        """Stop recording and close the file."""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+                self.logger.info("Recording to %s stopped", self.path)
+
+
+class SessionReader:
+    """Memory-mapped reader for a recording made by SessionRecorder."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def __iter__(self):
+        """Yield (direction, timestamp, frame) for every record in the file."""
+        if os.path.getsize(self.path) <= len(MAGIC):
+            return
+        with open(self.path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[: len(MAGIC)] != MAGIC:
+                    raise ValueError("%s is not a session recording" % self.path)
+
+                offset = len(MAGIC)
+                end = len(data)
+                while offset + RECORD_HEADER.size <= end:
+                    direction, timestamp, length = RECORD_HEADER.unpack_from(
+                        data, offset
+                    )
+                    offset += RECORD_HEADER.size
+                    if offset + length > end:
+                        # Truncated record, the recorder was probably killed mid-write
+                        break
+                    yield (direction, timestamp, data[offset : offset + length])
+                    offset += length
+
+
+class SessionReplayer:
+    """Feed a recording through a GameState.
+
+    Inbound GameState frames are passed to set_gamestate exactly as the network
+    would. Outbound frames are the result of the local update methods, so they
+    can optionally be replayed too to reproduce the local changes without an
+    echo from the server. Pings, pongs and init messages are skipped.
+    """
+
+    def __init__(self, game_state, path: str, include_outbound: bool = False) -> None:
+        self.logger = logging.getLogger("xhaven_core.recorder")
+        self.game_state = game_state
+        self.reader = SessionReader(path)
+        self.include_outbound = include_outbound
+
+    def replay(self, speed: float = 0.0) -> dict:
+        """Replay the recording and return timing statistics.
+
+        A speed of 1.0 replays at the original pace, 2.0 twice as fast and so on.
+        A speed of 0 replays the frames as fast as possible.
+        """
+        frames = 0
+        busy_time = 0.0
+        start = time.perf_counter()
+        first_timestamp = None
+
+        for direction, timestamp, frame in self.reader:
+            if direction == OUTBOUND and not self.include_outbound:
+                continue
+            if b"GameState:" not in frame:
+                continue
+
+            if speed > 0:
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                # Wait until the frame is due, never go backwards in time
+                due = max(timestamp - first_timestamp, 0.0) / speed
+                delay = due - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+
+            frame_start = time.perf_counter()
+            self.game_state.set_gamestate(frame)
+            busy_time += time.perf_counter() - frame_start
+            frames += 1
+
+        elapsed = time.perf_counter() - start
+        self.logger.info("Replayed %s frames in %.3f s", frames, elapsed)
+        return {
+            "frames": frames,
+            "elapsed": elapsed,
+            "busy_time": busy_time,
+            "frames_per_second": frames / busy_time if busy_time > 0 else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    # Replay a recording as fast as possible, useful as a performance regression input
+    # Example: python -m xhaven_core.recorder session.xhrec
+    import argparse
+
+    from .gamestate import GameState
+
+    parser = argparse.ArgumentParser(description="Replay a recorded X-Haven session")
+    parser.add_argument("path", help="Recording made by SessionRecorder")
+    parser.add_argument(
+        "--speed", type=float, default=0.0, help="1.0 for original pace, 0 for max"
+    )
+    parser.add_argument(
+        "--outbound", action="store_true", help="Also replay frames sent by the client"
+    )
+    args = parser.parse_args()
+
+    replayer = SessionReplayer(GameState({}, {}), args.path, args.outbound)
+    print(replayer.replay(args.speed))
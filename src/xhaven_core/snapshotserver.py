@@ -0,0 +1,177 @@
+"""
+Read-only local HTTP server for GameState snapshots, for overlays and dashboards.
+
+GET /snapshot  The current snapshot as JSON. The ETag is the index and version
+               of the snapshot, a request with a matching If-None-Match header
+               gets 304 Not Modified.
+GET /events    Server-sent events (text/event-stream) with one JSON message
+               per GameState change event, see events.py.
+
+/snapshot is served from the last immutable Snapshot published by GameState,
+so it never takes GameState.lock. /events takes the lock once, to subscribe
+when a client connects, and then only reads from its own queue. Server-sent
+events are used for the push channel instead of WebSockets, they need
+nothing outside the standard library and every browser supports them.
+"""
+
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+
+from . import codec
+
+# Seconds between keep-alive comments on the event stream
+KEEPALIVE_INTERVAL = 15.0
+
+
+class Snapshot(NamedTuple):
+    """An immutable view of the GameState, published after every change."""
+
+    index: int
+    version: int
+    etag: str
+    body: bytes
+
+
+def build_snapshot(game_state, version: int) -> Snapshot:
+    """Build a Snapshot of the characters and monsters of a GameState.
+
+    Must be called with the GameState lock held.
+    """
+    characters = []
+    monsters = []
+    for item in game_state.currentList:
+        if item.__class__.__name__ == "Characters":
+            state = item.characterState
+            characters.append(
+                {
+                    "nr": item.character_nr,
+                    "id": item.id,
+                    "name": item.name,
+                    "display": state.display,
+                    "initiative": state.initiative,
+                    "health": state.health,
+                    "maxHealth": state.maxHealth,
+                    "conditions": list(state.conditions or []),
+                }
+            )
+        else:
+            monsters.append(
+                {
+                    "nr": item.monster_nr,
+                    "id": item.id,
+                    "name": item.name,
+                    "standees": [
+                        {
+                            "standeeNr": monster_instance.standeeNr,
+                            "type": monster_instance.type,
+                            "health": monster_instance.health,
+                            "maxHealth": monster_instance.maxHealth,
+                            "conditions": list(monster_instance.conditions or []),
+                        }
+                        for monster_instance in item.monster_instances
+                    ],
+                }
+            )
+    body = codec.dumps(
+        {
+            "index": game_state.index,
+            "version": version,
+            "round": game_state.round,
+            "roundState": game_state.roundState,
+            "scenario": game_state.scenario,
+            "characters": characters,
+            "monsters": monsters,
+        }
+    ).encode("utf-8")
+    return Snapshot(
+        game_state.index, version, '"%s.%s"' % (game_state.index, version), body
+    )
+
+
+def event_message(event) -> bytes:
+    """Encode a change event as a server-sent event."""
+    data = event._asdict()
+    data["type"] = type(event).__name__
+    return b"event: change\ndata: %s\n\n" % codec.dumps(data).encode("utf-8")
+
+
+class _SnapshotRequestHandler(BaseHTTPRequestHandler):
+    server_version = "XHavenSnapshot/1.0"
+
+    def log_message(self, format, *args):
+        self.server.logger.debug(format, *args)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/snapshot":
+            self._send_snapshot()
+        elif path == "/events":
+            self._send_events()
+        else:
+            self.send_error(404)
+
+    def _send_snapshot(self):
+        snapshot = self.server.game_state.snapshot
+        if snapshot is None:
+            self.send_error(503, "No gamestate received yet")
+            return
+        if self.headers.get("If-None-Match") == snapshot.etag:
+            self.send_response(304)
+            self.send_header("ETag", snapshot.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(snapshot.body)))
+        self.send_header("ETag", snapshot.etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(snapshot.body)
+
+    def _send_events(self):
+        subscription = self.server.game_state.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.flush()
+            while self.server.is_running:
+                try:
+                    event = subscription.get(timeout=KEEPALIVE_INTERVAL)
+                    self.wfile.write(event_message(event))
+                except queue.Empty:
+                    self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+        except OSError:
+            # The subscriber went away
+            pass
+        finally:
+            subscription.close()
+
+
+class SnapshotServer(ThreadingHTTPServer):
+    """HTTP server for the snapshots of one GameState, runs in its own thread."""
+
+    daemon_threads = True
+
+    def __init__(self, game_state, host: str = "127.0.0.1", port: int = 8765) -> None:
+        self.logger = logging.getLogger("xhaven_core.snapshotserver")
+        self.game_state = game_state
+        self.is_running = True
+        super().__init__((host, port), _SnapshotRequestHandler)
+        self.port = self.server_address[1]
+
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        self.logger.info("Serving snapshots on http://%s:%s", host, self.port)
+
+    def stop(self) -> None:
+        self.is_running = False
+        self.shutdown()
+        self.server_close()
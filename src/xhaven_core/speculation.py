@@ -0,0 +1,230 @@
+"""
+Speculative execution of spoken commands from partial results.
+
+Normally a command is executed when the recognizer has the final transcript
+of the whole phrase. With speculation the continuous capture also hands out
+the phrase so far every PARTIAL_INTERVAL seconds while the player is still
+speaking, see capture.py. When the partial transcript is a complete command
+against the current roster, and the same command was heard in two partial
+results in a row, it is executed and sent to the app right away.
+
+The final transcript decides:
+
+    same command        nothing is done, the time between the speculative
+                        update and the final transcript is the latency saved
+    other or no command the speculative change is retracted through the undo
+                        history and the final transcript is executed
+
+Only monster and initiative commands are speculated. Undo, redo, end of
+round and status questions always wait for the final transcript.
+
+A change can only be retracted while it is the last change. When another
+microphone or the command line changed the gamestate in between, the
+speculative change is kept and counted as a conflict.
+"""
+
+import logging
+import threading
+import time
+from typing import NamedTuple
+
+from .heartbeat import LatencyStats
+from .speech import parse_monster_action
+
+# Seconds between two partial results of a phrase
+PARTIAL_INTERVAL = 0.3
+
+# Number of partial results in a row that must give the same command
+STABLE_PARTIALS = 2
+
+# Recognizers add punctuation, ranges like 1-4 and lists like 1,3 are kept
+_PUNCTUATION = str.maketrans("", "", ".!?;:\"'")
+
+
+def normalize(text: str) -> str:
+    """Return a transcript in lower case, without punctuation and extra spaces."""
+    return " ".join(text.lower().translate(_PUNCTUATION).split())
+
+
+def command_key(game_state, text: str, character=None):
+    """Return (kind, command) for a complete, unambiguous command, or None.
+
+    Two transcripts with the same key make the same update.
+    """
+    if not text:
+        return None
+    words = normalize(text).split()
+    if not words:
+        return None
+    names = game_state.names
+
+    if words[0] == "monster" and len(words) >= 4:
+        monster_id = game_state.find_monster(words[1])
+        if monster_id is None or monster_id not in game_state.get_monster_index():
+            return None
+        action = parse_monster_action(words[2:])
+        if action is None:
+            return None
+        return ("monster", (monster_id, tuple(sorted(action.items()))))
+
+    if words[0] == "all" and len(words) >= 2:
+        action = parse_monster_action(words)
+        if action is None:
+            return None
+        return ("monster", (None, tuple(sorted(action.items()))))
+
+    if character and words[0] in ("initiative", "init") and len(words) == 2:
+        if not words[1].isdigit():
+            return None
+        return ("initiative", (character, int(words[1])))
+
+    if words[0] == "player" and len(words) == 3:
+        name, initiative = words[1], words[2]
+        if name.isdigit():
+            name, initiative = initiative, name
+        character_id = names.find_character(name)
+        if (
+            not initiative.isdigit()
+            or character_id not in game_state.get_character_index()
+        ):
+            return None
+        return ("initiative", (character_id, int(initiative)))
+    return None
+
+
+class Speculation(NamedTuple):
+    kind: str
+    key: tuple
+    change: object
+    applied: float
+
+
+class CommandStats:
+    """Outcomes of the speculated commands of one kind."""
+
+    def __init__(self) -> None:
+        self.speculated = 0
+        self.confirmed = 0
+        self.rolled_back = 0
+        self.conflicts = 0
+        self.saved = LatencyStats()
+
+    def summary(self) -> dict:
+        return {
+            "speculated": self.speculated,
+            "confirmed": self.confirmed,
+            "rolled_back": self.rolled_back,
+            "conflicts": self.conflicts,
+            "rollback_rate": (
+                self.rolled_back / self.speculated if self.speculated else 0.0
+            ),
+            "saved": self.saved.summary(),
+        }
+
+
+class Speculator:
+    """Execute the commands of one microphone from partial results."""
+
+    def __init__(
+        self, game_state, execute, character=None, stable: int = STABLE_PARTIALS
+    ) -> None:
+        self.logger = logging.getLogger("xhaven_core.speculation")
+        self.game_state = game_state
+        # Executes a transcript, returns True if the gamestate was updated
+        self.execute = execute
+        self.character = character
+        self.stable = stable
+        self.lock = threading.Lock()
+
+        # State of the current phrase
+        self.pending = None
+        self.last_key = None
+        self.seen = 0
+
+        # Kind of command -> CommandStats
+        self.stats = {}
+
+    def _stats(self, kind: str) -> CommandStats:
+        if kind not in self.stats:
+            self.stats[kind] = CommandStats()
+        return self.stats[kind]
+
+    def partial(self, text) -> bool:
+        """Handle a partial transcript, returns True if it was executed."""
+        with self.lock:
+            if self.pending is not None:
+                # One speculative update per phrase
+                return False
+            key = command_key(self.game_state, text, self.character)
+            if key is None:
+                self.last_key = None
+                self.seen = 0
+                return False
+            if key == self.last_key:
+                self.seen += 1
+            else:
+                self.last_key = key
+                self.seen = 1
+            if self.seen < self.stable:
+                return False
+
+            applied = time.monotonic()
+            # Hold the GameState lock until the change is read, so it is not a
+            # change another microphone or the command stream made in between
+            with self.game_state.lock:
+                before = self.game_state.last_change()
+                if not self._execute(text, key):
+                    return False
+                change = self.game_state.last_change()
+            if change is before:
+                change = None
+            self.pending = Speculation(key[0], key, change, applied)
+            self._stats(key[0]).speculated += 1
+            self.logger.debug("Speculatively executed %s", text)
+            return True
+
+    def final(self, text) -> bool:
+        """Handle the final transcript of a phrase, None if it was not understood.
+
+        Returns True if the gamestate was updated now.
+        """
+        with self.lock:
+            pending = self.pending
+            self.pending = None
+            self.last_key = None
+            self.seen = 0
+            key = command_key(self.game_state, text, self.character)
+            if pending is None:
+                return self._execute(text, key)
+
+            stats = self._stats(pending.kind)
+            if key == pending.key:
+                stats.confirmed += 1
+                stats.saved.add(time.monotonic() - pending.applied)
+                return False
+
+            if self.game_state.retract(pending.change):
+                stats.rolled_back += 1
+                self.logger.info("Rolled back speculative update, final: %s", text)
+                updated = True
+            else:
+                stats.conflicts += 1
+                self.logger.error(
+                    "Could not roll back speculative update, it is not the last "
+                    "change any more, final: %s",
+                    text,
+                )
+                updated = False
+            return self._execute(text, key) or updated
+
+    def _execute(self, text, key) -> bool:
+        # A command with a key is executed as it was understood, without the
+        # punctuation and capitals the recognizer added
+        if not text:
+            return False
+        return self.execute(normalize(text) if key else text)
+
+    def summary(self) -> dict:
+        """Return the statistics per kind of command, for the metrics."""
+        with self.lock:
+            return {kind: stats.summary() for kind, stats in self.stats.items()}
@@ -1,19 +1,159 @@
 import logging
-import logging.handlers
 import threading
-import winsound
-import speech_recognition as sr
 
-# create a recognizer object
-r = sr.Recognizer()
+from . import conditions, targets
+
+# speech_recognition and winsound are imported on first use, so importing this
+# module is cheap and works on machines without a microphone setup
+_recognizer = None
+
+# Spoken words for the monster actions, in English and Swedish
+DAMAGE_WORDS = ("damage", "minus", "skada")
+HEAL_WORDS = ("heal", "plus", "hela")
+KILL_WORDS = ("dead", "death", "kill", "död", "döda")
+# Words the recognizer hears instead of a condition name
+CONDITION_WORDS = {"gift": "poison", "poisin": "poison"}
+
+
+def _speech_recognition():
+    # Import speech_recognition on first use
+    import speech_recognition
+
+    return speech_recognition
+
+
+def get_recognizer():
+    """Return the recognizer object, it is created once and shared by all speech objects."""
+    global _recognizer
+    if _recognizer is None:
+        _recognizer = _speech_recognition().Recognizer()
+    return _recognizer
+
+
+def play_sound(file_name: str) -> None:
+    """Play a sound file on Windows, elsewhere the terminal bell is used."""
+    try:
+        import winsound
+    except ImportError:
+        print("\a", end="", flush=True)
+        return
+    # Do not block, other microphones may be waiting for their commands
+    winsound.PlaySound(file_name, winsound.SND_FILENAME | winsound.SND_ASYNC)
+
+
+def start_microphones(
+    game_class,
+    microphones: list,
+    pool=None,
+    pre_roll=None,
+    readback=None,
+    speculate=False,
+) -> list:
+    """Start one speech object per player microphone, see microphones.py."""
+    from .microphones import open_microphones
+
+    return [
+        speech(
+            game_class,
+            device_index=device_index,
+            pool=pool,
+            character=character,
+            source=source,
+            pre_roll=pre_roll,
+            readback=readback,
+            speculate=speculate,
+        )
+        for device_index, source, character in open_microphones(microphones)
+    ]
+
+
+def parse_monster_action(words: list):
+    """Parse "<standees> <action> [amount]", returns update_monsters arguments.
+
+    Returns None if the words are not a complete monster action.
+    """
+    selection, used = targets.parse_targets(words)
+    action = words[used:]
+    if selection is None or not action:
+        return None
+    verb = action[0].lower()
+    amount = None
+    if len(action) > 1 and action[1].isdigit():
+        amount = int(action[1])
+
+    health = 0
+    relative = True
+    condition = ""
+    if any(word in verb for word in DAMAGE_WORDS) and amount is not None:
+        health = -amount
+    elif any(word in verb for word in HEAL_WORDS) and amount is not None:
+        health = amount
+    elif any(word in verb for word in KILL_WORDS):
+        relative = False
+    elif verb.isdigit():
+        health = int(verb)
+        relative = False
+    elif conditions.parse(CONDITION_WORDS.get(verb, verb)) is not None:
+        condition = CONDITION_WORDS.get(verb, verb)
+    else:
+        return None
+
+    return {
+        "standee_nrs": selection.standee_nrs,
+        "standee_type": selection.standee_type,
+        "health": health,
+        "relative": relative,
+        "condition": condition,
+    }
 
 
 class speech:
     """A speech recognition system for XHaven."""
 
-    def __init__(self, game_class) -> None:
+    def __init__(
+        self,
+        game_class,
+        device_index=None,
+        workers=0,
+        pool=None,
+        character=None,
+        source=None,
+        pre_roll=None,
+        readback=None,
+        speculate=False,
+    ) -> None:
         self.game_class = game_class
+        # Microphone to listen to, None is the default microphone
+        self.device_index = device_index
+        # Audio source to listen to instead, like one channel of a multichannel device
+        self.source = source
+        # Character of the player using this microphone, commands without a
+        # character name are for this character
+        self.character = character
+        # Seconds of audio kept from before a phrase starts, None listens with
+        # speech_recognition instead of the continuous capture in capture.py
+        self.pre_roll = pre_roll
+        self.capture = None
+        # Optional spoken answers to status questions, see readback.py
+        self.readback = readback
+        # Execute commands from partial results before the phrase has ended,
+        # needs the continuous capture, see speculation.py
+        self.speculator = None
+        if speculate:
+            from .speculation import Speculator
+
+            self.speculator = Speculator(game_class, self.execute_text, character)
+        # Optional pool of recognition worker processes, see recognitionpool.py
+        # A pool can be shared by several speech objects
+        self.pool = pool
+        if self.pool is None and workers > 0:
+            from .recognitionpool import RecognitionPool
+
+            self.pool = RecognitionPool(workers)
+        self.is_running = True
         self.logger = logging.getLogger("xhaven_core.speech")
+        if character:
+            self.logger = self.logger.getChild(character)
         self.logger.setLevel(logging.DEBUG)
 
         file_handler = logging.FileHandler("xhaven_speech.log")
@@ -21,131 +161,204 @@ class speech:
         self.logger.info("Starting speech recognition...")
 
         # Start a new thread to handle receiving data
-        threading.Thread(target=self.start_recognition).start()
+        self.thread = threading.Thread(target=self.start_recognition, daemon=True)
+        self.thread.start()
 
     def start_recognition(self):
         """Start speech recognition."""
-        # use the default microphone as the audio source
-        while True:
-            with sr.Microphone() as source:
+        sr = _speech_recognition()
+        if self.pre_roll is not None and self.source is None:
+            self.listen_continuously()
+            return
+
+        # Every microphone has its own recognizer, the energy threshold adapts
+        # to the noise level of that microphone
+        r = sr.Recognizer()
+        while self.is_running:
+            source = self.source or sr.Microphone(device_index=self.device_index)
+            with source:
                 # listen for audio and store it in audio_data variable
                 audio_data = r.listen(source)
                 print("Processing...")
+            if not self.is_running:
+                # Stopped while listening, the source may have been closed
+                break
 
-            # recognize speech using Google Speech Recognition
-            gamestate_updated = False
+            if self.pool:
+                # Recognize in a worker process, the results of this microphone
+                # come back in order
+                self.pool.submit(audio_data, self.execute_result, stream=self)
+            else:
+                self.execute_result(self.recognize(audio_data))
+
+    def listen_continuously(self):
+        """Recognize the phrases of a continuous capture with pre-roll."""
+        from .capture import ContinuousCapture
+
+        sr = _speech_recognition()
+        partial_interval = None
+        if self.speculator:
+            from .speculation import PARTIAL_INTERVAL as partial_interval
+        self.capture = ContinuousCapture(
+            self.device_index,
+            pre_roll=self.pre_roll,
+            partial_interval=partial_interval,
+        )
+        self.capture.start()
+        while self.is_running:
+            segment = self.capture.next_segment()
+            if segment is None:
+                break
+            if not segment.final and not self.capture.segments.empty():
+                # Recognition is behind, skip to the newer part of the phrase
+                continue
+            callback = self.execute_result if segment.final else self.execute_partial
+            if segment.final:
+                print("Processing...")
+            if self.pool:
+                # The samples are copied straight from the ring buffer to the worker
+                self.pool.submit(segment, callback, stream=self)
+            else:
+                audio_data = sr.AudioData(
+                    segment.samples.tobytes(), segment.sample_rate, 2
+                )
+                callback(self.recognize(audio_data))
+
+    def recognize(self, audio_data):
+        """Return the text spoken in audio_data, or None if it could not be recognized."""
+        sr = _speech_recognition()
+        r = get_recognizer()
+        # recognize speech using Google Speech Recognition
+        try:
+            # text = r.recognize_whisper(audio_data)
+            text = r.recognize_google(audio_data)
+            self.logger.debug("You said: %s", text)
+            return text
+        except sr.UnknownValueError:
+            self.logger.debug("Sorry, I could not understand what you said.")
+        except sr.RequestError as e:
+            self.logger.debug(
+                "Could not request results from Google Speech Recognition service; %s",
+                e,
+            )
+        return None
+
+    def execute_result(self, text):
+        """Execute recognized text and play a sound if the gamestate was updated."""
+        if self.speculator:
+            # Confirms or rolls back a command executed from a partial result
+            if self.speculator.final(text if type(text) == str else None):
+                play_sound("ping.wav")
+        elif text is not None and type(text) == str:
+            if self.execute_text(text):
+                play_sound("ping.wav")
+
+    def execute_partial(self, text):
+        """Execute the partial text of a phrase if it is a complete command."""
+        if text is not None and type(text) == str:
+            if self.speculator.partial(text):
+                play_sound("ping.wav")
+
+    def execute_text(self, text: str) -> bool:
+        """Execute a spoken command, returns True if the gamestate was updated."""
+        gamestate_updated = False
+        text_line = text.split(" ")
+
+        # Undo or redo the last change
+        # Example: undo
+        if text_line[0].lower() == "undo":
+            gamestate_updated = self.game_class.undo()
+        elif text_line[0].lower() == "redo":
+            gamestate_updated = self.game_class.redo()
+
+        # Initiative from a player's own microphone
+        # Example: initiative 45
+        if (
+            self.character
+            and text_line[0].lower() in ("initiative", "init")
+            and len(text_line) == 2
+        ):
             try:
-                # text = r.recognize_whisper(audio_data)
-                text = r.recognize_google(audio_data)
-                self.logger.debug("You said: %s", text)
-                if text is not None and type(text) == str:
-                    text_line = text.split(" ")
-
-                    # Check if the first word is "spelare"
-                    if text_line[0] == "player" and len(text_line) in [3, 4]:
-                        # Update character initiative with the given value
-                        # Example: Player Hatchet 10
-                        try:
-                            name = text_line[1]
-                            initiative = int(text_line[2])
-                            gamestate_updated = self.game_class.update_initiative(
-                                name, initiative
-                            )
-                            self.logger.debug("Update spelare initiativ: %s", text)
-                        except ValueError:
-                            try:
-                                name = text_line[2]
-                                initiative = int(text_line[1])
-                                gamestate_updated = self.game_class.update_initiative(
-                                    name, initiative
-                                )
-                            except ValueError:
-                                pass
-
-                    # Check if the first word is "monster"
-                    if text_line[0] == "monster" and len(text_line) in [4, 5]:
-                        # Update monster health with the given value
-                        # Example: monster Adam 3 skada/minus/damage 10-> Helath -= 10
-                        # Example: monster Adam 3 plus/hela 10 -> Health += 10
-                        # Example: monster Adam 3 gift/poison -> Poison monster
-                        # Example: monster Adam 3 10 -> Health = 10
-                        # Example: monster Adam 3 död/döda -> Health = 0
-
-                        try:
-                            monster_name = text_line[1]
-                            monster_nr = int(text_line[2])
-                            if (
-                                "skada" in text_line[3]
-                                or "minus" in text_line[3]
-                                or "damage" in text_line[3]
-                            ):
-                                try:
-                                    monster_health = -int(text_line[4])
-                                    gamestate_updated = (
-                                        self.game_class.update_monster_health(
-                                            monster_name,
-                                            monster_nr,
-                                            monster_health,
-                                            True,
-                                        )
-                                    )
-                                except ValueError:
-                                    pass
-                            elif "plus" in text_line[3] or "heal" in text_line[3]:
-                                try:
-                                    monster_health = int(text_line[4])
-                                    gamestate_updated = (
-                                        self.game_class.update_monster_health(
-                                            monster_name,
-                                            monster_nr,
-                                            monster_health,
-                                            True,
-                                        )
-                                    )
-                                except ValueError:
-                                    pass
-                            elif "dead" in text_line[3] or "death" in text_line[3]:
-                                gamestate_updated = (
-                                    self.game_class.update_monster_health(
-                                        monster_name, monster_nr, 0, False
-                                    )
-                                )
-                            elif "poisin" in text_line[3] or "gift" in text_line[3]:
-                                condition = "poison"
-                                gamestate_updated = (
-                                    self.game_class.update_monster_condition(
-                                        monster_name, monster_nr, condition, True
-                                    )
-                                )
-                            elif len(text_line) == 4:
-                                try:
-                                    monster_health = int(text_line[3])
-                                    gamestate_updated = (
-                                        self.game_class.update_monster_health(
-                                            monster_name,
-                                            monster_nr,
-                                            monster_health,
-                                            False,
-                                        )
-                                    )
-                                except ValueError:
-                                    pass
-                        except ValueError:
-                            pass
-
-            except sr.UnknownValueError:
-                self.logger.debug("Sorry, I could not understand what you said.")
-            except sr.RequestError as e:
-                self.logger.debug(
-                    "Could not request results from Google Speech Recognition service; %s",
-                    e,
+                initiative = int(text_line[1])
+                gamestate_updated = self.game_class.update_initiative(
+                    name=self.character, initiative=initiative
                 )
+                self.logger.debug("Update initiative of %s: %s", self.character, text)
+            except ValueError:
+                pass
+
+        # Answer with speech, does not change the gamestate
+        # Example: status monster 2, status Krabban 3, status Daniel
+        if text_line[0].lower() == "status" and self.readback:
+            self.readback.status(self.game_class, text_line[1:])
+
+        # Apply wound, regenerate and condition expiry to everyone
+        # Example: end of round
+        if text.lower().strip() in ("end round", "end of round"):
+            gamestate_updated = self.game_class.end_round()
+
+        # Check if the first word is "spelare"
+        if text_line[0].lower() == "player" and len(text_line) in [3, 4]:
+            # Update character initiative with the given value
+            # Example: Player Hatchet 10
+            try:
+                name = text_line[1]
+                initiative = int(text_line[2])
+                gamestate_updated = self.game_class.update_initiative(
+                    name=name, initiative=initiative
+                )
+                self.logger.debug("Update spelare initiativ: %s", text)
+            except ValueError:
+                try:
+                    name = text_line[2]
+                    initiative = int(text_line[1])
+                    gamestate_updated = self.game_class.update_initiative(
+                        name=name, initiative=initiative
+                    )
+                except ValueError:
+                    pass
+
+        # Check if the first word is "monster"
+        if text_line[0].lower() == "monster" and len(text_line) >= 4:
+            # Update the health or conditions of one or more standees
+            # Example: monster Adam 3 skada/minus/damage 10-> Helath -= 10
+            # Example: monster Adam 3 plus/hela 10 -> Health += 10
+            # Example: monster Adam 3 gift/poison -> Poison monster
+            # Example: monster Adam 3 10 -> Health = 10
+            # Example: monster Adam 3 död/döda -> Health = 0
+            # Example: monster Adam 1 to 4 damage 2 -> Area attack on standees 1-4
+            # Example: monster Adam all elites poison
+            gamestate_updated = self.monster_command(text_line[1], text_line[2:])
+
+        # Commands for the standees of all monsters
+        # Example: all elites poison
+        if text_line[0].lower() == "all" and len(text_line) >= 2:
+            gamestate_updated = self.monster_command("", text_line, all_groups=True)
+
+        return gamestate_updated
+
+    def monster_command(
+        self, monster_name: str, words: list, all_groups: bool = False
+    ) -> bool:
+        """Execute "<standees> <action> [amount]" for a monster, see targets.py."""
+        action = parse_monster_action(words)
+        if action is None:
+            return False
+        return self.game_class.update_monsters(
+            name=monster_name, all_groups=all_groups, **action
+        )
 
-            if gamestate_updated:
-                winsound.PlaySound("ping.wav", winsound.SND_FILENAME)
+    def stop(self):
+        """Stop listening without waiting for the current phrase."""
+        self.is_running = False
+        if self.source is not None:
+            self.source.close()
+        if self.capture is not None:
+            self.capture.close()
 
     def stop_recognition(self):
         """Stop speech recognition."""
         self.logger.info("Stopping speech recognition...")
+        self.is_running = False
         self.thread.join()
         self.logger.info("Speech recognition stopped")
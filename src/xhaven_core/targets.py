@@ -0,0 +1,101 @@
+"""
+Standee selections for commands that affect several standees at once.
+
+Used by the spoken commands and the command line, for example:
+
+    all             every standee of the monster
+    elites          every elite standee, also "normals" and "boss"
+    1-4             standees 1 to 4, also "1 to 4" and "1 through 4"
+    1,3,5           standees 1, 3 and 5, also "1 and 3 and 5"
+    all elites      every elite standee
+
+A number that directly follows another number without "and", "to" or a comma
+ends the selection, so in "monster Krabban 3 10" the 10 is the new health.
+"""
+
+from typing import NamedTuple
+
+# MonsterInstances.type values
+NORMAL = 0
+ELITE = 1
+BOSS = 2
+
+STANDEE_TYPES = {
+    "normal": NORMAL,
+    "normals": NORMAL,
+    "elite": ELITE,
+    "elites": ELITE,
+    "boss": BOSS,
+    "bosses": BOSS,
+}
+
+ALL_WORDS = ("all", "every", "everyone")
+RANGE_WORDS = ("to", "through", "until")
+FILLER_WORDS = ("and", "standee", "standees", "number", "nr")
+
+
+class Targets(NamedTuple):
+    """Selected standees, None means no restriction."""
+
+    standee_nrs: tuple = None
+    standee_type: int = None
+
+
+def _numbers(word: str):
+    # Return the standee numbers in a word like 3, 1-4, 1..4 or 1,3,5
+    numbers = []
+    for part in word.split(","):
+        if not part:
+            continue
+        if "-" in part or ".." in part:
+            first, _, last = part.replace("..", "-").partition("-")
+            if not (first.isdigit() and last.isdigit()):
+                return None
+            numbers.extend(range(int(first), int(last) + 1))
+        elif part.isdigit():
+            numbers.append(int(part))
+        else:
+            return None
+    return numbers
+
+
+def parse_targets(words: list) -> tuple:
+    """Parse a standee selection from the start of words.
+
+    Returns (Targets, number of words used), Targets is None when words does
+    not start with a selection.
+    """
+    standee_nrs = []
+    standee_type = None
+    everything = False
+    expect_number = True
+    in_range = False
+    used = 0
+
+    for position, word in enumerate(words):
+        word = word.lower()
+        if word in ALL_WORDS:
+            everything = True
+            expect_number = False
+        elif word in STANDEE_TYPES:
+            standee_type = STANDEE_TYPES[word]
+            expect_number = False
+        elif word in RANGE_WORDS and standee_nrs:
+            in_range = True
+            expect_number = True
+        elif word in FILLER_WORDS:
+            expect_number = True
+        else:
+            numbers = _numbers(word)
+            if not numbers or not expect_number:
+                break
+            if in_range:
+                numbers = list(range(standee_nrs[-1] + 1, numbers[0] + 1)) + numbers[1:]
+                in_range = False
+            standee_nrs.extend(numbers)
+            expect_number = word.endswith(",")
+        used = position + 1
+
+    if not (standee_nrs or everything or standee_type is not None):
+        return None, 0
+    return Targets(tuple(standee_nrs) or None, standee_type), used
@@ -0,0 +1,299 @@
+"""
+Columnar timeline of the characters and standees for analytics after a session.
+
+After every change of the GameState, one row per character and standee is
+appended to typed columns:
+
+    session      number of the recording the row was loaded from, see
+                 Timeline.load
+    sample       number of the change in the recording, a figure that is
+                 missing from one sample to the next was removed
+    index        gamestate index
+    round        round number
+    time         wall clock time in seconds
+    kind         CHARACTER or STANDEE
+    entity       character id or monster id, as a code into the entities table
+    standee_nr   standee number, 0 for characters
+    standee_type normal (0), elite (1) or boss (2), -1 for characters
+    health, max_health, initiative (0 for standees)
+    conditions   condition bits, see conditions.py
+
+The columns are array.array objects, so recording costs a few appends per
+figure. Every flush_rows rows they are written to a segment file
+<path>.<n>.npz and cleared, so memory stays bounded. Timeline.load reads all
+segments of one or more sessions into NumPy arrays, and the queries answer
+campaign wide aggregates from them without parsing any JSON:
+
+    recorder = game_state.record_timeline("session1")
+    ...
+    game_state.stop_timeline()
+
+    timeline = Timeline.load(["session1", "session2"])
+    timeline.damage_per_round()
+    timeline.initiative_trend("Demolitionist")
+    timeline.kills_per_monster()
+
+Requires numpy, install with pip install .[timeline]
+"""
+
+import array
+import glob
+import logging
+import os
+import time
+
+import numpy
+
+CHARACTER = 0
+STANDEE = 1
+
+# Column name -> array.array type code and NumPy dtype
+COLUMNS = {
+    "sample": ("q", numpy.int64),
+    "index": ("l", numpy.int64),
+    "round": ("l", numpy.int32),
+    "time": ("d", numpy.float64),
+    "kind": ("b", numpy.int8),
+    "entity": ("l", numpy.int32),
+    "standee_nr": ("l", numpy.int16),
+    "standee_type": ("b", numpy.int8),
+    "health": ("l", numpy.int32),
+    "max_health": ("l", numpy.int32),
+    "initiative": ("l", numpy.int16),
+    "conditions": ("q", numpy.int64),
+}
+
+
+def segment_paths(path: str) -> list:
+    """Return the segment files of a recording in the order they were written."""
+    paths = glob.glob(glob.escape(path) + ".*.npz")
+    return sorted(paths, key=lambda name: int(name[len(path) + 1 : -len(".npz")]))
+
+
+class TimelineRecorder:
+    """Append a row per figure after every change, written in segments."""
+
+    def __init__(self, path: str, flush_rows: int = 100000) -> None:
+        self.logger = logging.getLogger("xhaven_core.timeline")
+        self.path = path
+        self.flush_rows = flush_rows
+        segments = segment_paths(path)
+        self.segment = len(segments)
+        # Continue the samples of an earlier run with the same path
+        self.sample = 0
+        if segments:
+            with numpy.load(segments[-1]) as data:
+                self.sample = int(data["sample"].max()) + 1
+        self.columns = {name: array.array(code) for name, (code, _) in COLUMNS.items()}
+        self.entities = {}
+        self.rows = 0
+
+    def _entity(self, entity_id) -> int:
+        code = self.entities.get(entity_id)
+        if code is None:
+            code = self.entities[entity_id] = len(self.entities)
+        return code
+
+    def record(self, game_state) -> None:
+        """Append the current figures of a GameState, called with its lock held."""
+        index = game_state.index
+        sample = self.sample
+        self.sample += 1
+        columns = self.columns
+        round_number = game_state.round or 0
+        now = time.time()
+
+        for item in game_state.currentList:
+            if item.__class__.__name__ == "Characters":
+                figures = ((CHARACTER, item.characterState, 0, -1),)
+            else:
+                figures = [
+                    (STANDEE, instance, instance.standeeNr or 0, instance.type)
+                    for instance in item.monster_instances
+                ]
+            entity = self._entity(item.id)
+            for kind, state, standee_nr, standee_type in figures:
+                columns["sample"].append(sample)
+                columns["index"].append(index)
+                columns["round"].append(round_number)
+                columns["time"].append(now)
+                columns["kind"].append(kind)
+                columns["entity"].append(entity)
+                columns["standee_nr"].append(standee_nr)
+                columns["standee_type"].append(
+                    standee_type if standee_type is not None else -1
+                )
+                columns["health"].append(state.health or 0)
+                columns["max_health"].append(state.maxHealth or 0)
+                columns["initiative"].append(
+                    (state.initiative or 0) if kind == CHARACTER else 0
+                )
+                columns["conditions"].append(state.conditions.bits)
+                self.rows += 1
+
+        if self.rows >= self.flush_rows:
+            try:
+                self.flush()
+            except OSError:
+                # Keep the rows and try again with the next update
+                self.logger.exception("Could not write timeline segment")
+
+    def flush(self) -> None:
+        """Write the rows recorded since the last flush to a new segment."""
+        if not self.rows:
+            return
+        path = "%s.%d.npz" % (self.path, self.segment)
+        arrays = {
+            name: numpy.asarray(self.columns[name]).astype(dtype)
+            for name, (_, dtype) in COLUMNS.items()
+        }
+        entities = sorted(self.entities, key=self.entities.get)
+        arrays["entities"] = numpy.array(entities, dtype=str)
+        # Write to a temporary file first, a crash never leaves half a segment
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            numpy.savez(file, **arrays)
+        os.replace(temporary, path)
+        self.logger.info("Wrote %s timeline rows to %s", self.rows, path)
+
+        self.segment += 1
+        self.columns = {name: array.array(code) for name, (code, _) in COLUMNS.items()}
+        self.entities = {}
+        self.rows = 0
+
+    def close(self) -> None:
+        """Write the remaining rows."""
+        self.flush()
+
+
+class Timeline:
+    """The rows of one or more recordings as NumPy arrays, with queries."""
+
+    def __init__(self, columns: dict, entities) -> None:
+        # Column name -> array, see COLUMNS, and the session column
+        self.columns = columns
+        self.entities = entities
+
+    @classmethod
+    def load(cls, paths) -> "Timeline":
+        """Load the segments of recordings, a path or a list of paths.
+
+        Every recording is a session, numbered in the order given.
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        parts = {name: [] for name in COLUMNS}
+        parts["session"] = []
+        entities = {}
+        for session, path in enumerate(paths):
+            for segment in segment_paths(path):
+                with numpy.load(segment) as data:
+                    # Map the entity codes of the segment to the combined table
+                    codes = numpy.array(
+                        [
+                            entities.setdefault(str(name), len(entities))
+                            for name in data["entities"]
+                        ],
+                        dtype=numpy.int32,
+                    )
+                    for name in COLUMNS:
+                        parts[name].append(data[name])
+                    parts["entity"][-1] = codes[data["entity"]]
+                    parts["session"].append(
+                        numpy.full(len(data["index"]), session, dtype=numpy.int16)
+                    )
+
+        columns = {}
+        for name, values in parts.items():
+            dtype = COLUMNS[name][1] if name in COLUMNS else numpy.int16
+            columns[name] = (
+                numpy.concatenate(values) if values else numpy.zeros(0, dtype=dtype)
+            )
+        table = numpy.array(sorted(entities, key=entities.get), dtype=str)
+        return cls(columns, table)
+
+    def __len__(self) -> int:
+        return len(self.columns["index"])
+
+    def _entity_code(self, entity_id: str):
+        matches = numpy.nonzero(self.entities == entity_id)[0]
+        return int(matches[0]) if len(matches) else None
+
+    def _figure_order(self):
+        # Rows sorted by figure and then by index, and where each figure starts
+        c = self.columns
+        order = numpy.lexsort(
+            (c["sample"], c["standee_nr"], c["entity"], c["kind"], c["session"])
+        )
+        keys = numpy.stack(
+            [c[name][order] for name in ("session", "kind", "entity", "standee_nr")]
+        )
+        same_figure = numpy.all(keys[:, 1:] == keys[:, :-1], axis=0)
+        # A standee number that is used again after a kill is a new figure
+        sample = c["sample"][order]
+        same_figure &= sample[1:] == sample[:-1] + 1
+        return order, same_figure
+
+    def damage_per_round(self, kind: int = None) -> dict:
+        """Return {round: health lost} over all sessions.
+
+        Damage is every drop of health between two samples of the same figure,
+        counted in the round of the later sample. kind limits it to CHARACTER
+        or STANDEE figures. Damage that killed a standee is not included, the
+        killed standee has no later sample.
+        """
+        if len(self) < 2:
+            return {}
+        order, same_figure = self._figure_order()
+        health = self.columns["health"][order]
+        loss = health[:-1] - health[1:]
+        mask = same_figure & (loss > 0)
+        if kind is not None:
+            mask &= self.columns["kind"][order][1:] == kind
+        rounds = self.columns["round"][order][1:][mask]
+        totals = numpy.bincount(rounds, weights=loss[mask]) if len(rounds) else []
+        return {
+            round_number: int(total)
+            for round_number, total in enumerate(totals)
+            if total
+        }
+
+    def initiative_trend(self, character_id: str, session: int = None) -> dict:
+        """Return {round: initiative} with the last initiative of each round."""
+        code = self._entity_code(character_id)
+        if code is None:
+            return {}
+        c = self.columns
+        mask = (c["kind"] == CHARACTER) & (c["entity"] == code)
+        if session is not None:
+            mask &= c["session"] == session
+        rows = numpy.nonzero(mask)[0]
+        rows = rows[numpy.lexsort((c["sample"][rows], c["session"][rows]))]
+        return {
+            int(round_number): int(initiative)
+            for round_number, initiative in zip(
+                c["round"][rows], c["initiative"][rows]
+            )
+        }
+
+    def kills_per_monster(self) -> dict:
+        """Return {monster id: standees removed while the session went on}."""
+        c = self.columns
+        if not len(self):
+            return {}
+        order, same_figure = self._figure_order()
+        # The last sample of every figure
+        last = numpy.append(~same_figure, True)
+        rows = order[last]
+        rows = rows[c["kind"][rows] == STANDEE]
+
+        sessions = c["session"]
+        session_end = numpy.zeros(int(sessions.max()) + 1, dtype=numpy.int64)
+        numpy.maximum.at(session_end, sessions, c["sample"])
+        killed = rows[c["sample"][rows] < session_end[sessions[rows]]]
+        counts = numpy.bincount(c["entity"][killed], minlength=len(self.entities))
+        return {
+            str(self.entities[code]): int(count)
+            for code, count in enumerate(counts)
+            if count
+        }
@@ -0,0 +1,135 @@
+"""
+Validation and quarantine of the frames received from the X-Haven app.
+
+A GameState frame is checked before anything in the GameState is changed:
+
+    split_frame     the envelope S3nD:Index:<n>Description:<text>GameState:{...}[EOM]
+    check_gamestate the decoded JSON has the required keys, and every entry of
+                    currentList is a character or a monster with standees
+
+Frames that fail are raised as FrameError. The client network writes them to
+a Quarantine file and keeps running on the last good gamestate.
+
+A quarantine file has one JSON object per line with the time, the reason and
+the frame, and is limited to max_bytes. When it is full it is renamed to
+<path>.1, replacing the older one, so at most two files are kept.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+PREFIX = b"S3nD:Index:"
+EOM = b"[EOM]"
+
+# Keys every gamestate from the app has, see codec.GAMESTATE_SCHEMA
+REQUIRED_KEYS = ("level", "round", "roundState", "currentList")
+
+# Longest part of a rejected frame that is logged, the quarantine has all of it
+LOG_LENGTH = 200
+
+
+class FrameError(ValueError):
+    """A frame from the app that is malformed or incomplete."""
+
+
+def split_frame(frame: bytes) -> tuple:
+    """Return (index, description, gamestate JSON) of a GameState frame.
+
+    Only the envelope is checked, in one pass over the markers.
+    Raises FrameError when the envelope is not valid.
+    """
+    if not frame.startswith(PREFIX):
+        raise FrameError("Frame does not start with %r" % PREFIX)
+    if not frame.endswith(EOM):
+        raise FrameError("Frame does not end with %r" % EOM)
+    description_start = frame.find(b"Description:", len(PREFIX))
+    if description_start == -1:
+        raise FrameError("Frame has no Description:")
+    data_start = frame.find(b"GameState:", description_start)
+    if data_start == -1:
+        raise FrameError("Frame has no GameState:")
+
+    try:
+        index = int(frame[len(PREFIX) : description_start])
+    except ValueError:
+        raise FrameError(
+            "Index %r is not a number" % frame[len(PREFIX) : description_start][:20]
+        ) from None
+    try:
+        description = frame[description_start + 12 : data_start].decode("utf-8")
+        data = frame[data_start + 10 : -len(EOM)].decode("utf-8")
+    except UnicodeDecodeError as error:
+        raise FrameError("Frame is not valid UTF-8: %s" % error) from None
+
+    stripped = data.strip()
+    if not (stripped.startswith("{") and stripped.endswith("}")):
+        raise FrameError("GameState is not a JSON object, the frame may be truncated")
+    return index, description, data
+
+
+def check_gamestate(sections: dict) -> None:
+    """Check the decoded gamestate, raises FrameError if it can not be used."""
+    missing = [key for key in REQUIRED_KEYS if key not in sections]
+    if missing:
+        raise FrameError("GameState is missing %s" % ", ".join(missing))
+    current_list = sections["currentList"]
+    if not isinstance(current_list, list):
+        raise FrameError("currentList is not a list")
+    for position, item in enumerate(current_list):
+        if not isinstance(item, dict) or "id" not in item:
+            raise FrameError("currentList[%s] has no id" % position)
+        if "characterState" in item:
+            if not isinstance(item["characterState"], dict):
+                raise FrameError("characterState of %s is not an object" % item["id"])
+        elif "monsterInstances" in item:
+            instances = item["monsterInstances"]
+            if not isinstance(instances, list) or not all(
+                isinstance(instance, dict) and "standeeNr" in instance
+                for instance in instances
+            ):
+                raise FrameError("monsterInstances of %s are not valid" % item["id"])
+
+
+def shorten(frame: bytes, length: int = LOG_LENGTH) -> bytes:
+    """Return the start of a frame for the log."""
+    if len(frame) <= length:
+        return frame
+    return frame[:length] + b"... (%d bytes)" % len(frame)
+
+
+class Quarantine:
+    """Bounded file of rejected frames for later analysis."""
+
+    def __init__(self, path: str, max_bytes: int = 4 * 1024 * 1024) -> None:
+        self.logger = logging.getLogger("xhaven_core.validation")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def add(self, frame: bytes, reason: str) -> None:
+        """Write a rejected frame and the reason to the quarantine file."""
+        line = json.dumps(
+            {
+                "time": time.time(),
+                "reason": reason,
+                "frame": frame.decode("utf-8", "backslashreplace"),
+            }
+        )
+        data = (line + "\n").encode("utf-8")
+        with self.lock:
+            self.count += 1
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                size = 0
+            try:
+                if size and size + len(data) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "ab") as file:
+                    file.write(data)
+            except OSError as error:
+                self.logger.error("Could not quarantine frame: %s", error)
@@ -0,0 +1,143 @@
+"""
+Warm start from the last gamestate after a crash or restart.
+
+Without it nothing can be shown or parsed until the app answers the
+gamestate request, which takes several seconds after connecting. WarmStart
+keeps the last accepted gamestate with its index in a local file, written at
+most every interval seconds on a thread. The file is replaced atomically, a
+crash while writing leaves the previous snapshot.
+
+At startup restore loads it into the GameState, so names and standees can be
+resolved and commands parsed right away. The first gamestate from the app
+reconciles it by index:
+
+    same index      the app did not change since the snapshot, local updates
+                    made in the meantime are kept and sent
+    other index     the app moved on or was restarted, its gamestate replaces
+                    the snapshot and local updates made on it are discarded
+
+Updates made before the first gamestate arrives are not sent, they would be
+based on a state the app may no longer have.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+VERSION = 1
+
+
+def save(game_state, path: str) -> None:
+    """Write the gamestate with its index to path, atomically."""
+    with game_state.lock:
+        snapshot = {
+            "version": VERSION,
+            "saved": time.time(),
+            "index": game_state.index,
+            "description": game_state.description,
+            "gamestate": game_state.get_gamestate(),
+        }
+    temporary = path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump(snapshot, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def load(path: str):
+    """Return the snapshot in path, or None if there is no usable one."""
+    logger = logging.getLogger("xhaven_core.warmstart")
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            snapshot = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as error:
+        logger.warning("Could not read snapshot %s: %s", path, error)
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != VERSION:
+        logger.warning("Snapshot %s has an unknown version", path)
+        return None
+    return snapshot
+
+
+class WarmStart:
+    """Save the gamestate after changes and restore it at startup."""
+
+    def __init__(self, path: str, interval: float = 1.0) -> None:
+        self.logger = logging.getLogger("xhaven_core.warmstart")
+        self.path = path
+        self.interval = interval
+        self.game_state = None
+        # Wakes up the writer, pending is True while a change is not written
+        self.dirty = threading.Event()
+        self.pending = False
+        self.stopped = threading.Event()
+        self.thread = None
+        self.saves = 0
+
+    def restore(self, game_state) -> bool:
+        """Load the snapshot into game_state, returns False if there is none."""
+        snapshot = load(self.path)
+        if snapshot is None:
+            return False
+        try:
+            game_state.restore(
+                snapshot["index"], snapshot["description"], snapshot["gamestate"]
+            )
+        except ValueError as error:
+            self.logger.warning("Snapshot %s is not valid: %s", self.path, error)
+            return False
+        self.logger.info(
+            "Restored gamestate %s saved %.0f s ago",
+            snapshot["index"],
+            time.time() - snapshot["saved"],
+        )
+        return True
+
+    def start(self, game_state) -> None:
+        """Save the gamestate of game_state after every change."""
+        self.game_state = game_state
+        game_state.warm_start = self
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def changed(self) -> None:
+        """Called by GameState after a change, with its lock held."""
+        self.pending = True
+        self.dirty.set()
+
+    def _run(self) -> None:
+        while not self.stopped.is_set():
+            self.dirty.wait()
+            if self.stopped.is_set():
+                break
+            self.dirty.clear()
+            self._save()
+            # Write at most once per interval, later changes wait for the next
+            self.stopped.wait(self.interval)
+
+    def _save(self) -> None:
+        self.pending = False
+        try:
+            save(self.game_state, self.path)
+            self.saves += 1
+        except OSError:
+            self.logger.exception("Could not write snapshot %s", self.path)
+
+    def stop(self) -> None:
+        """Stop saving, a change that was not written yet is written now."""
+        if self.game_state is None:
+            return
+        self.game_state.warm_start = None
+        self.stopped.set()
+        self.dirty.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.pending:
+            self._save()
@@ -0,0 +1,76 @@
+"""
+Run several X-Haven tables from one process, see xhaven_core/hub.py."""
+
+from xhaven_core import profiling
+from xhaven_core.hub import Hub
+import logging
+import logging.handlers
+import json
+import os
+import sys
+
+if __name__ == "__main__":
+    logger = logging.getLogger("xhaven_core")
+    logger.setLevel(logging.DEBUG)
+    socket_handler = logging.handlers.SocketHandler(
+        "localhost", 19996
+    )  # Cutelog's default port is 19996
+    logger.addHandler(socket_handler)
+
+    # Read the tables from the JSON file given as argument or next to this file
+    if len(sys.argv) > 1:
+        file_path = sys.argv[1]
+    else:
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        file_path = os.path.join(current_dir, "hub_parameters.json")
+
+    hub = Hub.from_file(file_path)
+    hub.watch_config()
+    hub.start(speech=bool(hub.audio_routes) or hub.player_microphones)
+
+    # CPU profiling and memory snapshots on demand, see profiling.py
+    profiler = profiling.Profiler()
+    profiler.install_signals()
+
+    while True:
+        key_input = input("Enter a command: ").split()
+        if not key_input:
+            continue
+
+        if key_input[0] == "q":
+            print("Exiting")
+            profiler.stop()
+            hub.stop()
+            break
+        elif key_input[0] == "l":
+            print(json.dumps(hub.metrics(), indent=2))
+        elif key_input[0] in ("r", "i"):
+            # A mistyped table name must not stop the hub and all its tables
+            try:
+                session = hub.sessions[key_input[1]]
+            except (KeyError, IndexError):
+                print("Unknown table, the tables are: %s" % ", ".join(hub.sessions))
+                continue
+            if key_input[0] == "r":
+                hub.restart(session.name)
+            else:
+                print(session.game_state.get_character_info())
+                print(session.game_state.get_monster_info())
+        elif key_input[0] == "profile":
+            if profiler.cpu_running:
+                print("CPU profile written to %s" % profiler.stop_cpu())
+            else:
+                profiler.start_cpu()
+                print("CPU profiling started, enter profile again to stop")
+        elif key_input == ["memory"]:
+            print("Memory snapshot written to %s" % profiler.snapshot_memory())
+        elif key_input == ["memory", "stop"]:
+            profiler.stop_memory()
+        else:
+            print("Available commands:")
+            print("q - Quit the program")
+            print("l - List tables with their counters")
+            print("r <table> - Restart a table")
+            print("i <table> - Print character and monster information for a table")
+            print("profile - Start CPU profiling, enter it again to write the report")
+            print("memory - Write a memory snapshot, memory stop stops tracing")
@@ -3,18 +3,35 @@ Main function that integrates the different modules of the project."""
 
 # Import the client network and game state modules
 
-from tracemalloc import start
-from numpy import char
-from xhaven_core import speech
+from xhaven_core import commands, config, profiling, speech
 from xhaven_core.clientnetwork import ClientNetwork
+from xhaven_core.heartbeat import STALL_SOUND
+from xhaven_core.hub import start_services
 import xhaven_core
+import argparse
 import time
 import logging
 import logging.handlers
-import json
 import os
+import sys
+import threading
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Control X-Haven using speech")
+    parser.add_argument(
+        "--commands",
+        metavar="SOURCE",
+        help="apply commands from a file, - for stdin or tcp:PORT for a local "
+        "socket instead of asking for them, see xhaven_core/commands.py",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="most commands sent to the app in one gamestate (default 1000)",
+    )
+    args = parser.parse_args()
+
     logger = logging.getLogger("xhaven_core")
     logger.setLevel(logging.DEBUG)
     socket_handler = logging.handlers.SocketHandler(
@@ -30,21 +47,14 @@ if __name__ == "__main__":
     file_name = "initial_parameters.json"
     file_path = os.path.join(current_dir, file_name)
 
-    # Read the JSON file
-    with open(file_path, "r") as file:
-        initial_parameters = json.load(file)
+    # Read and validate the JSON file
+    initial_parameters = config.load_parameters(file_path)
 
     logger.debug(f"Initial Parameters: {initial_parameters}")
 
     # Access the parameters
-    if initial_parameters["host"] is not None:
-        host = initial_parameters["host"]
-    else:
-        host = "localhost"
-    if initial_parameters["port"] is not None:
-        port = initial_parameters["port"]
-    else:
-        port = 4567
+    host = initial_parameters["host"]
+    port = initial_parameters["port"]
 
     character_names = initial_parameters["character_names"]
     monster_names = initial_parameters["monster_names"]
@@ -52,136 +62,191 @@ if __name__ == "__main__":
     game_state = xhaven_core.GameState(character_names, monster_names)
     client_network = xhaven_core.ClientNetwork(game_state, host=host, port=port)
     game_state.set_client_network(client_network)
+    game_state.auto_end_of_round = initial_parameters["auto_end_of_round"]
 
-    # Initialize the client network
-    client_network.connect()
+    # Sound an alarm when the app stops answering, see heartbeat.py
+    client_network.heartbeat.on_stall = lambda message: speech.play_sound(
+        STALL_SOUND
+    )
+
+    def apply_parameters(parameters):
+        # Names and options are swapped in while connected, see config.py
+        game_state.names.update(
+            parameters["character_names"], parameters["monster_names"]
+        )
+        game_state.auto_end_of_round = parameters["auto_end_of_round"]
+        if (parameters["host"], parameters["port"]) != (host, port):
+            logger.warning("A new host or port is used after a restart")
+
+    # Reload the names when the JSON file is changed
+    config_watcher = config.ConfigWatcher(file_path, apply_parameters)
+
+    # Optionally serve snapshots of the gamestate to overlays and dashboards
+    if initial_parameters.get("snapshot_port"):
+        game_state.serve_snapshots(port=initial_parameters["snapshot_port"])
+
+    # Optionally record all traffic, keep the frames that could not be used,
+    # keep the stats of every figure, answer "status ..." with speech and
+    # start from the gamestate saved before the last exit, see hub.py
+    readback, warm_start = start_services(
+        game_state, client_network, initial_parameters
+    )
+    if game_state.warm_index is not None:
+        print("Restored gamestate %s, waiting for the app" % game_state.index)
 
-    # Do not know if this is necessary
-    time.sleep(5)
+    # CPU profiling and memory snapshots on demand, with the profile and
+    # memory commands or SIGUSR1 and SIGUSR2, see profiling.py
+    profiler = profiling.Profiler()
+    profiler.install_signals()
 
-    # Send the init message to the server
-    client_network.send_init_msg()
+    def handshake():
+        # Initialize the client network
+        client_network.connect()
 
-    # Do not know if this is necessary
-    time.sleep(5)
+        # Do not know if this is necessary
+        time.sleep(5)
 
-    # Send request for game state
-    client_network.send_data(
-        b"S3nD:Index:-1Description::GetDataDescriptionGameState:{}[EOM]"
-    )
+        # Send the init message to the server
+        client_network.send_init_msg()
 
-    time.sleep(5)
+        # Do not know if this is necessary
+        time.sleep(5)
+
+        # Send request for game state
+        client_network.send_data(
+            b"S3nD:Index:-1Description::GetDataDescriptionGameState:{}[EOM]"
+        )
+
+    def handshake_in_background():
+        try:
+            handshake()
+        except OSError as error:
+            logger.error("Could not connect to the app: %s", error)
+
+    if game_state.warm_index is None:
+        handshake()
+        time.sleep(5)
+    else:
+        # A restored gamestate can be used while the app answers, so speech
+        # and the command line start right away, as in hub.Session._connect
+        threading.Thread(target=handshake_in_background, daemon=True).start()
 
     # Print the initial information from game_state
     print("Initial Information:")
     print(game_state.get_character_info())
     print(game_state.get_monster_info())
 
-    # Start speech recognition
-    # speech = speech.speech(game_state)
+    # Optionally recognize speech in worker processes, see recognitionpool.py
+    pool = None
+    if initial_parameters["recognition_workers"] > 0:
+        from xhaven_core.recognitionpool import RecognitionPool
+
+        pool = RecognitionPool(initial_parameters["recognition_workers"])
+
+    # Start speech recognition on the microphone of every player, if configured
+    player_speech = speech.start_microphones(
+        game_state,
+        initial_parameters.get("microphones") or [],
+        pool=pool,
+        pre_roll=initial_parameters.get("pre_roll"),
+        readback=readback,
+        speculate=initial_parameters["speculate"],
+    )
+
+    if args.commands:
+        # Non-interactive mode, apply a stream of commands and quit
+        if args.commands.startswith("tcp:"):
+            server = commands.serve_commands(
+                game_state, port=int(args.commands[4:]), batch_size=args.batch_size
+            )
+            print("Accepting commands on %s, press Enter to quit" % args.commands)
+            input()
+            server.close()
+        elif args.commands == "-":
+            print(commands.run_stream(game_state, sys.stdin, args.batch_size))
+        else:
+            with open(args.commands, "r", encoding="utf-8") as command_file:
+                print(commands.run_stream(game_state, command_file, args.batch_size))
+        client_network.disconnect()
+        game_state.stop_timeline()
+        if warm_start:
+            warm_start.stop()
+        config_watcher.stop()
+        for player in player_speech:
+            player.stop()
+        if pool:
+            pool.close()
+        sys.exit(0)
 
     while True:
         # Get key input
         key_input = input("Enter a key: ")
 
-        # Process the key input
-        if key_input == "q":
-            print("Exiting")
-            client_network.disconnect()
-            # speech.stop_recognition()
-            break
-        elif key_input == "i":
-            print(game_state.get_character_info())
-            print(game_state.get_monster_info())
-        # elif key_input == "m":
-        #     # Create a toast message with monster names
-        #     # Example: t
-        #     # Toast message: "The monsters are: monster-id, monster_short_name..."
-        #     monster_list = game_state.get_monster_index()
-        #     if monster_list is None:
-        #         game_state.set_toast_message("There are no monsters")
-        #     else:
-        #         monster_list_str = ", ".join(
-        #             f"{key}: {value}" for key, value in monster_list.items()
-        #         )
-        #         game_state.set_toast_message(f"The monsters are: {monster_list_str}")
-        # elif key_input == "c":
-        #     # Create a toast message with character names
-        #     # Example: c
-        #     # Toast message: "The characters are: character-id, character_name..."
-        #     character_list = game_state.get_character_index()
-        #     if character_list is None:
-        #         game_state.set_toast_message("There are no characters")
-        #     else:
-        #         character_list_str = ", ".join(
-        #             f"{key}: {value}" for key, value in character_list.items()
-        #         )
-        #         game_state.set_toast_message(
-        #             f"The characters are: {character_list_str}"
-        #         )
-        elif key_input[0] == "/":
-            # Update character initiative with the given value
-            # Example: ci Hatchet 10
-            # Mainly for debugging purposes
-            index = 0
-            initiative = 0
-            try:
-                index = int(key_input[1])
-                initiative = int(key_input[2:])
-            except ValueError:
-                pass
-            logger.debug("Trying to update initiative for %s to %s", id, initiative)
-            game_state.update_initiative(index=index, initiative=initiative)
-        elif key_input[0] in "-+":
-            # Reduce or Increase monster healt with the given value
-            # Example -143 - Reduce monster index 1, standee 4 with 3 health
-            # Example +143 - Increase monster index 1, standee 4 with 3 health
-            health = 0
-            standee_nr = 0
-            index = 0
-
-            try:
-                index = int(key_input[1])
-                standee_nr = int(key_input[2])
-                health_string = key_input[3:]
-                health = int(health_string)
-                if key_input[0] == "-":
-                    health = -health
-            except ValueError:
-                pass
-            logger.debug("Trying to update health for %s to %s", id, health)
-            game_state.update_monster(
-                index=index, standee_nr=standee_nr, health=health, relative=True
-            )
-        elif key_input[0] in "sidwmpb":
-            # Condition monster (for example b14 - Muddle monster index 1, standee 4)
-            standee_nr = 0
-            index = 0
-
-            try:
-                index = int(key_input[1])
-                standee_nr = int(key_input[2])
-            except ValueError:
-                pass
-            logger.debug("Trying to brittle monster %s", id)
-            game_state.update_monster(
-                index=index, standee_nr=standee_nr, health=0, relative=True, condition=key_input[0]
-            )
-        elif key_input == "h":
-            print("Help menu")
-            print("Available commands:")
-            print("q - Quit the program")
-            #print("i - Print character and monster information")
-            #print("m - Print monster names")
-            #print("c - Print character names")
-            print("/ - Update character initiative (for example /172)")
-            print("- - Update monster health (for example -143 - Reduce monster index 1, standee 4 with 3 health)")
-            print("+ - Update monster health (for example +143 - Increase monster index 1, standee 4 with 3 health)")
-            
-            print("s - Stun monster (for example s14)")
-            print("i - Immobilize monster (for example i14)")
-            print("d - Brittle monster (for example d14)")
-            print("w - Wound monster (for example w14)")
-            print("m - Muddle monster (for example m14)")
-            print("p - Poison monster (for example p14)")
-            print("b - Brittle monster (for example b14)")
+        # Parse the key input, see commands.py for the commands
+        try:
+            parsed = commands.parse_commands(key_input)
+        except commands.CommandError as error:
+            print(error)
+            print("Enter h for help")
+            continue
+
+        for command in parsed:
+            logger.debug("Command %s", command)
+            if command.action == "quit":
+                break
+            elif command.action == "info":
+                print(game_state.get_character_info())
+                print(game_state.get_monster_info())
+            elif command.action == "profile":
+                if profiler.cpu_running:
+                    print("CPU profile written to %s" % profiler.stop_cpu())
+                else:
+                    profiler.start_cpu()
+                    print("CPU profiling started, enter profile again to stop")
+            elif command.action == "memory":
+                print("Memory snapshot written to %s" % profiler.snapshot_memory())
+            elif command.action == "memory_stop":
+                profiler.stop_memory()
+            elif command.action == "help":
+                print("Help menu")
+                print("Available commands:")
+                print("q - Quit the program")
+                print("i - Print character and monster information")
+                print("u - Undo the last change")
+                print("y - Redo the last undone change")
+                print("e - Apply end of round effects (wound, regenerate, expiry)")
+                print("profile - Start CPU profiling, enter it again to write the report")
+                print("memory - Write a memory snapshot, memory stop stops tracing")
+                print("/ - Update character initiative (for example /1 72 or /172)")
+                print("- - Update monster health (for example -1 4 3 - Reduce monster index 1, standee 4 with 3 health)")
+                print("+ - Update monster health (for example +1 4 3 - Increase monster index 1, standee 4 with 3 health)")
+
+                print("s - Stun monster (for example s1 4)")
+                print("i - Immobilize monster (for example i1 4)")
+                print("d - Disarm monster (for example d1 4)")
+                print("w - Wound monster (for example w1 4)")
+                print("m - Muddle monster (for example m1 4)")
+                print("p - Poison monster (for example p1 4)")
+                print("b - Brittle monster (for example b1 4)")
+                print("Several standees: -1 all 2, +1 1-3 2, p1 elites, s1 1,3")
+                print("Numbers can have several digits: -12 10 3")
+                print("Several commands in one line: -1 4 3; p1 4")
+            elif not commands.execute(game_state, command):
+                print("Nothing changed by %s" % key_input)
+        else:
+            continue
+
+        # q was entered
+        print("Exiting")
+        profiler.stop()
+        client_network.disconnect()
+        game_state.stop_timeline()
+        if warm_start:
+            warm_start.stop()
+        config_watcher.stop()
+        # speech.stop_recognition()
+        for player in player_speech:
+            player.stop()
+        if pool:
+            pool.close()
+        break
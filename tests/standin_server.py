@@ -0,0 +1,121 @@
+"""
+Local stand-in for the X-Haven app server, used by the tests.
+
+It accepts client connections, answers the GameState request with its
+current gamestate, and like the app, stores every GameState frame it
+receives and sends it back to all clients.
+"""
+
+import os
+import socket
+import threading
+
+EXAMPLE_FILE = os.path.join(os.path.dirname(__file__), "example.txt")
+
+
+def example_gamestate() -> bytes:
+    with open(EXAMPLE_FILE, "rb") as file:
+        return file.read()
+
+
+def gamestate_frame(index: int, gamestate: bytes, description: bytes = b"") -> bytes:
+    return b"S3nD:Index:%dDescription:%sGameState:%s[EOM]" % (
+        index,
+        description,
+        gamestate,
+    )
+
+
+class StandInServer:
+    def __init__(self, gamestate: bytes = None) -> None:
+        self.index = 0
+        self.gamestate = gamestate if gamestate is not None else example_gamestate()
+        self.frames = []
+        self.clients = []
+        self.lock = threading.Lock()
+        self.received = threading.Condition(self.lock)
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(("localhost", 0))
+        self.socket.listen()
+        self.port = self.socket.getsockname()[1]
+        self.is_running = True
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self) -> None:
+        while self.is_running:
+            try:
+                client, _ = self.socket.accept()
+            except OSError:
+                return
+            with self.lock:
+                self.clients.append(client)
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client) -> None:
+        buffer = b""
+        while self.is_running:
+            try:
+                chunk = client.recv(65536)
+            except OSError:
+                break
+            if not chunk:
+                break
+            buffer += chunk
+            while b"[EOM]" in buffer:
+                frame, buffer = buffer.split(b"[EOM]", 1)
+                self._handle(client, frame + b"[EOM]")
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def _handle(self, client, frame: bytes) -> None:
+        if frame.startswith(b"S3nD:Index:-1"):
+            with self.lock:
+                reply = gamestate_frame(self.index, self.gamestate)
+            self._send(client, reply)
+        elif b"GameState:" in frame:
+            index = int(frame.split(b"Index:")[1].split(b"Description:")[0])
+            with self.lock:
+                self.frames.append(frame)
+                self.index = index
+                self.gamestate = frame.split(b"GameState:")[1][: -len(b"[EOM]")]
+                clients = list(self.clients)
+                self.received.notify_all()
+            for other in clients:
+                self._send(other, frame)
+        else:
+            with self.lock:
+                self.frames.append(frame)
+                self.received.notify_all()
+
+    def _send(self, client, frame: bytes) -> None:
+        try:
+            client.sendall(frame)
+        except OSError:
+            pass
+
+    def broadcast(self, frame: bytes) -> None:
+        """Send a frame to all connected clients."""
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            self._send(client, frame)
+
+    def wait_for_frames(self, count: int, timeout: float = 5.0) -> bool:
+        """Wait until at least count frames have been received from clients."""
+        with self.lock:
+            return self.received.wait_for(lambda: len(self.frames) >= count, timeout)
+
+    def close(self) -> None:
+        self.is_running = False
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+        with self.lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
@@ -0,0 +1,345 @@
+"""
+Concurrency stress harness for GameState.
+
+Worker threads call update_monster, update_initiative, set_toast_message and
+the read methods from seeded random schedules, while the receive thread
+applies the gamestates that the stand-in server echoes back like the app.
+Afterwards the invariants are checked:
+
+    index       the indexes sent to the app are strictly increasing
+    no lost     the health of every standee is its start health plus the sum
+    updates     of all applied changes, and the initiatives are the last ones
+                each worker wrote
+    currentList the final state is the last gamestate the app received, and
+                the characters and standees are numbered consistently
+
+The standees have so much health that they are never killed or healed to
+the maximum, which keeps the expected result a simple sum.
+
+With --turns the workers take turns in a seeded order, so a failing schedule
+can be replayed exactly. Without it they run freely and contend for the lock.
+
+    python tests/stress.py --seed 1 --threads 8 --operations 1000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import NamedTuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from standin_server import StandInServer, example_gamestate  # noqa
+from xhaven_core import ClientNetwork, GameState  # noqa
+
+START_HEALTH = 50000
+
+
+class TimedLock:
+    """An RLock, like GameState.lock, that measures how long every acquire waited."""
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self.acquisitions = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        start = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        if acquired:
+            wait = time.perf_counter() - start
+            # Only changed while holding the lock
+            self.acquisitions += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+        return acquired
+
+    def release(self) -> None:
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class StressReport(NamedTuple):
+    operations: int
+    seconds: float
+    frames_sent: int
+    lock_acquisitions: int
+    lock_wait_total: float
+    lock_wait_max: float
+    failures: list
+
+    @property
+    def throughput(self) -> float:
+        return self.operations / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        lines = [
+            "%s operations in %.3f s, %.0f operations/s, %s frames sent"
+            % (self.operations, self.seconds, self.throughput, self.frames_sent),
+            "Lock: %s acquisitions, waited %.3f s in total, %.3f ms at most"
+            % (self.lock_acquisitions, self.lock_wait_total, self.lock_wait_max * 1000),
+        ]
+        lines.extend("FAILED: %s" % failure for failure in self.failures)
+        if not self.failures:
+            lines.append("All invariants hold")
+        return "\n".join(lines)
+
+
+def stress_gamestate() -> bytes:
+    """Return the example gamestate with standees that can not die."""
+    gamestate = json.loads(example_gamestate())
+    for item in gamestate["currentList"]:
+        for monster_instance in item.get("monsterInstances", []):
+            monster_instance["health"] = START_HEALTH
+            monster_instance["maxHealth"] = 2 * START_HEALTH
+    return json.dumps(gamestate).encode("utf-8")
+
+
+def make_schedule(seed: int, threads: int, operations: int) -> list:
+    """Return the operations of every worker, the same for the same seed.
+
+    Operations are ("monster", index, standee, change), ("initiative", index,
+    value), ("toast", text) and ("read",).
+    """
+    rng = random.Random(seed)
+    standees = [(1, 1), (1, 3), (2, 2)]
+    schedule = []
+    for worker in range(threads):
+        worker_operations = []
+        for number in range(operations):
+            kind = rng.choices(
+                ("monster", "initiative", "toast", "read"), weights=(6, 2, 1, 1)
+            )[0]
+            if kind == "monster":
+                index, standee_nr = rng.choice(standees)
+                worker_operations.append(
+                    ("monster", index, standee_nr, rng.choice((-3, -1, 1, 2)))
+                )
+            elif kind == "initiative":
+                worker_operations.append(("initiative", 1, rng.randint(1, 99)))
+            elif kind == "toast":
+                worker_operations.append(("toast", "worker %s %s" % (worker, number)))
+            else:
+                worker_operations.append(("read",))
+        schedule.append(worker_operations)
+    return schedule
+
+
+class Turns:
+    """Let the workers run one operation at a time in a seeded order."""
+
+    def __init__(self, seed: int, schedule: list) -> None:
+        order = [
+            worker
+            for worker, operations in enumerate(schedule)
+            for _ in operations
+        ]
+        random.Random(seed).shuffle(order)
+        self.order = order
+        self.position = 0
+        self.condition = threading.Condition()
+
+    def wait(self, worker: int) -> None:
+        with self.condition:
+            self.condition.wait_for(lambda: self.order[self.position] == worker)
+
+    def done(self) -> None:
+        with self.condition:
+            self.position += 1
+            self.condition.notify_all()
+
+
+def run(
+    seed: int = 1, threads: int = 8, operations: int = 200, turns: bool = False
+) -> StressReport:
+    """Run one seeded stress test and check the invariants."""
+    server = StandInServer(stress_gamestate())
+    game_state = GameState({}, {})
+    game_state.lock = TimedLock()
+    client_network = ClientNetwork(game_state, port=server.port)
+    client_network.heartbeat.sound = None
+    game_state.set_client_network(client_network)
+    failures = []
+
+    try:
+        client_network.connect()
+        client_network.send_data(
+            b"S3nD:Index:-1Description::GetDataDescriptionGameState:{}[EOM]"
+        )
+        deadline = time.monotonic() + 5
+        while game_state.index < 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if game_state.index < 0:
+            return StressReport(0, 0.0, 0, 0, 0.0, 0.0, ["No gamestate from server"])
+        start_index = game_state.index
+
+        schedule = make_schedule(seed, threads, operations)
+        turn_order = Turns(seed, schedule) if turns else None
+        applied = [[] for _ in schedule]
+        barrier = threading.Barrier(len(schedule))
+
+        def worker(number):
+            barrier.wait()
+            for operation in schedule[number]:
+                if turn_order:
+                    turn_order.wait(number)
+                try:
+                    if operation[0] == "monster":
+                        _, index, standee_nr, change = operation
+                        if game_state.update_monster(index, standee_nr, change, True):
+                            applied[number].append(operation)
+                    elif operation[0] == "initiative":
+                        if game_state.update_initiative(
+                            index=operation[1], initiative=operation[2]
+                        ):
+                            applied[number].append(operation)
+                    elif operation[0] == "toast":
+                        game_state.set_toast_message(operation[1])
+                    else:
+                        game_state.get_monster_info()
+                        game_state.get_character_info()
+                finally:
+                    if turn_order:
+                        turn_order.done()
+
+        workers = [
+            threading.Thread(target=worker, args=(number,))
+            for number in range(len(schedule))
+        ]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        seconds = time.perf_counter() - started
+
+        # Wait for the echoes of the last updates
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and (
+            client_network.heartbeat.pending or not client_network.gamestates.empty()
+        ):
+            time.sleep(0.01)
+        time.sleep(0.05)
+
+        with game_state.lock:
+            failures.extend(
+                check(game_state, server, start_index, schedule, applied)
+            )
+        return StressReport(
+            sum(len(operations) for operations in schedule),
+            seconds,
+            client_network.frames_sent,
+            game_state.lock.acquisitions,
+            game_state.lock.wait_total,
+            game_state.lock.wait_max,
+            failures,
+        )
+    finally:
+        client_network.disconnect()
+        server.close()
+
+
+def check(game_state, server, start_index, schedule, applied) -> list:
+    """Return the invariants that do not hold."""
+    failures = []
+
+    # index: the frames the app received have strictly increasing indexes
+    indexes = [
+        int(frame.split(b"Index:")[1].split(b"Description:")[0])
+        for frame in server.frames
+        if b"GameState:" in frame
+    ]
+    if any(later <= earlier for earlier, later in zip(indexes, indexes[1:])):
+        failures.append("Indexes sent to the app are not increasing: %s" % indexes)
+    if indexes and indexes[0] <= start_index:
+        failures.append("First index %s is not after %s" % (indexes[0], start_index))
+
+    # no lost updates: health is the start health plus the applied changes
+    expected = {}
+    for operations in applied:
+        for operation in operations:
+            if operation[0] == "monster":
+                key = (operation[1], operation[2])
+                expected[key] = expected.get(key, START_HEALTH) + operation[3]
+    for item in game_state.currentList:
+        if item.__class__.__name__ != "Monsters":
+            continue
+        for monster_instance in item.monster_instances:
+            key = (item.monster_nr, monster_instance.standeeNr)
+            if monster_instance.health != expected.get(key, START_HEALTH):
+                failures.append(
+                    "Standee %s has health %s, expected %s"
+                    % (key, monster_instance.health, expected.get(key, START_HEALTH))
+                )
+
+    last_initiatives = {
+        operations[-1][2]
+        for operations in (
+            [operation for operation in worker if operation[0] == "initiative"]
+            for worker in applied
+        )
+        if operations
+    }
+    initiative = game_state.currentList[0].characterState.initiative
+    if last_initiatives and initiative not in last_initiatives:
+        failures.append(
+            "Initiative %s is not the last one of any worker %s"
+            % (initiative, sorted(last_initiatives))
+        )
+
+    # currentList: the final state is what the app has, numbered consistently
+    if json.loads(game_state.get_gamestate()) != json.loads(server.gamestate):
+        failures.append("The final gamestate differs from the app's gamestate")
+    characters = [
+        item.character_nr
+        for item in game_state.currentList
+        if item.__class__.__name__ == "Characters"
+    ]
+    monsters = [
+        item.monster_nr
+        for item in game_state.currentList
+        if item.__class__.__name__ == "Monsters"
+    ]
+    if characters != list(range(1, len(characters) + 1)) or monsters != list(
+        range(1, len(monsters) + 1)
+    ):
+        failures.append(
+            "Characters %s or monsters %s misnumbered" % (characters, monsters)
+        )
+    for item in game_state.currentList:
+        if item.__class__.__name__ == "Monsters":
+            standee_nrs = [instance.standeeNr for instance in item.monster_instances]
+            if len(set(standee_nrs)) != len(standee_nrs):
+                failures.append("Duplicate standees in %s" % item.id)
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stress test GameState locking")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=200, help="per thread")
+    parser.add_argument(
+        "--turns", action="store_true", help="take turns in a seeded order"
+    )
+    parser.add_argument("--runs", type=int, default=1, help="seeds seed, seed+1, ...")
+    args = parser.parse_args()
+
+    failed = 0
+    for seed in range(args.seed, args.seed + args.runs):
+        report = run(seed, args.threads, args.operations, args.turns)
+        print("Seed %s:" % seed)
+        print(report)
+        failed += bool(report.failures)
+    sys.exit(1 if failed else 0)
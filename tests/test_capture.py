@@ -0,0 +1,100 @@
+import importlib.util
+import unittest
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+if HAS_NUMPY:
+    import numpy
+
+    from xhaven_core.capture import ContinuousCapture, RingBuffer, normalize
+
+
+@unittest.skipUnless(HAS_NUMPY, "numpy is not installed")
+class TestRingBuffer(unittest.TestCase):
+    def test_view_without_wrap_is_not_a_copy(self):
+        ring = RingBuffer(8)
+        ring.write(numpy.arange(5, dtype=numpy.int16))
+        view = ring.view(1, 4)
+        self.assertEqual(view.tolist(), [1, 2, 3])
+        self.assertTrue(numpy.shares_memory(view, ring.samples))
+
+    def test_view_across_the_end(self):
+        ring = RingBuffer(8)
+        ring.write(numpy.arange(6, dtype=numpy.int16))
+        ring.write(numpy.arange(6, 10, dtype=numpy.int16))
+        self.assertEqual(ring.view(4, 10).tolist(), [4, 5, 6, 7, 8, 9])
+        # Samples that have been overwritten are left out
+        self.assertEqual(ring.view(0, 4).tolist(), [2, 3])
+
+    def test_read_is_a_copy(self):
+        ring = RingBuffer(8)
+        ring.write(numpy.arange(5, dtype=numpy.int16))
+        samples = ring.read(1, 4)
+        ring.write(numpy.arange(10, 18, dtype=numpy.int16))
+        self.assertEqual(samples.tolist(), [1, 2, 3])
+
+    def test_chunk_larger_than_the_buffer(self):
+        ring = RingBuffer(8)
+        ring.write(numpy.arange(3, dtype=numpy.int16))
+        ring.write(numpy.arange(3, 15, dtype=numpy.int16))
+        self.assertEqual(ring.total, 15)
+        self.assertEqual(ring.view(7, 15).tolist(), list(range(7, 15)))
+        self.assertEqual(ring.view(12, 14).tolist(), [12, 13])
+
+
+@unittest.skipUnless(HAS_NUMPY, "numpy is not installed")
+class TestContinuousCapture(unittest.TestCase):
+    def chunk(self, amplitude):
+        return numpy.full(160, amplitude, dtype=numpy.int16).tobytes()
+
+    def test_phrase_starts_with_pre_roll(self):
+        capture = ContinuousCapture(
+            sample_rate=1600, chunk_size=160, pre_roll=0.2, pause=0.3
+        )
+        for _ in range(10):
+            capture.feed(self.chunk(10))
+        for _ in range(5):
+            capture.feed(self.chunk(5000))
+        for _ in range(3):
+            capture.feed(self.chunk(10))
+
+        segment = capture.next_segment(timeout=1)
+        # Two quiet chunks of pre-roll, the phrase and the pause
+        self.assertEqual(segment.start, 8 * 160)
+        self.assertEqual(segment.end, 18 * 160)
+        self.assertEqual(len(segment.samples), 10 * 160)
+        self.assertEqual(int(segment.samples[2 * 160]), 5000)
+
+    def test_partial_segments_while_speaking(self):
+        capture = ContinuousCapture(
+            sample_rate=1600,
+            chunk_size=160,
+            pre_roll=0,
+            pause=0.3,
+            partial_interval=0.2,
+        )
+        for _ in range(5):
+            capture.feed(self.chunk(5000))
+        for _ in range(3):
+            capture.feed(self.chunk(10))
+
+        segments = []
+        while not capture.segments.empty():
+            segments.append(capture.next_segment())
+        # A partial every second chunk until the pause ends the phrase
+        self.assertEqual(
+            [(segment.end // 160, segment.final) for segment in segments],
+            [(3, False), (5, False), (7, False), (8, True)],
+        )
+        self.assertTrue(all(segment.start == 0 for segment in segments))
+
+    def test_normalize_resamples(self):
+        samples = numpy.full(800, 16384, dtype=numpy.int16)
+        audio = normalize(samples.tobytes(), 8000)
+        self.assertEqual(audio.dtype, numpy.float32)
+        self.assertEqual(len(audio), 1600)
+        self.assertAlmostEqual(float(audio[0]), 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
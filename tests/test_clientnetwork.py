@@ -0,0 +1,77 @@
+import threading
+import time
+import unittest
+
+from standin_server import StandInServer, example_gamestate, gamestate_frame
+from xhaven_core import ClientNetwork, GameState
+
+
+class SlowGameState(GameState):
+    """GameState that takes a long time to decode, and counts the frames."""
+
+    def __init__(self, delay):
+        super().__init__({}, {})
+        self.delay = delay
+        self.decoded = []
+        self.done = threading.Event()
+
+    def set_gamestate(self, raw_gamestate_message):
+        time.sleep(self.delay)
+        super().set_gamestate(raw_gamestate_message)
+        self.decoded.append(self.index)
+        self.done.set()
+
+
+class TestReceive(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer()
+
+    def tearDown(self):
+        self.client_network.disconnect()
+        self.server.close()
+
+    def connect(self, delay):
+        self.game_state = SlowGameState(delay)
+        self.client_network = ClientNetwork(self.game_state, port=self.server.port)
+        self.client_network.connect()
+        time.sleep(0.1)
+
+    def test_ping_is_answered_while_decoding(self):
+        self.connect(delay=1.0)
+        self.server.broadcast(gamestate_frame(1, example_gamestate()))
+        time.sleep(0.1)
+        started = time.monotonic()
+        self.server.broadcast(b"S3nD:ping[EOM]")
+        self.assertTrue(self.server.wait_for_frames(1))
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(self.server.frames, [b"S3nD:pong[EOM]"])
+
+    def test_stale_gamestates_are_dropped(self):
+        self.connect(delay=0.3)
+        for index in range(1, 6):
+            self.server.broadcast(gamestate_frame(index, example_gamestate()))
+        deadline = time.monotonic() + 5
+        while self.game_state.decoded[-1:] != [5] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.game_state.index, 5)
+        self.assertLess(len(self.game_state.decoded), 5)
+        self.assertEqual(
+            self.client_network.frames_dropped, 5 - len(self.game_state.decoded)
+        )
+
+    def test_frames_split_and_joined(self):
+        self.connect(delay=0)
+        frame = gamestate_frame(1, example_gamestate())
+        # A gamestate split in the middle of [EOM], followed by a ping in the
+        # same chunk as the end of the gamestate
+        self.server.broadcast(frame[:-3])
+        time.sleep(0.1)
+        self.server.broadcast(frame[-3:] + b"S3nD:ping[EOM]")
+        self.assertTrue(self.game_state.done.wait(5))
+        self.assertTrue(self.server.wait_for_frames(1))
+        self.assertEqual(self.game_state.index, 1)
+        self.assertEqual(len(self.game_state.currentList), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import unittest
+
+from xhaven_core import GameState, codec
+
+EXAMPLE_FILE = os.path.join(os.path.dirname(__file__), "example.txt")
+
+
+def example_gamestate() -> str:
+    # The example is pretty printed, the codec always produces compact JSON
+    with open(EXAMPLE_FILE, "rb") as file:
+        return codec.dumps(codec.loads(file.read()))
+
+
+class TestCodec(unittest.TestCase):
+    def tearDown(self):
+        codec.use_backend()
+
+    def test_schema_matches_example(self):
+        gamestate = codec.loads(example_gamestate())
+        self.assertEqual(tuple(gamestate), codec.GAMESTATE_SCHEMA)
+
+    def test_gamestate_round_trip_is_byte_identical(self):
+        gamestate = example_gamestate()
+        game_state = GameState({}, {})
+        game_state.set_gamestate(
+            b"S3nD:Index:1Description:TestGameState:%s[EOM]" % gamestate.encode()
+        )
+        self.assertEqual(game_state.get_gamestate(), gamestate)
+
+    def test_backends_produce_identical_output(self):
+        gamestate = example_gamestate()
+        outputs = {}
+        for name in codec.BACKENDS:
+            try:
+                codec.use_backend(name)
+            except ImportError:
+                continue
+            game_state = GameState({}, {})
+            game_state.set_gamestate(
+                b"S3nD:Index:1Description:GameState:%s[EOM]" % gamestate.encode()
+            )
+            outputs[name] = game_state.get_gamestate().encode("utf-8")
+
+        self.assertIn("json", outputs)
+        for name, output in outputs.items():
+            self.assertEqual(output, outputs["json"], name)
+
+    def test_lazy_sections_are_spliced_verbatim(self):
+        # Pretty printed input, the untouched sections keep their formatting
+        with open(EXAMPLE_FILE, "r") as file:
+            gamestate = file.read()
+        sections = codec.loads_sections(gamestate)
+        for key in codec.LAZY_SECTIONS:
+            self.assertIsInstance(sections[key], codec.RawJSON)
+        self.assertEqual(sections["round"], 1)
+
+        output = codec.dumps_sections(sections)
+        self.assertIn(sections["modifierDeck"].text, output)
+        self.assertEqual(codec.loads(output), codec.loads(gamestate))
+
+    def test_lazy_section_is_parsed_on_read(self):
+        game_state = GameState({}, {})
+        game_state.set_gamestate(
+            b"S3nD:Index:1Description:GameState:%s[EOM]" % example_gamestate().encode()
+        )
+        self.assertIsInstance(game_state._modifierDeck, codec.RawJSON)
+        self.assertEqual(game_state.modifierDeck["blesses"], 1)
+        self.assertNotIsInstance(game_state._modifierDeck, codec.RawJSON)
+
+        # Changes to a section that has been read are sent
+        game_state.modifierDeck["blesses"] = 2
+        gamestate = codec.loads(game_state.get_gamestate())
+        self.assertEqual(gamestate["modifierDeck"]["blesses"], 2)
+
+    def test_sections_in_unexpected_order(self):
+        gamestate = codec.loads(example_gamestate())
+        reordered = dict(reversed(list(gamestate.items())))
+        reordered["extra"] = {"drawPile": [1, 2]}
+        sections = codec.loads_sections(codec.dumps(reordered))
+        self.assertEqual(codec.loads(codec.dumps_sections(sections)), reordered)
+
+    def test_brackets_and_keys_inside_strings(self):
+        gamestate = codec.loads(example_gamestate())
+        gamestate["currentAbilityDecks"] = [{"a": "]"}, "modifierDeck"]
+        gamestate["scenario"] = '"lootDeck",}'
+        text = codec.dumps(gamestate)
+        sections = codec.loads_sections(text)
+        self.assertEqual(tuple(sections), codec.GAMESTATE_SCHEMA)
+        self.assertEqual(codec.dumps_sections(sections), text)
+
+        game_state = GameState({}, {})
+        game_state.set_gamestate(
+            b"S3nD:Index:1Description:GameState:%s[EOM]" % text.encode()
+        )
+        self.assertEqual(
+            game_state.currentAbilityDecks, [{"a": "]"}, "modifierDeck"]
+        )
+        self.assertEqual(game_state.get_gamestate(), text)
+
+    def test_non_ascii_is_kept(self):
+        self.assertEqual(codec.dumps({"scenario": "Krabbän"}), '{"scenario":"Krabbän"}')
+
+    def test_unknown_backend(self):
+        with self.assertRaisesRegex(ValueError, "json"):
+            codec.use_backend("unknown")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import io
+import json
+import socket
+import threading
+import unittest
+
+from standin_server import example_gamestate, gamestate_frame
+from xhaven_core import GameState, commands
+from xhaven_core.commands import Command, CommandError, parse_command
+from xhaven_core.targets import ELITE
+
+
+class RecordingNetwork:
+    def __init__(self):
+        self.frames = []
+
+    def send_data(self, data):
+        self.frames.append(data)
+
+
+class TestParseCommand(unittest.TestCase):
+    def test_commands(self):
+        cases = [
+            ("q", Command("quit")),
+            ("i", Command("info")),
+            ("/172", Command("initiative", 1, value=72)),
+            ("/12 72", Command("initiative", 12, value=72)),
+            ("-143", Command("health", 1, (4,), value=-3)),
+            ("+1410", Command("health", 1, (4,), value=10)),
+            ("-12 10 3", Command("health", 12, (10,), value=-3)),
+            ("- 12 10 3", Command("health", 12, (10,), value=-3)),
+            ("-1 all 2", Command("health", 1, value=-2)),
+            ("-1 1-3 2", Command("health", 1, (1, 2, 3), value=-2)),
+            ("b14", Command("condition", 1, (4,), condition="b")),
+            ("p12 elites", Command("condition", 12, None, ELITE, condition="p")),
+            ("i 1 4", Command("condition", 1, (4,), condition="i")),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(parse_command(text), expected)
+
+    def test_empty(self):
+        self.assertIsNone(parse_command(""))
+        self.assertIsNone(parse_command("   "))
+        self.assertEqual(commands.parse_commands(" ; "), [])
+
+    def test_invalid(self):
+        for text in ("x", "-1 3", "-14", "/1", "p1 all 3", "-a 1 2", "e 1"):
+            with self.subTest(text=text):
+                with self.assertRaises(CommandError):
+                    parse_command(text)
+
+
+class TestCommandStream(unittest.TestCase):
+    def setUp(self):
+        self.game_state = GameState({}, {})
+        self.game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+        self.network = RecordingNetwork()
+        self.game_state.set_client_network(self.network)
+
+    def test_batch_is_one_push_and_one_undo(self):
+        with self.game_state.batch("Two changes"):
+            self.game_state.update_monster(1, 1, -1, True)
+            with self.game_state.batch():
+                self.game_state.update_initiative(index=1, initiative=30)
+        self.assertEqual(len(self.network.frames), 1)
+        self.assertIn(b"Description:Two changes", self.network.frames[0])
+        self.assertTrue(self.game_state.undo())
+        self.assertEqual(self.game_state.get_monster_info()[0][2], 6)
+        self.assertEqual(self.game_state.currentList[0].characterState.initiative, 5)
+
+    def test_empty_batch_sends_nothing(self):
+        with self.game_state.batch():
+            self.assertFalse(self.game_state.update_monster(1, 9, -1, True))
+        self.assertEqual(self.network.frames, [])
+
+    def test_gamestate_waits_for_batch(self):
+        received = threading.Thread(
+            target=self.game_state.set_gamestate,
+            args=(gamestate_frame(5, example_gamestate()),),
+        )
+        with self.game_state.batch("Batch"):
+            self.game_state.update_monster(1, 1, -1, True)
+            received.start()
+            received.join(0.2)
+            # The gamestate from the app does not replace the list mid-batch
+            self.assertTrue(received.is_alive())
+            self.game_state.update_monster(1, 3, -1, True)
+        received.join()
+        self.assertEqual(len(self.network.frames), 1)
+        sent = self.network.frames[0]
+        self.assertIn(b"Index:2Description:Batch", sent)
+        gamestate = json.loads(sent[sent.index(b"GameState:") + 10 : -5])
+        raiders = gamestate["currentList"][1]["monsterInstances"]
+        self.assertEqual([standee["health"] for standee in raiders], [5, 5])
+        self.assertEqual(self.game_state.index, 5)
+
+    def test_run_stream(self):
+        lines = io.StringIO("-1 1 1\n\n-1 3 1; x\nu\n/1 20\n-2 2 1\nq\n-2 2 1\n")
+        result = commands.run_stream(self.game_state, lines)
+        self.assertEqual((result.applied, result.failed), (4, 1))
+        # The invalid line is skipped, -1 1 1 is undone and after q nothing is
+        # applied
+        self.assertEqual(
+            [standee[2] for standee in self.game_state.get_monster_info()],
+            [6, 6, 7],
+        )
+        self.assertEqual(self.game_state.currentList[0].characterState.initiative, 20)
+        self.assertLessEqual(len(self.network.frames), result.batches)
+
+    def test_undo_in_stream_keeps_its_description(self):
+        result = commands.run_stream(self.game_state, io.StringIO("-1 1 1\nu\ny\n"))
+        self.assertEqual(result.applied, 3)
+        descriptions = [
+            frame.split(b"Description:")[1] for frame in self.network.frames
+        ]
+        self.assertTrue(descriptions[-2].startswith(b"Undo: "))
+        self.assertTrue(descriptions[-1].startswith(b"Redo: "))
+
+    def test_many_commands_are_coalesced(self):
+        lines = ["+1 1 1\n", "-1 1 1\n"] * 500
+        result = commands.run_stream(self.game_state, lines, batch_size=100)
+        self.assertEqual(result.applied, 1000)
+        self.assertGreaterEqual(result.batches, 10)
+        self.assertEqual(len(self.network.frames), result.batches)
+        self.assertEqual(self.game_state.get_monster_info()[0][2], 6)
+
+    def test_serve_commands(self):
+        server = commands.serve_commands(self.game_state)
+        try:
+            with socket.create_connection(server.getsockname()) as client:
+                client.sendall(b"-1 1 2\n-2 2 1\n")
+                client.shutdown(socket.SHUT_WR)
+                reply = client.makefile("rb").readline()
+        finally:
+            server.close()
+        self.assertEqual(reply, b"applied 2 failed 0\n")
+        self.assertEqual(
+            [standee[2] for standee in self.game_state.get_monster_info()],
+            [4, 6, 7],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import json
+import unittest
+
+from standin_server import example_gamestate, gamestate_frame
+from xhaven_core import GameState
+from xhaven_core.conditions import Condition, ConditionSet, parse
+
+
+class RecordingNetwork:
+    def __init__(self):
+        self.frames = []
+
+    def send_data(self, data):
+        self.frames.append(data)
+
+
+class TestConditionSet(unittest.TestCase):
+    def test_round_trip(self):
+        conditions = ConditionSet.from_list([6, 0, 11])
+        # The order of the app's list is kept
+        self.assertEqual(conditions.to_list(), [6, 0, 11])
+        self.assertEqual(conditions.with_condition(Condition.WOUND), [6, 0, 11, 3])
+        self.assertEqual(
+            conditions.without_condition(Condition.STUN).to_list(), [6, 11]
+        )
+        self.assertIn(Condition.POISON, conditions)
+        self.assertNotIn(Condition.WOUND, conditions)
+        self.assertEqual(len(conditions), 3)
+
+    def test_updates_are_idempotent(self):
+        conditions = ConditionSet.from_list([Condition.STUN])
+        self.assertIs(conditions.with_condition(Condition.STUN), conditions)
+        self.assertIs(conditions.without_condition(Condition.WARD), conditions)
+        self.assertEqual(conditions.without_condition(Condition.STUN), [])
+
+    def test_unknown_ids_are_kept(self):
+        self.assertEqual(ConditionSet.from_list([25, 1]).to_list(), [25, 1])
+
+    def test_parse(self):
+        self.assertEqual(parse("p"), Condition.POISON)
+        self.assertEqual(parse("Regenerate"), Condition.REGENERATE)
+        self.assertEqual(parse(0), Condition.STUN)
+        self.assertIsNone(parse("sleepy"))
+
+
+class TestMonsterConditions(unittest.TestCase):
+    def setUp(self):
+        self.game_state = GameState({}, {})
+        self.game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+        self.network = RecordingNetwork()
+        self.game_state.set_client_network(self.network)
+
+    def sent_conditions(self):
+        gamestate = json.loads(self.network.frames[-1].split(b"GameState:")[1][:-5])
+        return gamestate["currentList"][1]["monsterInstances"][0]["conditions"]
+
+    def test_add_twice_and_remove(self):
+        monster = self.game_state.currentList[1]
+        self.assertTrue(
+            self.game_state.update_monster_condition(monster.type, 1, "poison", True)
+        )
+        self.game_state.update_monster_condition(monster.type, 1, "poison", True)
+        self.assertEqual(self.sent_conditions(), [Condition.POISON])
+
+        self.game_state.update_monster_condition(monster.type, 1, "poison", False)
+        self.assertEqual(self.sent_conditions(), [])
+        # Removing a condition the standee does not have is not an error
+        self.assertTrue(
+            self.game_state.update_monster_condition(monster.type, 1, "stun", False)
+        )
+
+    def test_order_from_the_app_is_kept(self):
+        gamestate = json.loads(example_gamestate())
+        standee = gamestate["currentList"][1]["monsterInstances"][0]
+        standee["conditions"] = [Condition.BRITTLE, Condition.POISON]
+        frame = gamestate_frame(2, json.dumps(gamestate).encode("utf-8"))
+        self.game_state.set_gamestate(frame)
+        self.game_state.update_monster(
+            index=1, standee_nr=1, health=-1, relative=True, condition="s"
+        )
+        self.assertEqual(
+            self.sent_conditions(),
+            [Condition.BRITTLE, Condition.POISON, Condition.STUN],
+        )
+
+    def test_update_monster_does_not_duplicate(self):
+        for _ in range(2):
+            self.game_state.update_monster(
+                index=1, standee_nr=1, health=0, relative=True, condition="b"
+            )
+        self.assertEqual(self.sent_conditions(), [Condition.BRITTLE])
+
+
+if __name__ == "__main__":
+    unittest.main()
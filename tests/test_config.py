@@ -0,0 +1,103 @@
+import json
+import os
+import tempfile
+import unittest
+
+from standin_server import example_gamestate, gamestate_frame
+from xhaven_core import GameState
+from xhaven_core.config import (
+    ConfigWatcher,
+    NameTables,
+    load_parameters,
+    validate_parameters,
+)
+
+
+class TestParameters(unittest.TestCase):
+    def test_defaults(self):
+        parameters = validate_parameters({"host": "192.168.1.57", "port": None})
+        self.assertEqual(parameters["port"], 4567)
+        self.assertEqual(parameters["character_names"], {})
+
+    def test_invalid(self):
+        for parameters in (
+            {"prot": 4567},
+            {"port": "4567"},
+            {"port": True},
+            {"character_names": {"Drifter": 1}},
+            {"speculate": True},
+            {
+                "speculate": True,
+                "pre_roll": 0.5,
+                "microphones": [{"device": 3, "channel": 0}],
+            },
+        ):
+            with self.subTest(parameters=parameters):
+                with self.assertRaises(ValueError):
+                    validate_parameters(parameters)
+
+    def test_speculate_with_continuous_capture(self):
+        parameters = validate_parameters(
+            {"speculate": True, "pre_roll": 0.5, "microphones": [{"device": 2}]}
+        )
+        self.assertTrue(parameters["speculate"])
+
+    def test_name_tables(self):
+        names = NameTables({"Drifter": "Daniel"}, {"Lurker Clawcrusher": "Krabban"})
+        self.assertEqual(names.find_character("daniel"), "Drifter")
+        self.assertEqual(names.find_character("drifter"), "Drifter")
+        self.assertEqual(names.find_monster("Krabban"), "Lurker Clawcrusher")
+        self.assertEqual(names.phrases, ("daniel", "krabban"))
+        self.assertEqual(names.character_name("Geminate"), "")
+
+
+class TestConfigWatcher(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+        self.write({"character_names": {"Demolitionist": "Daniel"}})
+        self.game_state = GameState({"Demolitionist": "Daniel"}, {})
+        self.game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+        self.watcher = ConfigWatcher(self.path, self.apply, interval=60)
+
+    def tearDown(self):
+        self.watcher.stop()
+        os.remove(self.path)
+
+    def write(self, parameters):
+        with open(self.path, "w") as file:
+            json.dump(parameters, file)
+        # Make sure the modification time changes on coarse file systems
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    def apply(self, parameters):
+        self.game_state.names.update(
+            parameters["character_names"], parameters["monster_names"]
+        )
+
+    def test_reload_renames_existing_entities(self):
+        character = self.game_state.currentList[0]
+        self.assertEqual(character.name, "Daniel")
+        self.write({"character_names": {"Demolitionist": "Emil"}})
+        self.assertTrue(self.watcher.check())
+        self.assertEqual(character.name, "Emil")
+        self.assertTrue(self.game_state.update_initiative(name="emil", initiative=30))
+
+    def test_invalid_file_keeps_names(self):
+        self.write({"character_names": {"Demolitionist": 3}})
+        self.assertFalse(self.watcher.check())
+        self.assertEqual(self.game_state.currentList[0].name, "Daniel")
+
+    def test_load_rejects_broken_json(self):
+        with open(self.path, "w") as file:
+            file.write('{"host": ')
+        with self.assertRaises(ValueError):
+            load_parameters(self.path)
+
+    def test_unchanged_file_is_not_reloaded(self):
+        self.assertFalse(self.watcher.check())
+
+
+if __name__ == "__main__":
+    unittest.main()
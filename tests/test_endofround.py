@@ -0,0 +1,89 @@
+import importlib.util
+import json
+import unittest
+
+from standin_server import example_gamestate, gamestate_frame
+from xhaven_core import GameState, endofround
+from xhaven_core.conditions import Condition, ConditionSet
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+class RecordingNetwork:
+    def __init__(self):
+        self.frames = []
+
+    def send_data(self, data):
+        self.frames.append(data)
+
+
+class TestEndOfRound(unittest.TestCase):
+    def setUp(self):
+        self.game_state = GameState({}, {})
+        self.game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+        self.network = RecordingNetwork()
+        self.game_state.set_client_network(self.network)
+        self.character = self.game_state.currentList[0].characterState
+        self.raiders = self.game_state.currentList[1].monster_instances
+        self.monstrosity = self.game_state.currentList[2].monster_instances[0]
+
+    def set_conditions(self, target, conditions, added=()):
+        target.conditions = ConditionSet.from_list(conditions)
+        target.conditionsAddedThisTurn = list(added)
+
+    def prepare(self):
+        # Raider 1: wound and stun, raider 3: regenerate and poison,
+        # monstrosity: regenerate and wound, character: muddle added this turn
+        self.set_conditions(self.raiders[0], [Condition.WOUND, Condition.STUN])
+        self.set_conditions(self.raiders[1], [Condition.REGENERATE, Condition.POISON])
+        self.set_conditions(self.monstrosity, [Condition.REGENERATE, Condition.WOUND])
+        self.set_conditions(self.character, [Condition.MUDDLE], [Condition.MUDDLE])
+
+    def check(self):
+        self.assertEqual(self.raiders[0].health, 5)
+        self.assertEqual(self.raiders[0].conditions, [Condition.WOUND])
+        self.assertEqual(self.raiders[1].health, 6)
+        self.assertEqual(self.raiders[1].conditions, [Condition.REGENERATE])
+        self.assertEqual(self.monstrosity.health, 9)
+        self.assertEqual(self.monstrosity.conditions, [Condition.REGENERATE])
+        self.assertEqual(self.character.conditions, [Condition.MUDDLE])
+
+    def test_end_round_is_one_push(self):
+        self.prepare()
+        self.assertTrue(self.game_state.end_round())
+        self.check()
+        self.assertEqual(len(self.network.frames), 1)
+
+        self.assertTrue(self.game_state.undo())
+        self.assertEqual(self.raiders[0].health, 6)
+
+    @unittest.skipUnless(HAS_NUMPY, "numpy is not installed")
+    def test_numpy_gives_the_same_result(self):
+        self.prepare()
+        loop = endofround.process(self.game_state, use_numpy=False)
+        vectorized = endofround.process(self.game_state, use_numpy=True)
+        self.assertEqual(loop, vectorized)
+
+    def test_bane_kills(self):
+        self.set_conditions(self.monstrosity, [Condition.BANE])
+        self.game_state.end_round()
+        self.assertEqual(len(self.game_state.currentList[2].monster_instances), 0)
+
+    def test_nothing_to_do(self):
+        self.assertFalse(self.game_state.end_round())
+        self.assertEqual(self.network.frames, [])
+
+    def test_new_round_from_app(self):
+        self.game_state.auto_end_of_round = True
+        self.set_conditions(self.raiders[0], [Condition.WOUND])
+        gamestate = json.loads(self.game_state.get_gamestate())
+        gamestate["round"] += 1
+        self.game_state.set_gamestate(
+            gamestate_frame(5, json.dumps(gamestate).encode("utf-8"))
+        )
+        self.assertEqual(self.game_state.currentList[1].monster_instances[0].health, 5)
+        self.assertEqual(len(self.network.frames), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import queue
+import unittest
+
+from standin_server import example_gamestate, gamestate_frame
+from xhaven_core import GameState, codec, events
+
+
+def collect(subscription) -> list:
+    result = []
+    while True:
+        try:
+            result.append(subscription.get(timeout=0))
+        except queue.Empty:
+            return result
+
+
+class TestEvents(unittest.TestCase):
+    def setUp(self):
+        self.gamestate = codec.loads(example_gamestate())
+        self.game_state = GameState({}, {})
+        self.set_gamestate(1)
+        self.subscription = self.game_state.subscribe()
+
+    def set_gamestate(self, index: int):
+        gamestate = codec.dumps(self.gamestate).encode()
+        self.game_state.set_gamestate(gamestate_frame(index, gamestate))
+
+    def test_no_events_without_changes(self):
+        self.set_gamestate(2)
+        self.assertEqual(collect(self.subscription), [])
+
+    def test_local_updates(self):
+        self.game_state.update_initiative(index=1, initiative=42)
+        self.game_state.update_monster(index=1, standee_nr=1, health=-2, relative=True)
+        self.game_state.update_monster(index=1, standee_nr=3, health=-10, relative=True)
+        self.game_state.update_monster(
+            index=2, standee_nr=2, health=0, relative=True, condition="p"
+        )
+
+        self.assertEqual(
+            collect(self.subscription),
+            [
+                events.InitiativeChanged(1, "Demolitionist", 5, 42),
+                events.MonsterHealthChanged(1, "Common Vermling Raider", 1, 6, 4),
+                events.MonsterKilled(1, "Common Vermling Raider", 3),
+                events.ConditionAdded(1, "Blood Monstrosity", 2, 6),
+            ],
+        )
+
+    def test_gamestate_from_server(self):
+        self.gamestate["round"] = 2
+        self.gamestate["currentList"].pop(2)
+        self.gamestate["currentList"][1]["monsterInstances"][0]["health"] = 9
+        self.set_gamestate(2)
+
+        changes = collect(self.subscription)
+        self.assertIn(events.RoundChanged(2, 2, 0), changes)
+        self.assertIn(events.RosterChanged(2, (), ("Blood Monstrosity",)), changes)
+        self.assertIn(events.MonsterKilled(2, "Blood Monstrosity", 2), changes)
+        change = events.MonsterHealthChanged(2, "Common Vermling Raider", 1, 6, 9)
+        self.assertIn(change, changes)
+        self.assertEqual(change.damage, -3)
+
+    def test_unsubscribe(self):
+        self.subscription.close()
+        self.assertFalse(self.game_state.events.active)
+        self.game_state.update_initiative(index=1, initiative=42)
+        self.assertEqual(collect(self.subscription), [])
+
+    def test_slow_subscriber_drops_oldest(self):
+        subscription = self.game_state.subscribe(maxsize=1)
+        self.game_state.update_initiative(index=1, initiative=42)
+        self.game_state.update_initiative(index=1, initiative=43)
+        self.assertEqual(collect(subscription)[0].new, 43)
+        self.assertEqual(subscription.dropped, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from standin_server import example_gamestate, gamestate_frame
+from xhaven_core import GameState
+
+
+class RecordingNetwork:
+    def __init__(self):
+        self.frames = []
+
+    def send_data(self, data):
+        self.frames.append(data)
+
+
+class TestEchoes(unittest.TestCase):
+    def setUp(self):
+        self.game_state = GameState({}, {})
+        self.game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+        self.network = RecordingNetwork()
+        self.game_state.set_client_network(self.network)
+
+    def health(self):
+        return self.game_state.get_monster_info()[0][2]
+
+    def test_echo_of_older_update_is_ignored(self):
+        self.game_state.update_monster(1, 1, -1, True)
+        self.game_state.update_monster(1, 1, -1, True)
+        self.assertEqual((self.game_state.index, self.health()), (3, 4))
+
+        # The echo of index 2 arrives after index 3 was sent
+        echo = self.network.frames[0]
+        self.assertIn(b"Index:2", echo)
+        with self.assertLogs("xhaven_core.gamestate", "INFO") as logs:
+            self.game_state.set_gamestate(echo)
+        self.assertIn("Ignoring echo of gamestate 2", logs.output[-1])
+        self.assertEqual((self.game_state.index, self.health()), (3, 4))
+        self.assertEqual(self.game_state.echoes_ignored, 1)
+
+        # The echo of the newest update is accepted
+        self.game_state.set_gamestate(self.network.frames[1])
+        self.assertEqual((self.game_state.index, self.health()), (3, 4))
+        self.assertEqual(self.game_state.received_index, 3)
+
+    def test_edit_in_the_app_above_index_is_accepted(self):
+        self.game_state.update_monster(1, 1, -1, True)
+        self.game_state.update_monster(1, 1, -1, True)
+
+        # The app made its own change on top of the newest update
+        self.game_state.set_gamestate(gamestate_frame(4, example_gamestate()))
+        self.assertEqual((self.game_state.index, self.health()), (4, 6))
+        self.assertEqual(self.game_state.received_index, 4)
+        self.assertEqual(self.game_state.echoes_ignored, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import time
+import unittest
+
+from standin_server import StandInServer, example_gamestate, gamestate_frame
+from xhaven_core import ClientNetwork, GameState
+from xhaven_core.heartbeat import Heartbeat, LatencyStats
+
+
+class TestLatencyStats(unittest.TestCase):
+    def test_summary(self):
+        stats = LatencyStats(window=4)
+        self.assertEqual(stats.summary(), {"count": 0})
+        for seconds in (0.5, 0.1, 0.2, 0.3, 0.4):
+            stats.add(seconds)
+        summary = stats.summary()
+        self.assertEqual(summary["count"], 5)
+        self.assertEqual(summary["last"], 0.4)
+        self.assertEqual(summary["max"], 0.4)
+        self.assertAlmostEqual(summary["mean"], 0.25)
+
+
+class TestHeartbeat(unittest.TestCase):
+    def setUp(self):
+        self.stalls = []
+        self.heartbeat = Heartbeat(
+            ping_timeout=10, echo_timeout=2, on_stall=self.stalls.append
+        )
+        self.start = self.heartbeat.started
+
+    def test_ping_stall_is_reported_once(self):
+        self.heartbeat.ping_received(self.start + 1)
+        self.heartbeat.ping_received(self.start + 4)
+        self.assertEqual(self.heartbeat.ping_interval.last, 3)
+        self.assertEqual(self.heartbeat.check(self.start + 10), set())
+        self.assertEqual(self.heartbeat.check(self.start + 15), {"ping"})
+        self.assertEqual(self.heartbeat.check(self.start + 16), {"ping"})
+        self.assertEqual(len(self.stalls), 1)
+        self.heartbeat.ping_received(self.start + 17)
+        self.assertEqual(self.heartbeat.check(self.start + 17), set())
+        self.assertEqual(self.heartbeat.summary()["stalls"], 1)
+
+    def test_echo(self):
+        self.heartbeat.gamestate_sent(5, self.start)
+        self.heartbeat.gamestate_sent(6, self.start + 1)
+        self.assertEqual(self.heartbeat.check(self.start + 2.5), {"echo"})
+        self.heartbeat.gamestate_received(6, self.start + 3)
+        self.assertEqual(self.heartbeat.echo.summary()["count"], 2)
+        self.assertEqual(self.heartbeat.echo.summary()["max"], 3)
+        self.assertEqual(self.heartbeat.check(self.start + 3), set())
+
+    def test_slow_pong(self):
+        self.heartbeat.ping_received(self.start)
+        self.heartbeat.pong_sent(self.start, self.start + 1)
+        self.assertEqual(self.heartbeat.check(self.start + 1), {"turnaround"})
+        self.assertEqual(self.heartbeat.check(self.start + 2), set())
+        self.assertEqual(len(self.stalls), 1)
+
+    def test_restart_runs_one_watcher(self):
+        heartbeat = Heartbeat(check_interval=0.01)
+        heartbeat.start()
+        first = heartbeat.thread
+        heartbeat.stop()
+        self.assertFalse(first.is_alive())
+        heartbeat.start()
+        heartbeat.start()
+        second = heartbeat.thread
+        heartbeat.stop()
+        self.assertIsNot(first, second)
+        self.assertFalse(second.is_alive())
+
+
+class TestClientNetwork(unittest.TestCase):
+    def test_ping_and_echo_are_timed(self):
+        server = StandInServer()
+        game_state = GameState({}, {})
+        client_network = ClientNetwork(game_state, port=server.port)
+        game_state.set_client_network(client_network)
+        client_network.connect()
+        try:
+            time.sleep(0.1)
+            server.broadcast(gamestate_frame(1, example_gamestate()))
+            server.broadcast(b"S3nD:ping[EOM]")
+            server.broadcast(b"S3nD:ping[EOM]")
+            self.assertTrue(server.wait_for_frames(2))
+            time.sleep(0.1)
+            game_state.update_monster(1, 1, -1, True)
+            deadline = time.monotonic() + 5
+            while (
+                client_network.heartbeat.echo.count == 0 and time.monotonic() < deadline
+            ):
+                time.sleep(0.02)
+        finally:
+            client_network.disconnect()
+            server.close()
+        summary = client_network.heartbeat.summary()
+        self.assertEqual(summary["turnaround"]["count"], 2)
+        self.assertEqual(summary["ping_interval"]["count"], 1)
+        self.assertEqual(summary["echo"]["count"], 1)
+        self.assertEqual(summary["waiting_for_echo"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
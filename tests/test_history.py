@@ -0,0 +1,98 @@
+import unittest
+
+from standin_server import example_gamestate, gamestate_frame
+from xhaven_core import GameState
+from xhaven_core.history import Change, History
+
+
+class RecordingNetwork:
+    def __init__(self):
+        self.frames = []
+
+    def send_data(self, data):
+        self.frames.append(data)
+
+
+class TestUndo(unittest.TestCase):
+    def setUp(self):
+        self.game_state = GameState({}, {})
+        self.game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+        self.network = RecordingNetwork()
+        self.game_state.set_client_network(self.network)
+
+    def standees(self):
+        return self.game_state.get_monster_info()
+
+    def test_undo_redo_initiative(self):
+        self.game_state.update_initiative(index=1, initiative=42)
+        self.assertTrue(self.game_state.undo())
+        character = self.game_state.currentList[0].characterState
+        self.assertEqual(character.initiative, 5)
+        self.assertIn(b"Undo: Set initiative of Demolitionist", self.network.frames[-1])
+
+        self.assertTrue(self.game_state.redo())
+        self.assertEqual(character.initiative, 42)
+        self.assertFalse(self.game_state.redo())
+
+    def test_undo_kill_restores_standee(self):
+        before = self.standees()
+        self.game_state.update_monster(
+            index=1, standee_nr=3, health=-10, relative=True, condition="p"
+        )
+        self.assertEqual(len(self.standees()), 2)
+
+        self.game_state.undo()
+        self.assertEqual(self.standees(), before)
+        monster_instance = self.game_state.currentList[1].monster_instances[1]
+        self.assertEqual(monster_instance.conditions, [])
+
+        self.game_state.redo()
+        self.assertEqual(len(self.standees()), 2)
+
+    def test_one_push_per_undo(self):
+        self.game_state.update_monster(index=1, standee_nr=1, health=-2, relative=True)
+        self.game_state.update_monster(index=1, standee_nr=1, health=-2, relative=True)
+        frames = len(self.network.frames)
+        self.game_state.undo()
+        self.game_state.undo()
+        self.assertEqual(len(self.network.frames), frames + 2)
+        self.assertEqual(self.standees()[0][2], 6)
+        self.assertFalse(self.game_state.undo())
+
+    def test_undo_after_new_gamestate_from_server(self):
+        self.game_state.update_initiative(index=1, initiative=42)
+        # The app echoes the change, this recreates all entities
+        self.game_state.set_gamestate(self.network.frames[-1])
+        self.game_state.undo()
+        self.assertEqual(self.game_state.currentList[0].characterState.initiative, 5)
+
+    def test_new_change_clears_redo(self):
+        self.game_state.update_initiative(index=1, initiative=42)
+        self.game_state.undo()
+        self.game_state.update_initiative(index=1, initiative=43)
+        self.assertFalse(self.game_state.redo())
+
+
+class TestHistory(unittest.TestCase):
+    def change(self) -> Change:
+        change = Change()
+        change.set_field(("character", "Demolitionist"), "initiative", 1, 2)
+        return change
+
+    def test_max_changes(self):
+        history = History(max_changes=2)
+        for _ in range(3):
+            history.record(self.change())
+        self.assertEqual(len(history.undo_stack), 2)
+
+    def test_memory_budget(self):
+        change = self.change()
+        history = History(max_bytes=change.size * 2)
+        for _ in range(5):
+            history.record(self.change())
+        self.assertLessEqual(history.size, change.size * 2)
+        self.assertEqual(len(history.undo_stack), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from standin_server import StandInServer
+from xhaven_core import config
+from xhaven_core.hub import HUB_PARAMETERS, Hub, load_hub_parameters
+
+
+def wait_until(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestHub(unittest.TestCase):
+    def setUp(self):
+        self.servers = [StandInServer(), StandInServer()]
+        tables = {
+            "table%d" % nr: {"port": server.port, "startup_delay": 0}
+            for nr, server in enumerate(self.servers, 1)
+        }
+        handle, self.path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(handle, "w") as file:
+            json.dump({"tables": tables}, file)
+
+    def tearDown(self):
+        os.remove(self.path)
+        for server in self.servers:
+            server.close()
+
+    def test_load_parameters_defaults(self):
+        tables = load_hub_parameters(self.path)
+        self.assertEqual(tables["table1"]["host"], "localhost")
+        self.assertEqual(tables["table2"]["character_names"], {})
+
+    def test_tables_take_the_parameters_of_initial_parameters(self):
+        tables = load_hub_parameters(self.path)
+        self.assertEqual(
+            set(tables["table2"]),
+            set(config.DEFAULT_PARAMETERS) - set(HUB_PARAMETERS)
+            | {"microphone", "startup_delay"},
+        )
+        self.assertEqual(tables["table2"]["auto_end_of_round"], False)
+        self.assertEqual(tables["table1"]["startup_delay"], 0)
+
+        invalid = ({"startup_delay": "5"}, {"microphone": "1"}, {"snapshot_port": 1})
+        for table in invalid:
+            with open(self.path, "w") as file:
+                json.dump({"tables": {"table1": table}}, file)
+            with self.subTest(table=table), self.assertRaises(ValueError):
+                load_hub_parameters(self.path)
+
+    def test_load_parameters_rejects_unknown_keys(self):
+        with open(self.path, "w") as file:
+            json.dump({"tables": {"table1": {"prot": 4567}}}, file)
+        with self.assertRaises(ValueError):
+            load_hub_parameters(self.path)
+
+    def test_sessions_are_isolated_and_restartable(self):
+        hub = Hub.from_file(self.path)
+        hub.start()
+        try:
+            for session in hub.sessions.values():
+                game_state = session.game_state
+                self.assertTrue(wait_until(lambda: len(game_state.currentList) == 3))
+
+            hub.sessions["table1"].game_state.update_initiative(index=1, initiative=42)
+            self.assertTrue(self.servers[0].wait_for_frames(2))
+            self.assertEqual(len(self.servers[1].frames), 1)
+
+            old_game_state = hub.sessions["table2"].game_state
+            hub.restart("table2")
+            session = hub.sessions["table2"]
+            self.assertIsNot(session.game_state, old_game_state)
+            game_state = session.game_state
+            self.assertTrue(wait_until(lambda: len(game_state.currentList) == 3))
+            self.assertEqual(hub.metrics()["table2"]["restarts"], 1)
+            self.assertTrue(hub.metrics()["table1"]["connected"])
+        finally:
+            hub.stop()
+
+    def test_route_audio_to_unknown_session(self):
+        hub = Hub.from_file(self.path)
+        with self.assertRaises(KeyError):
+            hub.route_audio(1, "table3")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import array
+import threading
+import unittest
+
+from xhaven_core.microphones import (
+    ChannelStream,
+    MultichannelMicrophone,
+    split_channels,
+)
+
+
+class TestMicrophones(unittest.TestCase):
+    def test_split_channels(self):
+        data = array.array("h", [1, 10, 2, 20, 3, 30]).tobytes()
+        left, right = split_channels(data, 2)
+        self.assertEqual(array.array("h", left).tolist(), [1, 2, 3])
+        self.assertEqual(array.array("h", right).tolist(), [10, 20, 30])
+
+    def test_channel_stream_read_waits_for_audio(self):
+        stream = ChannelStream(max_bytes=1000)
+        threading.Timer(0.05, stream.write, args=(b"\x01\x00" * 4,)).start()
+        self.assertEqual(stream.read(4), b"\x01\x00" * 4)
+
+    def test_channel_stream_drops_oldest_audio(self):
+        stream = ChannelStream(max_bytes=4)
+        stream.write(b"\x01\x00\x02\x00")
+        stream.write(b"\x03\x00")
+        self.assertEqual(stream.read(2), b"\x02\x00\x03\x00")
+
+    def test_closed_channel_stream_ends(self):
+        stream = ChannelStream(max_bytes=1000)
+        threading.Timer(0.05, stream.close).start()
+        self.assertEqual(stream.read(1024), b"")
+
+    def test_closing_a_channel_keeps_the_others(self):
+        microphone = MultichannelMicrophone(None, 2)
+        # As if the capture was running, without an audio device
+        microphone.is_running = True
+        first = microphone.open_channel(0)
+        second = microphone.open_channel(1)
+
+        microphone.close_channel(0)
+        self.assertEqual(first.read(1024), b"")
+        self.assertTrue(microphone.is_running)
+        second.write(b"\x01\x00")
+        self.assertEqual(second.read(1), b"\x01\x00")
+
+        microphone.close_channel(1)
+        self.assertFalse(microphone.is_running)
+        self.assertEqual(second.read(1), b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
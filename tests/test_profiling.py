@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+
+from xhaven_core import commands, profiling
+
+
+def busy_worker(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.profiler = profiling.Profiler(self.directory.name)
+
+    def tearDown(self):
+        self.profiler.stop()
+        self.directory.cleanup()
+
+    def test_nothing_is_installed_while_off(self):
+        self.assertIsNone(sys.getprofile())
+        self.assertFalse(self.profiler.cpu_running)
+        self.assertIsNone(self.profiler.stop_cpu())
+
+    def test_cpu_profile_sees_other_threads(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_worker, args=(stop,))
+        worker.start()
+        try:
+            self.assertTrue(self.profiler.start_cpu())
+            self.assertFalse(self.profiler.start_cpu())
+            time.sleep(0.2)
+            path = self.profiler.toggle_cpu()
+        finally:
+            stop.set()
+            worker.join()
+        self.assertFalse(self.profiler.cpu_running)
+        with open(path) as file:
+            self.assertIn("busy_worker", file.read())
+
+    def test_memory_snapshots(self):
+        already_tracing = tracemalloc.is_tracing()
+        first = self.profiler.snapshot_memory()
+        data = [bytes(1000) for _ in range(1000)]
+        second = self.profiler.snapshot_memory()
+        with open(second) as file:
+            report = file.read()
+        self.assertIn("Growth since the previous snapshot", report)
+        self.assertIn("test_profiling.py", report)
+        self.assertTrue(os.path.exists(first))
+        self.profiler.stop_memory()
+        self.assertEqual(tracemalloc.is_tracing(), already_tracing)
+        del data
+
+    def test_commands(self):
+        self.assertEqual(commands.parse_command("profile").action, "profile")
+        self.assertEqual(commands.parse_command("Memory stop").action, "memory_stop")
+
+
+if __name__ == "__main__":
+    unittest.main()
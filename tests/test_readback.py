@@ -0,0 +1,108 @@
+import tempfile
+import unittest
+import wave
+
+from standin_server import example_gamestate, gamestate_frame
+from xhaven_core import GameState
+from xhaven_core.readback import (
+    WORD_GAP,
+    Clip,
+    EspeakBackend,
+    FileSink,
+    Readback,
+    answer,
+)
+
+SAMPLE_RATE = 8000
+
+
+class FakeBackend:
+    """Synthesize one loud sample per letter, and count the calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def synthesize(self, text):
+        self.calls.append(text)
+        return Clip(SAMPLE_RATE, b"\xff\x7f" * len(text))
+
+
+class TestAnswer(unittest.TestCase):
+    def setUp(self):
+        self.game_state = GameState(
+            {"Demolitionist": "Daniel"}, {"Blood Monstrosity": "Krabban"}
+        )
+        self.game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+
+    def test_monster_by_number_and_standee(self):
+        self.assertEqual(
+            answer(self.game_state, ["monster", "1", "3"]),
+            ["Common Vermling Raider", "standee", "3", "elite"]
+            + ["health", "6", "of", "10"],
+        )
+
+    def test_monster_and_character_by_name(self):
+        self.assertEqual(
+            answer(self.game_state, ["Krabban"]),
+            ["Krabban", "standee", "2", "health", "8", "of", "9"],
+        )
+        self.assertEqual(
+            answer(self.game_state, []),
+            ["Daniel", "health", "11", "of", "11", "initiative", "5"],
+        )
+
+    def test_unknown(self):
+        self.assertEqual(answer(self.game_state, ["nobody"]), ["not found"])
+        self.assertEqual(
+            answer(self.game_state, ["monster", "1", "7"]),
+            ["Common Vermling Raider", "no standees"],
+        )
+
+
+class TestReadback(unittest.TestCase):
+    def setUp(self):
+        self.game_state = GameState({}, {"Blood Monstrosity": "Krabban"})
+        self.game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.backend = FakeBackend()
+        self.sink = FileSink(directory.name)
+        self.readback = Readback(self.backend, self.sink)
+
+    def test_answer_from_cache_only(self):
+        self.readback.prepare(self.game_state)
+        self.assertIn("krabban", self.readback.cache)
+        self.assertIn("30", self.readback.cache)
+        # Initiatives go up to 99
+        self.assertIn("99", self.readback.cache)
+        calls = len(self.backend.calls)
+
+        self.assertTrue(self.readback.status(self.game_state, ["krabban"]))
+        self.assertEqual(len(self.backend.calls), calls)
+
+        phrases = ["Krabban", "standee", "2", "health", "8", "of", "9"]
+        with wave.open(self.sink.paths[0], "rb") as wav:
+            self.assertEqual(wav.getframerate(), SAMPLE_RATE)
+            self.assertEqual(
+                wav.getnframes(),
+                sum(len(phrase) for phrase in phrases)
+                + (len(phrases) - 1) * int(WORD_GAP * SAMPLE_RATE),
+            )
+
+    def test_missing_phrase_is_synthesized_once(self):
+        self.readback.status(self.game_state, ["monster", "1"])
+        self.readback.status(self.game_state, ["monster", "1"])
+        self.assertEqual(self.backend.calls.count("standee"), 1)
+        self.assertEqual(len(self.sink.paths), 2)
+
+    def test_trimmed(self):
+        clip = Clip(SAMPLE_RATE, b"\0\0" * 100 + b"\xff\x7f" * 10 + b"\0\0" * 100)
+        self.assertEqual(len(clip.trimmed(pad=0).frames), 20)
+        self.assertEqual(Clip.from_wav(clip.to_wav()), clip)
+
+
+@unittest.skipUnless(EspeakBackend().available, "espeak-ng is not installed")
+class TestEspeak(unittest.TestCase):
+    def test_synthesize(self):
+        clip = EspeakBackend().synthesize("health")
+        self.assertGreater(clip.seconds, 0.1)
@@ -0,0 +1,83 @@
+import random
+import threading
+import time
+import unittest
+
+from xhaven_core.recognitionpool import RecognitionPool
+
+
+def fake_engine(model):
+    # The "audio" is the text itself, recognition takes a random time so the
+    # results come back from the workers out of order
+    def recognize(frame, sample_rate, sample_width):
+        text = bytes(frame).decode("utf-8")
+        time.sleep(0.5 if text.startswith("slow") else random.uniform(0.0, 0.05))
+        if text == "fail":
+            raise RuntimeError("engine failed")
+        return text or None
+
+    return recognize
+
+
+class FakeAudio:
+    def __init__(self, text):
+        self.frame_data = text.encode("utf-8")
+        self.sample_rate = 16000
+        self.sample_width = 2
+
+
+class TestRecognitionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = RecognitionPool(
+            workers=3, engine="test_recognitionpool:fake_engine", slots=4
+        )
+        self.results = []
+        self.done = threading.Event()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def collect(self, count):
+        def callback(text):
+            self.results.append(text)
+            if len(self.results) == count:
+                self.done.set()
+
+        return callback
+
+    def test_results_in_submission_order(self):
+        texts = ["monster %d damage %d" % (nr, nr * 2) for nr in range(20)]
+        callback = self.collect(len(texts))
+        for text in texts:
+            self.pool.submit(FakeAudio(text), callback)
+        self.assertTrue(self.done.wait(10))
+        self.assertEqual(self.results, texts)
+
+    def test_failure_does_not_block_later_results(self):
+        callback = self.collect(3)
+        for text in ["player 1 10", "fail", "player 2 20"]:
+            self.pool.submit_frame(text.encode("utf-8"), 16000, callback)
+        self.assertTrue(self.done.wait(10))
+        self.assertEqual(self.results, ["player 1 10", None, "player 2 20"])
+
+    def test_streams_do_not_wait_for_each_other(self):
+        callback = self.collect(2)
+        self.pool.submit(FakeAudio("slow initiative 45"), callback, stream="Drifter")
+        self.pool.submit(FakeAudio("initiative 12"), callback, stream="Geminate")
+        self.assertTrue(self.done.wait(10))
+        self.assertEqual(self.results, ["initiative 12", "slow initiative 45"])
+
+    def test_slow_callback_does_not_hold_up_other_streams(self):
+        release = threading.Event()
+        callback = self.collect(1)
+        self.pool.submit(FakeAudio("player 1 10"), lambda text: release.wait(10))
+        self.pool.submit(FakeAudio("initiative 12"), callback, stream="Geminate")
+        try:
+            self.assertTrue(self.done.wait(10))
+        finally:
+            release.set()
+        self.assertEqual(self.results, ["initiative 12"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+from xhaven_core import GameState
+from xhaven_core.recorder import (
+    INBOUND,
+    OUTBOUND,
+    SessionReader,
+    SessionRecorder,
+    SessionReplayer,
+)
+
+EXAMPLE_FILE = os.path.join(os.path.dirname(__file__), "example.txt")
+
+
+def example_frame(index: int) -> bytes:
+    with open(EXAMPLE_FILE, "rb") as file:
+        gamestate = file.read()
+    return b"S3nD:Index:%dDescription:TestGameState:%s[EOM]" % (index, gamestate)
+
+
+class TestSessionRecorder(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".xhrec")
+        os.close(handle)
+        os.remove(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_record_and_read(self):
+        recorder = SessionRecorder(self.path)
+        recorder.record(INBOUND, b"S3nD:ping[EOM]")
+        recorder.record(OUTBOUND, b"S3nD:pong[EOM]")
+        recorder.record(INBOUND, example_frame(1))
+        recorder.close()
+
+        records = list(SessionReader(self.path))
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0][0], INBOUND)
+        self.assertEqual(records[1][2], b"S3nD:pong[EOM]")
+        self.assertEqual(records[2][2], example_frame(1))
+        self.assertLessEqual(records[0][1], records[2][1])
+
+    def test_append_to_existing_recording(self):
+        recorder = SessionRecorder(self.path)
+        recorder.record(INBOUND, b"S3nD:ping[EOM]")
+        recorder.close()
+        recorder = SessionRecorder(self.path)
+        recorder.record(INBOUND, b"S3nD:ping[EOM]")
+        recorder.close()
+
+        self.assertEqual(len(list(SessionReader(self.path))), 2)
+
+    def test_truncated_record_is_ignored(self):
+        recorder = SessionRecorder(self.path)
+        recorder.record(INBOUND, example_frame(1))
+        recorder.record(INBOUND, example_frame(2))
+        recorder.close()
+        with open(self.path, "r+b") as file:
+            file.truncate(os.path.getsize(self.path) - 10)
+
+        self.assertEqual(len(list(SessionReader(self.path))), 1)
+
+    def test_replay(self):
+        recorder = SessionRecorder(self.path)
+        recorder.record(INBOUND, example_frame(1))
+        recorder.record(OUTBOUND, b"S3nD:pong[EOM]")
+        recorder.record(OUTBOUND, example_frame(2))
+        recorder.record(INBOUND, example_frame(3))
+        recorder.close()
+
+        game_state = GameState({}, {})
+        stats = SessionReplayer(game_state, self.path).replay()
+        self.assertEqual(stats["frames"], 2)
+        self.assertEqual(game_state.index, 3)
+        self.assertEqual(len(game_state.get_character_index()), 1)
+
+        stats = SessionReplayer(game_state, self.path, include_outbound=True).replay()
+        self.assertEqual(stats["frames"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import http.client
+import json
+import unittest
+
+from standin_server import example_gamestate, gamestate_frame
+from xhaven_core import GameState
+
+
+class TestSnapshotServer(unittest.TestCase):
+    def setUp(self):
+        self.game_state = GameState({"Demolitionist": "Daniel"}, {})
+        self.game_state.set_gamestate(gamestate_frame(4, example_gamestate()))
+        self.server = self.game_state.serve_snapshots(port=0)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def request(self, path: str, headers: dict = None):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=5)
+        connection.request("GET", path, headers=headers or {})
+        return connection, connection.getresponse()
+
+    def test_snapshot(self):
+        connection, response = self.request("/snapshot")
+        snapshot = json.loads(response.read())
+        connection.close()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(snapshot["index"], 4)
+        self.assertEqual(snapshot["characters"][0]["name"], "Daniel")
+        self.assertEqual(snapshot["characters"][0]["initiative"], 5)
+        self.assertEqual(len(snapshot["monsters"][0]["standees"]), 2)
+
+    def test_etag(self):
+        connection, response = self.request("/snapshot")
+        response.read()
+        connection.close()
+        etag = response.getheader("ETag")
+
+        connection, response = self.request("/snapshot", {"If-None-Match": etag})
+        response.read()
+        connection.close()
+        self.assertEqual(response.status, 304)
+
+        self.game_state.update_initiative(index=1, initiative=42)
+        connection, response = self.request("/snapshot", {"If-None-Match": etag})
+        snapshot = json.loads(response.read())
+        connection.close()
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(response.getheader("ETag"), etag)
+        self.assertEqual(snapshot["characters"][0]["initiative"], 42)
+
+    def test_events(self):
+        connection, response = self.request("/events")
+        self.assertEqual(response.getheader("Content-Type"), "text/event-stream")
+        self.game_state.update_monster(index=2, standee_nr=2, health=-1, relative=True)
+
+        self.assertEqual(response.fp.readline(), b"event: change\n")
+        data = response.fp.readline()
+        connection.close()
+        event = json.loads(data[len(b"data: ") :])
+        self.assertEqual(event["type"], "MonsterHealthChanged")
+        self.assertEqual(event["new"], 7)
+
+    def test_unknown_path(self):
+        connection, response = self.request("/gamestate")
+        response.read()
+        connection.close()
+        self.assertEqual(response.status, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import functools
+import logging
+import threading
+import types
+import unittest
+
+from standin_server import example_gamestate, gamestate_frame
+from xhaven_core import GameState, speech
+from xhaven_core.speculation import Speculator, command_key
+
+
+class RecordingNetwork:
+    def __init__(self):
+        self.frames = []
+
+    def send_data(self, data):
+        self.frames.append(data)
+
+
+class TestSpeculator(unittest.TestCase):
+    def setUp(self):
+        self.game_state = GameState(
+            {"Demolitionist": "Daniel"}, {"Blood Monstrosity": "Krabban"}
+        )
+        self.game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+        self.network = RecordingNetwork()
+        self.game_state.set_client_network(self.network)
+
+        listener = types.SimpleNamespace(
+            game_class=self.game_state,
+            character=None,
+            readback=None,
+            logger=logging.getLogger("test"),
+        )
+        listener.monster_command = functools.partial(
+            speech.speech.monster_command, listener
+        )
+        self.speculator = Speculator(
+            self.game_state, lambda text: speech.speech.execute_text(listener, text)
+        )
+
+    def health(self):
+        return self.game_state.currentList[2].monster_instances[0].health
+
+    def speculate(self, text):
+        self.assertFalse(self.speculator.partial(text))
+        self.assertTrue(self.speculator.partial(text))
+        self.assertEqual(self.health(), 5)
+
+    def test_incomplete_and_unknown_commands_wait(self):
+        self.assertIsNone(command_key(self.game_state, "monster Krabban 2 damage"))
+        self.assertIsNone(command_key(self.game_state, "monster Nobody 2 damage 3"))
+        for _ in range(3):
+            self.assertFalse(self.speculator.partial("monster Krabban 2 damage"))
+            self.assertFalse(self.speculator.partial("undo"))
+        self.assertEqual(self.network.frames, [])
+
+    def test_confirmed(self):
+        self.speculate("monster Krabban 2 damage 3")
+        frames = len(self.network.frames)
+        self.assertFalse(self.speculator.final("Monster Krabban 2 damage 3."))
+        self.assertEqual(self.health(), 5)
+        self.assertEqual(len(self.network.frames), frames)
+
+        summary = self.speculator.summary()["monster"]
+        self.assertEqual(summary["confirmed"], 1)
+        self.assertEqual(summary["rollback_rate"], 0.0)
+        self.assertEqual(summary["saved"]["count"], 1)
+
+    def test_rolled_back_and_corrected(self):
+        self.speculate("monster Krabban 2 damage 3")
+        self.assertTrue(self.speculator.final("monster Krabban 2 damage 4"))
+        self.assertEqual(self.health(), 4)
+        self.assertIn(b"Retract: ", self.network.frames[-2])
+        self.assertEqual(self.speculator.summary()["monster"]["rollback_rate"], 1.0)
+
+        # The retracted update is gone from the history
+        self.assertFalse(self.game_state.redo())
+        self.assertTrue(self.game_state.undo())
+        self.assertEqual(self.health(), 8)
+        self.assertFalse(self.game_state.undo())
+
+    def test_punctuation_and_capitals_are_executed(self):
+        demolitionist = self.game_state.currentList[0].characterState
+        self.assertFalse(self.speculator.partial("Player Daniel 45."))
+        self.assertTrue(self.speculator.partial("Player Daniel 45."))
+        self.assertEqual(demolitionist.initiative, 45)
+
+        self.assertTrue(self.speculator.final("Player Daniel 46."))
+        self.assertEqual(demolitionist.initiative, 46)
+        self.assertEqual(
+            self.speculator.summary()["initiative"]["rolled_back"], 1
+        )
+
+    def test_not_understood_rolls_back(self):
+        self.speculate("monster Krabban 2 damage 3")
+        self.assertTrue(self.speculator.final(None))
+        self.assertEqual(self.health(), 8)
+
+    def test_conflict_keeps_later_change(self):
+        self.speculate("monster Krabban 2 damage 3")
+        self.game_state.update_initiative(index=1, initiative=30)
+        self.speculator.final("monster Krabban 2 damage 4")
+        # Not rolled back, the final command is applied on top
+        self.assertEqual(self.health(), 1)
+        self.assertEqual(self.speculator.summary()["monster"]["conflicts"], 1)
+
+    def test_update_from_another_thread_is_never_retracted(self):
+        execute = self.speculator.execute
+        other = threading.Thread(
+            target=self.game_state.update_initiative,
+            kwargs={"index": 1, "initiative": 30},
+        )
+
+        def execute_then_interleave(text):
+            # Another player commits right after the speculative update
+            updated = execute(text)
+            other.start()
+            other.join(0.1)
+            return updated
+
+        self.speculator.execute = execute_then_interleave
+        self.assertFalse(self.speculator.partial("monster Krabban 2 damage 3"))
+        self.assertTrue(self.speculator.partial("monster Krabban 2 damage 3"))
+        self.speculator.execute = execute
+        other.join()
+
+        self.speculator.final("monster Krabban 2 damage 4")
+        self.assertEqual(self.game_state.currentList[0].characterState.initiative, 30)
+        self.assertEqual(self.speculator.summary()["monster"]["conflicts"], 1)
@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+import unittest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+
+# Maximum cumulative import time in microseconds, measured with python -X importtime
+IMPORT_BUDGET = 100_000
+
+# Modules that must only be imported when the feature that needs them is used
+HEAVY_MODULES = (
+    "numpy",
+    "speech_recognition",
+    "winsound",
+    "pyaudio",
+    "asyncio",
+    "orjson",
+    "msgspec",
+)
+
+
+def import_times(statement: str) -> dict:
+    """Return the cumulative import time in microseconds of every module imported by statement."""
+    environment = dict(os.environ, PYTHONPATH=SRC_DIR)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        env=environment,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    def check_startup(self, statement: str, module: str):
+        times = import_times(statement)
+        for name in HEAVY_MODULES:
+            self.assertNotIn(name, times, "%s imports %s" % (module, name))
+        self.assertLess(times[module], IMPORT_BUDGET)
+
+    def test_package_import(self):
+        self.check_startup("import xhaven_core", "xhaven_core")
+
+    def test_entry_point_import(self):
+        self.check_startup("import xhaven_speech", "xhaven_speech")
+
+    def test_speech_module_import(self):
+        self.check_startup("import xhaven_core.speech", "xhaven_core.speech")
+
+
+if __name__ == "__main__":
+    unittest.main()
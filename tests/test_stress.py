@@ -0,0 +1,25 @@
+import unittest
+
+import stress
+
+
+class TestStress(unittest.TestCase):
+    def test_free_running(self):
+        report = stress.run(seed=1, threads=6, operations=100)
+        self.assertEqual(report.failures, [])
+        self.assertEqual(report.operations, 600)
+        self.assertGreater(report.lock_acquisitions, 0)
+
+    def test_turns(self):
+        report = stress.run(seed=2, threads=4, operations=50, turns=True)
+        self.assertEqual(report.failures, [])
+
+    def test_schedule_is_seeded(self):
+        self.assertEqual(stress.make_schedule(3, 2, 20), stress.make_schedule(3, 2, 20))
+        self.assertNotEqual(
+            stress.make_schedule(3, 2, 20), stress.make_schedule(4, 2, 20)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import types
+import unittest
+
+from standin_server import example_gamestate, gamestate_frame
+from xhaven_core import GameState, speech
+from xhaven_core.targets import ELITE, Targets, parse_targets
+
+
+class RecordingNetwork:
+    def __init__(self):
+        self.frames = []
+
+    def send_data(self, data):
+        self.frames.append(data)
+
+
+class TestParseTargets(unittest.TestCase):
+    def test_selections(self):
+        cases = [
+            ("3 damage 2", Targets((3,)), 1),
+            ("1-4 damage 2", Targets((1, 2, 3, 4)), 1),
+            ("1 to 3 poison", Targets((1, 2, 3)), 3),
+            ("1, 3 and 5 poison", Targets((1, 3, 5)), 4),
+            ("1,3,5 poison", Targets((1, 3, 5)), 1),
+            ("all elites poison", Targets(None, ELITE), 2),
+            ("all 4", Targets(), 1),
+        ]
+        for text, expected, used in cases:
+            with self.subTest(text=text):
+                self.assertEqual(parse_targets(text.split()), (expected, used))
+
+    def test_number_after_number_ends_selection(self):
+        self.assertEqual(parse_targets(["3", "10"]), (Targets((3,)), 1))
+
+    def test_no_selection(self):
+        self.assertEqual(parse_targets(["poison"]), (None, 0))
+
+
+class TestUpdateMonsters(unittest.TestCase):
+    def setUp(self):
+        self.game_state = GameState({}, {"Common Vermling Raider": "Vermling"})
+        self.game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+        self.network = RecordingNetwork()
+        self.game_state.set_client_network(self.network)
+        self.speech = types.SimpleNamespace(game_class=self.game_state)
+
+    def command(self, name, text, all_groups=False):
+        return speech.speech.monster_command(
+            self.speech, name, text.split(), all_groups
+        )
+
+    def test_area_attack_is_one_push(self):
+        self.assertTrue(self.game_state.update_monsters(index=1, health=-2))
+        self.assertEqual(len(self.network.frames), 1)
+        self.assertEqual(
+            [standee[2] for standee in self.game_state.get_monster_info()[:2]],
+            [4, 4],
+        )
+        self.assertTrue(self.game_state.undo())
+        self.assertEqual(self.game_state.get_monster_info()[0][2], 6)
+
+    def test_area_attack_kills(self):
+        self.assertTrue(self.command("vermling", "all damage 6"))
+        self.assertEqual(len(self.game_state.get_monster_info()), 1)
+        self.assertEqual(len(self.network.frames), 1)
+
+    def test_all_elites_of_all_monsters(self):
+        self.assertTrue(self.command("", "all elites poison", all_groups=True))
+        poisoned = [
+            monster_instance.standeeNr
+            for item in self.game_state.currentList[1:]
+            for monster_instance in item.monster_instances
+            if 6 in monster_instance.conditions
+        ]
+        self.assertEqual(poisoned, [1, 3])
+        self.assertEqual(len(self.network.frames), 1)
+
+    def test_index_zero_and_partial_names_match_nothing(self):
+        self.assertFalse(self.game_state.update_monster(0, 2, -1, True))
+        self.assertFalse(self.game_state.update_monsters(health=-1))
+        self.assertFalse(self.command("a", "all damage 1"))
+        self.assertTrue(self.command("common vermling raider", "3 damage 1"))
+        self.assertEqual(len(self.network.frames), 1)
+
+    def test_monster_missing_from_names_is_found_by_id(self):
+        # Blood Monstrosity has no spoken name in the configuration
+        self.assertEqual(
+            self.game_state.find_monster("blood monstrosity"), "Blood Monstrosity"
+        )
+        self.assertIsNone(self.game_state.find_monster("blood"))
+        self.assertTrue(
+            self.game_state.update_monsters(name="BLOOD MONSTROSITY", health=-1)
+        )
+        self.assertEqual(self.game_state.get_monster_info()[2][2], 7)
+        self.assertTrue(
+            self.game_state.update_monster_condition(
+                "blood monstrosity", 2, "poison", True
+            )
+        )
+        self.assertFalse(
+            self.game_state.update_monster_condition("blood", 2, "stun", True)
+        )
+        self.assertTrue(
+            self.game_state.update_monster_condition("vermling", 1, "stun", True)
+        )
+
+    def test_unknown_standees(self):
+        self.assertFalse(self.command("vermling", "7 to 9 damage 1"))
+        self.assertEqual(self.network.frames, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+
+from standin_server import example_gamestate, gamestate_frame
+from xhaven_core import GameState
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+if HAS_NUMPY:
+    from xhaven_core.timeline import CHARACTER, STANDEE, Timeline, segment_paths
+
+
+class RecordingNetwork:
+    def __init__(self):
+        self.frames = []
+
+    def send_data(self, data):
+        self.frames.append(data)
+
+
+@unittest.skipUnless(HAS_NUMPY, "numpy is not installed")
+class TestTimeline(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "session")
+
+    def play(self, path, flush_rows=100000):
+        """Round 1: damage and kill a raider, round 2: initiative and damage."""
+        game_state = GameState({}, {})
+        game_state.set_client_network(RecordingNetwork())
+        game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+        game_state.record_timeline(path, flush_rows)
+        game_state.update_monster(index=1, standee_nr=1, health=-2, relative=True)
+        game_state.update_monster(index=1, standee_nr=3, health=-10, relative=True)
+        with game_state.lock:
+            game_state.round = 2
+        game_state.update_initiative(index=1, initiative=42)
+        game_state.update_monster(index=2, standee_nr=2, health=-3, relative=True)
+        game_state.stop_timeline()
+        return game_state
+
+    def test_queries(self):
+        self.play(self.path)
+        timeline = Timeline.load(self.path)
+
+        # 5 samples: the start and 4 updates, the kill removes a standee
+        self.assertEqual(len(timeline), 4 + 4 + 3 + 3 + 3)
+        self.assertEqual(timeline.damage_per_round(), {1: 2, 2: 3})
+        self.assertEqual(timeline.damage_per_round(CHARACTER), {})
+        self.assertEqual(timeline.damage_per_round(STANDEE), {1: 2, 2: 3})
+        self.assertEqual(timeline.kills_per_monster(), {"Common Vermling Raider": 1})
+        self.assertEqual(timeline.initiative_trend("Demolitionist"), {1: 5, 2: 42})
+        self.assertEqual(timeline.initiative_trend("Nobody"), {})
+
+    def test_campaign_over_segments(self):
+        second = os.path.join(self.directory.name, "second")
+        self.play(self.path, flush_rows=5)
+        self.play(second)
+        self.assertGreater(len(segment_paths(self.path)), 1)
+        self.assertEqual(len(segment_paths(second)), 1)
+
+        timeline = Timeline.load([self.path, second])
+        self.assertEqual(timeline.damage_per_round(), {1: 4, 2: 6})
+        self.assertEqual(timeline.kills_per_monster(), {"Common Vermling Raider": 2})
+        self.assertEqual(
+            timeline.initiative_trend("Demolitionist", session=1), {1: 5, 2: 42}
+        )
+
+    def test_reused_standee_number_is_a_new_figure(self):
+        game_state = GameState({}, {})
+        game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+        game_state.record_timeline(self.path)
+        game_state.update_monster(index=1, standee_nr=3, health=-10, relative=True)
+        # A new standee 3 with less health than the old one had
+        gamestate = json.loads(example_gamestate())
+        gamestate["currentList"][1]["monsterInstances"][1]["health"] = 2
+        game_state.set_gamestate(gamestate_frame(5, json.dumps(gamestate).encode()))
+        game_state.stop_timeline()
+
+        timeline = Timeline.load(self.path)
+        self.assertEqual(timeline.damage_per_round(), {})
+        self.assertEqual(timeline.kills_per_monster(), {"Common Vermling Raider": 1})
+
+    def test_echo_is_recorded_once(self):
+        game_state = GameState({}, {})
+        game_state.set_client_network(RecordingNetwork())
+        game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+        recorder = game_state.record_timeline(self.path)
+        game_state.update_monster(index=1, standee_nr=1, health=-2, relative=True)
+        rows = recorder.rows
+        # The app echoes the gamestate that was just sent
+        game_state.set_gamestate(game_state.client_network.frames[-1])
+        self.assertEqual(recorder.rows, rows)
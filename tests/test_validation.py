@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from standin_server import StandInServer, example_gamestate, gamestate_frame
+from xhaven_core import ClientNetwork, GameState
+from xhaven_core.validation import FrameError, Quarantine, check_gamestate, split_frame
+
+
+class TestSplitFrame(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(
+            split_frame(b"S3nD:Index:-3Description:D:xGameState:{}[EOM]"),
+            (-3, "D:x", "{}"),
+        )
+
+    def test_invalid(self):
+        frames = [
+            b"S3nD:ping[EOM]",
+            b"S3nD:Index:1Description:GameState:{}",
+            b"S3nD:Index:xDescription:GameState:{}[EOM]",
+            b"S3nD:Index:1GameState:{}[EOM]",
+            b"S3nD:Index:1Description:GameState:{\"round\": 1[EOM]",
+            b"S3nD:Index:1Description:\xffGameState:{}[EOM]",
+        ]
+        for frame in frames:
+            with self.subTest(frame=frame):
+                with self.assertRaises(FrameError):
+                    split_frame(frame)
+
+    def test_check_gamestate(self):
+        valid = {"level": 1, "round": 1, "roundState": 0, "currentList": []}
+        check_gamestate(valid)
+        for invalid in (
+            {"round": 1},
+            dict(valid, currentList={}),
+            dict(valid, currentList=[{"characterState": {}}]),
+            dict(valid, currentList=[{"id": "a", "monsterInstances": [{}]}]),
+        ):
+            with self.subTest(gamestate=invalid):
+                with self.assertRaises(FrameError):
+                    check_gamestate(invalid)
+
+
+class TestSetGamestate(unittest.TestCase):
+    def test_invalid_gamestate_changes_nothing(self):
+        game_state = GameState({}, {})
+        game_state.set_gamestate(gamestate_frame(1, example_gamestate()))
+        current_list = game_state.currentList
+        gamestate = json.loads(example_gamestate())
+        gamestate["round"] = 7
+        gamestate["currentList"][1]["monsterInstances"][0]["conditions"] = ["x"]
+        with self.assertRaises(FrameError):
+            game_state.set_gamestate(gamestate_frame(2, json.dumps(gamestate).encode()))
+        self.assertEqual(game_state.index, 1)
+        self.assertEqual(game_state.round, 1)
+        self.assertIs(game_state.currentList, current_list)
+
+
+class TestQuarantine(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "quarantine.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_file_is_bounded(self):
+        quarantine = Quarantine(self.path, max_bytes=1000)
+        for number in range(20):
+            quarantine.add(b"S3nD:%d" % number + b"x" * 100, "Unknown frame")
+        self.assertLessEqual(os.path.getsize(self.path), 1000)
+        self.assertLessEqual(os.path.getsize(self.path + ".1"), 1000)
+        with open(self.path) as file:
+            last = json.loads(file.readlines()[-1])
+        self.assertEqual(last["reason"], "Unknown frame")
+        self.assertTrue(last["frame"].startswith("S3nD:19"))
+
+    def test_client_network_keeps_last_good_state(self):
+        server = StandInServer()
+        game_state = GameState({}, {})
+        client_network = ClientNetwork(game_state, port=server.port)
+        client_network.start_quarantine(self.path)
+        client_network.connect()
+        try:
+            time.sleep(0.1)
+            for frame in (
+                gamestate_frame(1, example_gamestate()),
+                b"S3nD:Index:xDescription:GameState:{}[EOM]",
+                b"S3nD:hello[EOM]",
+            ):
+                server.broadcast(frame)
+                time.sleep(0.1)
+            server.broadcast(gamestate_frame(2, example_gamestate()[:100]))
+            deadline = time.monotonic() + 5
+            while client_network.frames_rejected < 3 and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            client_network.disconnect()
+            server.close()
+
+        self.assertEqual(client_network.frames_accepted, 1)
+        self.assertEqual(client_network.frames_rejected, 3)
+        self.assertEqual(game_state.index, 1)
+        self.assertEqual(len(game_state.currentList), 3)
+        with open(self.path) as file:
+            reasons = [json.loads(line)["reason"] for line in file]
+        self.assertEqual(len(reasons), 3)
+        self.assertIn("Unknown frame", reasons)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import unittest
+
+from standin_server import example_gamestate, gamestate_frame
+from xhaven_core import GameState
+from xhaven_core.warmstart import WarmStart, save
+
+
+class RecordingNetwork:
+    def __init__(self):
+        self.frames = []
+
+    def send_data(self, data):
+        self.frames.append(data)
+
+
+class TestWarmStart(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "warm_start.json")
+
+        saved = GameState({}, {})
+        saved.set_gamestate(gamestate_frame(7, example_gamestate()))
+        save(saved, self.path)
+
+        self.game_state = GameState({}, {})
+        self.network = RecordingNetwork()
+        self.game_state.set_client_network(self.network)
+        self.assertTrue(WarmStart(self.path).restore(self.game_state))
+
+    def health(self):
+        return self.game_state.currentList[2].monster_instances[0].health
+
+    def test_restore(self):
+        self.assertEqual(self.game_state.index, 7)
+        self.assertEqual(self.game_state.warm_index, 7)
+        self.assertEqual(
+            self.game_state.get_monster_info()[2], ("Blood Monstrosity", 2, 8)
+        )
+        self.assertEqual(
+            json.loads(self.game_state.get_gamestate()),
+            json.loads(example_gamestate()),
+        )
+
+    def test_no_usable_snapshot(self):
+        missing = os.path.join(os.path.dirname(self.path), "missing.json")
+        self.assertFalse(WarmStart(missing).restore(GameState({}, {})))
+        with open(self.path, "w") as file:
+            file.write('{"version": 1, "index": 3')
+        self.assertFalse(WarmStart(self.path).restore(GameState({}, {})))
+        with open(self.path, "w") as file:
+            json.dump(
+                {"version": 1, "index": 3, "description": "", "gamestate": "{}"},
+                file,
+            )
+        self.assertFalse(WarmStart(self.path).restore(GameState({}, {})))
+
+    def test_confirmed_without_updates(self):
+        with self.assertNoLogs("xhaven_core.gamestate", "ERROR"):
+            self.game_state.set_gamestate(gamestate_frame(7, example_gamestate()))
+        self.assertIsNone(self.game_state.warm_index)
+        self.assertEqual(self.network.frames, [])
+
+    def test_updates_are_sent_when_the_app_is_at_the_snapshot(self):
+        self.game_state.update_monster(index=2, standee_nr=2, health=-3, relative=True)
+        self.assertEqual(self.network.frames, [])
+
+        self.game_state.set_gamestate(gamestate_frame(7, example_gamestate()))
+        self.assertEqual(self.health(), 5)
+        self.assertIsNone(self.game_state.warm_index)
+        self.assertEqual(len(self.network.frames), 1)
+        self.assertTrue(self.network.frames[0].startswith(b"S3nD:Index:8"))
+
+    def test_updates_are_discarded_when_the_app_moved_on(self):
+        self.game_state.update_monster(index=2, standee_nr=2, health=-3, relative=True)
+        self.game_state.set_gamestate(gamestate_frame(12, example_gamestate()))
+        self.assertEqual(self.game_state.index, 12)
+        self.assertEqual(self.health(), 8)
+        self.assertEqual(self.network.frames, [])
+        self.assertFalse(self.game_state.undo())
+
+    def test_saved_after_changes(self):
+        warm_start = WarmStart(self.path, interval=0.01)
+        warm_start.start(self.game_state)
+        # The restored gamestate is not saved again until the app confirms it
+        self.game_state.update_monster(index=2, standee_nr=2, health=-3, relative=True)
+        self.assertFalse(warm_start.pending)
+
+        self.game_state.set_gamestate(gamestate_frame(7, example_gamestate()))
+        warm_start.stop()
+        with open(self.path) as file:
+            snapshot = json.load(file)
+        self.assertEqual(snapshot["index"], 8)
+        monster = json.loads(snapshot["gamestate"])["currentList"][2]
+        self.assertEqual(monster["monsterInstances"][0]["health"], 5)
+        self.assertFalse(os.path.exists(self.path + ".tmp"))